@@ -0,0 +1,223 @@
+import io
+import struct
+from math import gcd
+
+import numpy as np
+
+from helpers.preprocessing_helpers import VOICE_MAX_INPUT_SECONDS
+
+# Sampling rate expected by the voice encoder
+TARGET_SAMPLING_RATE = 16000
+
+# WAVE format tags
+_WAVE_FORMAT_PCM = 0x0001
+_WAVE_FORMAT_IEEE_FLOAT = 0x0003
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Registered decoders, tried in order: (name, sniffer, decoder)
+_audio_decoders = []
+
+def read_object_bytes(response):
+    """
+    Reads the whole body of a MinIO 'get_object' response and releases its connection.
+
+    The body is read once into a single bytes object; nothing is written to disk.
+
+    Args:
+    - response (urllib3.response.HTTPResponse): The response returned by 'get_object'.
+
+    Returns:
+    - bytes: The object data.
+    """
+    try:
+        return response.read()
+    finally:
+        response.close()
+        response.release_conn()
+
+def register_audio_decoder(name, sniffer, decoder):
+    """
+    Registers a decoder for the audio files recognised by a sniffer.
+
+    Decoders are tried in registration order, so more specific ones must be registered
+    first. The sniffer inspects the leading bytes of the file, never its name.
+
+    Args:
+    - name (str): Name of the format handled by the decoder.
+    - sniffer (callable): Takes the file bytes and returns True if the decoder handles them.
+    - decoder (callable): Takes the file bytes and a maximum duration in seconds (None for no limit),
+      and returns a mono float32 waveform, at most one frame longer than that duration, and its sampling rate.
+    """
+    _audio_decoders.append((name, sniffer, decoder))
+
+def sniff_audio_format(data):
+    """
+    Returns the name of the decoder that handles an audio file, based on its content.
+
+    Args:
+    - data (bytes): The encoded audio file.
+
+    Returns:
+    - str: The format name, or 'generic' if no registered decoder recognises it.
+    """
+    for name, sniffer, _ in _audio_decoders:
+        if sniffer(data):
+            return name
+    return "generic"
+
+def decode_waveform(data, max_seconds=VOICE_MAX_INPUT_SECONDS):
+    """
+    Decodes an in-memory audio file into a mono float32 waveform at 16 kHz.
+
+    The decoder is selected by sniffing the content. Decoding stops one frame past
+    'max_seconds', so overlong recordings are neither fully decoded nor resampled, while
+    'trim_voice_activity' still sees that they exceed the maximum. The waveform is only
+    resampled when the file is not already at the encoder sampling rate.
+
+    Args:
+    - data (bytes): The encoded audio file.
+    - max_seconds (float, optional): Maximum duration decoded, None to decode the whole file.
+
+    Returns:
+    - tuple: The waveform (np.ndarray) and its sampling rate (int).
+    """
+    for _, sniffer, decoder in _audio_decoders:
+        if sniffer(data):
+            wav, sampling_rate = decoder(data, max_seconds)
+            break
+    else:
+        wav, sampling_rate = _decode_generic(data, max_seconds)
+    return resample_waveform(wav, sampling_rate), TARGET_SAMPLING_RATE
+
+def resample_waveform(wav, source_rate, target_rate=TARGET_SAMPLING_RATE):
+    """
+    Resamples a waveform with a polyphase filter, skipping the work if the rates match.
+
+    Args:
+    - wav (np.ndarray): The mono waveform.
+    - source_rate (int): Sampling rate of the waveform.
+    - target_rate (int): Sampling rate wanted.
+
+    Returns:
+    - np.ndarray: The float32 waveform at the target rate.
+    """
+    if source_rate == target_rate:
+        return wav
+    from scipy.signal import resample_poly
+    divisor = gcd(int(source_rate), int(target_rate))
+    resampled = resample_poly(wav, target_rate // divisor, source_rate // divisor)
+    return resampled.astype(np.float32, copy=False)
+
+def _is_wav(data):
+    return data[:4] == b'RIFF' and data[8:12] == b'WAVE'
+
+def _is_mp3(data):
+    # An ID3 tag or an MPEG audio frame header; AAC ADTS headers share the sync word but have layer 0
+    return data[:3] == b'ID3' or (len(data) > 1 and data[0] == 0xFF and data[1] & 0xE0 == 0xE0
+                                  and (data[1] >> 3) & 0x03 != 0x01 and (data[1] >> 1) & 0x03 != 0x00)
+
+def _is_flac(data):
+    return data[:4] == b'fLaC'
+
+def _is_ogg(data):
+    return data[:4] == b'OggS'
+
+def _max_frames(max_seconds, sampling_rate):
+    # One frame past the maximum duration, so overlong inputs are still detected
+    return None if max_seconds is None else int(max_seconds * sampling_rate) + 1
+
+def _decode_wav(data, max_seconds=None):
+    """
+    Decodes a WAV file by parsing its header and viewing the PCM data in place.
+
+    Integer PCM (8, 16, 24 and 32 bits) and IEEE float data are converted with
+    vectorised NumPy operations. Other encodings go through the generic decoder.
+    """
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id, chunk_size = struct.unpack_from('<4sI', data, offset)
+        body = offset + 8
+        if chunk_id == b'fmt ':
+            format_tag, channels, sampling_rate, _, _, bits = struct.unpack_from('<HHIIHH', data, body)
+            if format_tag == _WAVE_FORMAT_EXTENSIBLE and chunk_size >= 26:
+                # The actual format tag opens the sub-format GUID
+                format_tag = struct.unpack_from('<H', data, body + 24)[0]
+            fmt = (format_tag, channels, sampling_rate, bits)
+        elif chunk_id == b'data' and fmt is not None:
+            # Streamed WAVs may carry a placeholder size, never read past the buffer
+            data_size = min(chunk_size, len(data) - body)
+            max_frames = _max_frames(max_seconds, fmt[2])
+            if max_frames is not None and fmt[1] > 0 and fmt[3] >= 8:
+                data_size = min(data_size, max_frames * fmt[1] * (fmt[3] // 8))
+            samples = _pcm_to_float32(data, body, data_size, fmt)
+            if samples is None:
+                break
+            return samples, fmt[2]
+        # Chunks are word aligned
+        offset = body + chunk_size + (chunk_size & 1)
+    return _decode_generic(data, max_seconds)
+
+def _pcm_to_float32(data, offset, size, fmt):
+    format_tag, channels, _, bits = fmt
+    sample_width = bits // 8
+    if channels < 1 or sample_width < 1:
+        return None
+    count = size // sample_width // channels * channels
+    if format_tag == _WAVE_FORMAT_PCM and bits == 16:
+        samples = np.frombuffer(data, dtype='<i2', count=count, offset=offset).astype(np.float32) / 32768.0
+    elif format_tag == _WAVE_FORMAT_PCM and bits == 8:
+        samples = (np.frombuffer(data, dtype=np.uint8, count=count, offset=offset).astype(np.float32) - 128.0) / 128.0
+    elif format_tag == _WAVE_FORMAT_PCM and bits == 24:
+        raw = np.frombuffer(data, dtype=np.uint8, count=count * 3, offset=offset).reshape(-1, 3).astype(np.int32)
+        # Assemble little-endian triplets, then sign-extend from 24 bits
+        samples = ((raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)) << 8 >> 8).astype(np.float32) / 8388608.0
+    elif format_tag == _WAVE_FORMAT_PCM and bits == 32:
+        samples = np.frombuffer(data, dtype='<i4', count=count, offset=offset).astype(np.float32) / 2147483648.0
+    elif format_tag == _WAVE_FORMAT_IEEE_FLOAT and bits == 32:
+        samples = np.frombuffer(data, dtype='<f4', count=count, offset=offset).astype(np.float32)
+    elif format_tag == _WAVE_FORMAT_IEEE_FLOAT and bits == 64:
+        samples = np.frombuffer(data, dtype='<f8', count=count, offset=offset).astype(np.float32)
+    else:
+        return None
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1, dtype=np.float32)
+    return samples
+
+def _decode_compressed(data, max_seconds=None):
+    """
+    Decodes a compressed file (MP3, FLAC, Ogg) block by block, downmixing each block
+    as it is decoded so the multi-channel signal is never held in full. Decoding stops
+    past the maximum duration.
+    """
+    import soundfile
+
+    blocks = []
+    with soundfile.SoundFile(io.BytesIO(data)) as sound_file:
+        sampling_rate = sound_file.samplerate
+        max_frames = _max_frames(max_seconds, sampling_rate)
+        for block in sound_file.blocks(blocksize=65536, dtype='float32', always_2d=True,
+                                       frames=-1 if max_frames is None else max_frames):
+            blocks.append(block.mean(axis=1, dtype=np.float32) if block.shape[1] > 1 else block[:, 0])
+    wav = np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)
+    return wav, sampling_rate
+
+def _decode_generic(data, max_seconds=None):
+    """
+    Decodes any format supported by libsndfile in one call, up to the maximum duration.
+    """
+    import soundfile
+
+    with soundfile.SoundFile(io.BytesIO(data)) as sound_file:
+        max_frames = _max_frames(max_seconds, sound_file.samplerate)
+        wav = sound_file.read(frames=-1 if max_frames is None else max_frames, dtype='float32', always_2d=False)
+        sampling_rate = sound_file.samplerate
+    if wav.ndim > 1:
+        # Downmix multi-channel recordings to mono
+        wav = wav.mean(axis=1, dtype=np.float32)
+    return wav, sampling_rate
+
+register_audio_decoder("wav", _is_wav, _decode_wav)
+register_audio_decoder("mp3", _is_mp3, _decode_compressed)
+register_audio_decoder("flac", _is_flac, _decode_compressed)
+register_audio_decoder("ogg", _is_ogg, _decode_compressed)
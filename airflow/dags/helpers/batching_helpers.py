@@ -0,0 +1,191 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+from helpers.encoder_helpers import get_voice_encoder
+
+# Embedding batching configuration
+EMBEDDING_BATCHING_ENABLED = os.environ.get("EMBEDDING_BATCHING_ENABLED", "false").lower() == "true"
+EMBEDDING_BATCH_MAX_SIZE = int(os.environ.get("EMBEDDING_BATCH_MAX_SIZE", "16"))
+EMBEDDING_BATCH_MAX_WAIT_MS = float(os.environ.get("EMBEDDING_BATCH_MAX_WAIT_MS", "10"))
+
+# Process-wide batcher, guarded by _batcher_lock
+_batcher_lock = threading.Lock()
+_batcher = None
+
+def embed_utterances(encoder, wavs, rate=1.3, min_coverage=0.75):
+    """
+    Embeds several preprocessed waveforms with a single forward pass of the encoder.
+
+    Every utterance is split into the same fixed-size partial mel windows that
+    'VoiceEncoder.embed_utterance' uses (padding the tail the same way), the windows of
+    all utterances are stacked into one batch, and the partial embeddings are averaged
+    back per utterance. The result is identical to embedding each waveform on its own.
+
+    Args:
+    - encoder (resemblyzer.VoiceEncoder): The encoder used to compute the embeddings.
+    - wavs (list[np.ndarray]): Preprocessed 16 kHz waveforms.
+    - rate (float): Partial utterances per second, as in 'embed_utterance'.
+    - min_coverage (float): Minimum coverage of the last partial, as in 'embed_utterance'.
+
+    Returns:
+    - np.ndarray: A (len(wavs), 256) array of L2-normalised embeddings.
+    """
+    import torch
+    from resemblyzer import audio
+
+    mel_windows = []
+    windows_per_utterance = []
+    for wav in wavs:
+        wav_slices, mel_slices = encoder.compute_partial_slices(len(wav), rate, min_coverage)
+        max_wave_length = wav_slices[-1].stop
+        if max_wave_length >= len(wav):
+            wav = np.pad(wav, (0, max_wave_length - len(wav)), "constant")
+        mel = audio.wav_to_mel_spectrogram(wav)
+        mel_windows.extend(mel[s] for s in mel_slices)
+        windows_per_utterance.append(len(mel_slices))
+
+    with torch.no_grad():
+        mels = torch.from_numpy(np.array(mel_windows)).to(encoder.device)
+        partial_embeds = encoder(mels).cpu().numpy()
+
+    boundaries = np.cumsum(windows_per_utterance)[:-1]
+    raw_embeds = np.stack([partials.mean(axis=0) for partials in np.split(partial_embeds, boundaries)])
+    return raw_embeds / np.linalg.norm(raw_embeds, axis=1, keepdims=True)
+
+class EmbeddingBatcher:
+    """
+    Collects waveforms submitted by concurrent callers and embeds them in micro-batches.
+
+    A background thread waits for the first pending waveform, keeps collecting for up
+    to 'max_wait_ms' or until 'max_batch_size' waveforms are pending, runs them through
+    the encoder as one batch and resolves the future of every caller.
+
+    Args:
+    - max_batch_size (int): Maximum number of utterances embedded in one batch.
+    - max_wait_ms (float): Latency budget spent waiting for a batch to fill up.
+    - encoder_provider (callable): Returns the encoder used for the batches.
+    """
+
+    def __init__(self, max_batch_size=EMBEDDING_BATCH_MAX_SIZE, max_wait_ms=EMBEDDING_BATCH_MAX_WAIT_MS, encoder_provider=get_voice_encoder):
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+        self.encoder_provider = encoder_provider
+        self._pending = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._utterances = 0
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, wav):
+        """
+        Queues a preprocessed waveform for embedding.
+
+        Args:
+        - wav (np.ndarray): The preprocessed 16 kHz waveform.
+
+        Returns:
+        - concurrent.futures.Future: Resolves to the L2-normalised embedding.
+        """
+        if self._closed:
+            raise RuntimeError("The embedding batcher is closed")
+        future = Future()
+        self._pending.put((wav, future))
+        return future
+
+    def embed(self, wav, timeout=None):
+        """
+        Embeds a preprocessed waveform, blocking until its batch has been computed.
+
+        Args:
+        - wav (np.ndarray): The preprocessed 16 kHz waveform.
+        - timeout (float, optional): Maximum number of seconds to wait for the result.
+
+        Returns:
+        - np.ndarray: The L2-normalised embedding.
+        """
+        return self.submit(wav).result(timeout=timeout)
+
+    def stats(self):
+        """
+        Returns counters describing the batches computed so far.
+
+        Returns:
+        - dict: Number of batches, utterances and the mean batch size.
+        """
+        with self._stats_lock:
+            mean_batch_size = self._utterances / self._batches if self._batches else 0.0
+            return {
+                "batches": self._batches,
+                "utterances": self._utterances,
+                "mean_batch_size": mean_batch_size
+            }
+
+    def close(self):
+        """
+        Stops accepting waveforms and waits for the pending ones to be embedded.
+        """
+        self._closed = True
+        self._pending.put(None)
+        self._worker.join()
+
+    def _collect_batch(self, first_item):
+        batch = [first_item]
+        deadline = time.monotonic() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._pending.get(timeout=remaining) if remaining > 0 else self._pending.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Keep the shutdown marker for the main loop
+                self._pending.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+            batch = self._collect_batch(item)
+            # Drop the submissions cancelled while they were waiting
+            runnable = [(wav, future) for wav, future in batch if future.set_running_or_notify_cancel()]
+            if not runnable:
+                continue
+            wavs = [wav for wav, _ in runnable]
+            futures = [future for _, future in runnable]
+            try:
+                embeddings = embed_utterances(self.encoder_provider(), wavs)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, embedding in zip(futures, embeddings):
+                future.set_result(embedding)
+            with self._stats_lock:
+                self._batches += 1
+                self._utterances += len(wavs)
+
+def get_embedding_batcher():
+    """
+    Returns the embedding batcher of the current process, starting it on first use.
+
+    The batcher thread does not survive a fork, so a process forked from one that
+    already started a batcher gets a fresh one.
+
+    Returns:
+    - EmbeddingBatcher: The process-wide embedding batcher.
+    """
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None or not _batcher._worker.is_alive():
+            _batcher = EmbeddingBatcher()
+        return _batcher
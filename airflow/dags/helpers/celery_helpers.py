@@ -0,0 +1,15 @@
+from celery.signals import worker_process_init
+from helpers.encoder_helpers import preload_voice_encoder
+
+try:
+    from airflow.providers.celery.executors.default_celery import DEFAULT_CELERY_CONFIG
+except ImportError:
+    from airflow.config_templates.default_celery import DEFAULT_CELERY_CONFIG
+
+# Celery configuration used by the Airflow workers ([celery] celery_config_options).
+# It keeps Airflow's defaults and only hooks the worker process initialisation.
+CELERY_CONFIG = dict(DEFAULT_CELERY_CONFIG)
+
+# Load the voice encoder once in every Celery pool process so the tasks forked
+# from it start with warm model weights.
+worker_process_init.connect(preload_voice_encoder, weak=False)
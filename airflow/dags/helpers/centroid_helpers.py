@@ -0,0 +1,49 @@
+import os
+
+import numpy as np
+
+# Multi-sample enrollment configuration
+QDRANT_SAMPLES_COLLECTION = os.environ.get("QDRANT_SAMPLES_COLLECTION") or None
+ENROLLMENT_MAX_SAMPLES = int(os.environ.get("ENROLLMENT_MAX_SAMPLES", "10"))
+
+def compute_centroid(embeddings):
+    """
+    Compacts the embeddings of several samples of a voice into a single centroid.
+
+    The centroid is the L2-normalised mean of the sample embeddings. The norm of the mean
+    and the number of samples are returned with it, so that the mean can be rebuilt and
+    updated later without the sample embeddings.
+
+    Args:
+    - embeddings (np.ndarray): A (samples, dimension) array of L2-normalised embeddings.
+
+    Returns:
+    - tuple: The centroid, the norm of the mean and the number of samples.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, np.shape(embeddings)[-1])
+    mean = embeddings.mean(axis=0)
+    mean_norm = float(np.linalg.norm(mean))
+    return mean / mean_norm, mean_norm, len(embeddings)
+
+def update_centroid(centroid, mean_norm, sample_count, embeddings):
+    """
+    Adds the embeddings of new samples to an existing centroid.
+
+    The previous mean is rebuilt as 'centroid * mean_norm', weighted by its number of
+    samples and merged with the new embeddings, so the result equals the centroid of all
+    the samples without embedding the previous ones again.
+
+    Args:
+    - centroid (np.ndarray): The stored centroid.
+    - mean_norm (float): The norm of the mean the centroid was normalised from.
+    - sample_count (int): Number of samples of the stored centroid.
+    - embeddings (np.ndarray): A (samples, dimension) array of the new embeddings.
+
+    Returns:
+    - tuple: The updated centroid, the norm of its mean and the total number of samples.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, len(centroid))
+    total = sample_count + len(embeddings)
+    mean = (np.asarray(centroid, dtype=np.float32) * mean_norm * sample_count + embeddings.sum(axis=0)) / total
+    mean_norm = float(np.linalg.norm(mean))
+    return mean / mean_norm, mean_norm, total
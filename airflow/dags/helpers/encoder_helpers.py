@@ -0,0 +1,100 @@
+import hashlib
+import importlib.util
+import os
+import threading
+from importlib import metadata
+from pathlib import Path
+
+# Voice encoder configuration
+VOICE_ENCODER_DEVICE = os.environ.get("VOICE_ENCODER_DEVICE") or None
+VOICE_ENCODER_EAGER_LOAD = os.environ.get("VOICE_ENCODER_EAGER_LOAD", "true").lower() == "true"
+
+# Process-resident encoder state, guarded by _encoder_lock
+_encoder_lock = threading.Lock()
+_encoder = None
+_encoder_model_version = None
+
+def get_voice_encoder():
+    """
+    Returns the VoiceEncoder owned by the current process, loading it on first use.
+
+    The model weights are loaded once per worker process and shared by every task
+    that runs in it, including tasks forked from a process that already loaded them.
+    Loading is guarded by a lock so concurrent callers never build more than one
+    encoder.
+
+    Returns:
+    - resemblyzer.VoiceEncoder: The process-resident voice encoder.
+    """
+    global _encoder
+    encoder = _encoder
+    if encoder is not None:
+        return encoder
+    with _encoder_lock:
+        if _encoder is None:
+            from resemblyzer import VoiceEncoder
+            _encoder = VoiceEncoder(device=VOICE_ENCODER_DEVICE, verbose=False)
+        return _encoder
+
+def get_encoder_model_version():
+    """
+    Returns the identifier of the encoder model served by this process.
+
+    The version combines the Resemblyzer package version with a short digest of the
+    pretrained weights, so any change to the model yields a different identifier. It
+    is computed from the weights file, without loading the model.
+
+    Returns:
+    - str: The model version, e.g. 'resemblyzer-0.1.4-1a2b3c4d5e6f'.
+    """
+    global _encoder_model_version
+    if _encoder_model_version is None:
+        with _encoder_lock:
+            if _encoder_model_version is None:
+                _encoder_model_version = _compute_model_version()
+    return _encoder_model_version
+
+def is_voice_encoder_loaded():
+    """
+    Tells whether the current process already holds a loaded encoder.
+
+    Returns:
+    - bool: True if the encoder is loaded in this process.
+    """
+    return _encoder is not None
+
+def preload_voice_encoder(**kwargs):
+    """
+    Eagerly loads the encoder when eager loading is enabled.
+
+    Intended to be connected to the Celery 'worker_process_init' signal. Airflow runs
+    each task in a fork of the Celery pool process, so weights loaded here are
+    inherited by every task instead of being reloaded per task. No inference is run
+    at this point, which keeps torch thread pools from being started before the fork.
+
+    Args:
+    - **kwargs: Signal arguments, ignored.
+    """
+    if VOICE_ENCODER_EAGER_LOAD:
+        get_voice_encoder()
+        get_encoder_model_version()
+
+def _compute_model_version():
+    """
+    Builds the model version identifier from the package version and weights digest.
+
+    Returns:
+    - str: The model version identifier.
+    """
+    try:
+        package_version = metadata.version("Resemblyzer")
+    except metadata.PackageNotFoundError:
+        package_version = "unknown"
+    # Locate the package without importing it, which would pull in torch
+    package_spec = importlib.util.find_spec("resemblyzer")
+    weights_path = Path(package_spec.origin).resolve().parent.joinpath("pretrained.pt")
+    digest = hashlib.sha256()
+    with open(weights_path, 'rb') as weights_file:
+        for chunk in iter(lambda: weights_file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return f"resemblyzer-{package_version}-{digest.hexdigest()[:12]}"
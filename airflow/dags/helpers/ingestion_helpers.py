@@ -0,0 +1,211 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from qdrant_client.http import models
+
+# Batched upsert configuration
+QDRANT_UPSERT_BATCHING_ENABLED = os.environ.get("QDRANT_UPSERT_BATCHING_ENABLED", "false").lower() == "true"
+QDRANT_UPSERT_BATCH_MAX_SIZE = int(os.environ.get("QDRANT_UPSERT_BATCH_MAX_SIZE", "256"))
+QDRANT_UPSERT_BATCH_MAX_WAIT_MS = float(os.environ.get("QDRANT_UPSERT_BATCH_MAX_WAIT_MS", "50"))
+QDRANT_UPSERT_CONFIRM_TIMEOUT_SECONDS = float(os.environ.get("QDRANT_UPSERT_CONFIRM_TIMEOUT_SECONDS", "30"))
+
+# Process-wide point batchers by collection, guarded by _batchers_lock
+_batchers_lock = threading.Lock()
+_batchers = {}
+
+class QdrantPointBatcher:
+    """
+    Collects voice points submitted by concurrent callers and upserts them into QDrant in bulk.
+
+    A sender thread waits for the first pending point, keeps collecting for up to
+    'max_wait_ms' or until 'max_batch_size' points are pending, and sends them as one
+    upsert with wait=False, so the next batch is sent while QDrant applies this one.
+    A confirmer thread then reads the points back until every one of them is stored
+    with its payload. Points of a batch that fails, or that are not confirmed within
+    'confirm_timeout_seconds', are upserted again one by one with wait=True, so a bad
+    point only fails its own caller.
+
+    Args:
+    - client (QdrantClient): The client used for the upserts.
+    - collection_name (str): The collection the points are upserted into.
+    - max_batch_size (int): Maximum number of points sent in one upsert.
+    - max_wait_ms (float): Latency budget spent waiting for a batch to fill up.
+    - confirm_timeout_seconds (float): Time given to QDrant to apply a batch.
+    """
+
+    def __init__(self, client, collection_name, max_batch_size=QDRANT_UPSERT_BATCH_MAX_SIZE,
+                 max_wait_ms=QDRANT_UPSERT_BATCH_MAX_WAIT_MS, confirm_timeout_seconds=QDRANT_UPSERT_CONFIRM_TIMEOUT_SECONDS):
+        self.client = client
+        self.collection_name = collection_name
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+        self.confirm_timeout_seconds = float(confirm_timeout_seconds)
+        self._pending = queue.Queue()
+        self._unconfirmed = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._stats = {"batches": 0, "points": 0, "confirmed": 0, "retried": 0, "failed": 0}
+        self._closed = False
+        self._sender = threading.Thread(target=self._send_batches, name="qdrant-point-sender", daemon=True)
+        self._confirmer = threading.Thread(target=self._confirm_batches, name="qdrant-point-confirmer", daemon=True)
+        self._sender.start()
+        self._confirmer.start()
+
+    def submit(self, point_id, vector, payload=None):
+        """
+        Queues a point for upserting.
+
+        Args:
+        - point_id (str): The ID of the point.
+        - vector (np.ndarray): The embedding stored in the point.
+        - payload (dict, optional): The payload stored in the point.
+
+        Returns:
+        - concurrent.futures.Future: Resolves to the point ID once the point is confirmed.
+        """
+        if self._closed:
+            raise RuntimeError("The point batcher is closed")
+        future = Future()
+        point = models.PointStruct(id=point_id, vector=[float(value) for value in vector], payload=payload or {})
+        self._pending.put((point, future))
+        return future
+
+    def upsert(self, point_id, vector, payload=None, timeout=None):
+        """
+        Upserts a point, blocking until it is confirmed.
+
+        Args:
+        - point_id (str): The ID of the point.
+        - vector (np.ndarray): The embedding stored in the point.
+        - payload (dict, optional): The payload stored in the point.
+        - timeout (float, optional): Maximum number of seconds to wait for the confirmation.
+
+        Returns:
+        - str: The ID of the point.
+        """
+        return self.submit(point_id, vector, payload).result(timeout=timeout)
+
+    def stats(self):
+        """
+        Returns counters describing the points upserted so far.
+
+        Returns:
+        - dict: Number of batches, points sent, confirmed, retried one by one and failed.
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["mean_batch_size"] = stats["points"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    def close(self):
+        """
+        Stops accepting points and waits for the pending ones to be confirmed.
+        """
+        self._closed = True
+        self._pending.put(None)
+        self._sender.join()
+        self._confirmer.join()
+
+    def _count(self, **increments):
+        with self._stats_lock:
+            for name, increment in increments.items():
+                self._stats[name] += increment
+
+    def _collect_batch(self, first_item):
+        batch = [first_item]
+        deadline = time.monotonic() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._pending.get(timeout=remaining) if remaining > 0 else self._pending.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Keep the shutdown marker for the main loop
+                self._pending.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _send_batches(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                self._unconfirmed.put(None)
+                return
+            # Drop the submissions cancelled while they were waiting
+            batch = [(point, future) for point, future in self._collect_batch(item) if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            self._count(batches=1, points=len(batch))
+            try:
+                self.client.upsert(self.collection_name, [point for point, _ in batch], wait=False)
+            except Exception:
+                self._upsert_one_by_one(batch)
+                continue
+            self._unconfirmed.put((batch, time.monotonic() + self.confirm_timeout_seconds))
+
+    def _confirm_batches(self):
+        while True:
+            item = self._unconfirmed.get()
+            if item is None:
+                return
+            batch, deadline = item
+            delay = 0.01
+            while batch:
+                try:
+                    stored = self.client.retrieve(self.collection_name, [point.id for point, _ in batch],
+                                                  with_payload=True, with_vectors=False)
+                except Exception:
+                    stored = []
+                stored_payloads = {str(record.id): record.payload or {} for record in stored}
+                remaining = []
+                for point, future in batch:
+                    payload = stored_payloads.get(str(point.id))
+                    if payload is not None and all(payload.get(key) == value for key, value in point.payload.items()):
+                        future.set_result(point.id)
+                        self._count(confirmed=1)
+                    else:
+                        remaining.append((point, future))
+                batch = remaining
+                if batch and time.monotonic() >= deadline:
+                    self._upsert_one_by_one(batch)
+                    break
+                if batch:
+                    time.sleep(delay)
+                    delay = min(delay * 2, 0.5)
+
+    def _upsert_one_by_one(self, batch):
+        for point, future in batch:
+            self._count(retried=1)
+            try:
+                self.client.upsert(self.collection_name, [point], wait=True)
+            except Exception as e:
+                self._count(failed=1)
+                future.set_exception(e)
+                continue
+            self._count(confirmed=1)
+            future.set_result(point.id)
+
+def get_point_batcher(client, collection_name):
+    """
+    Returns the point batcher of the current process for a collection, starting it on first use.
+
+    The batcher threads do not survive a fork, so a process forked from one that already
+    started a batcher gets a fresh one.
+
+    Args:
+    - client (QdrantClient): The client used for the upserts.
+    - collection_name (str): The collection the points are upserted into.
+
+    Returns:
+    - QdrantPointBatcher: The process-wide point batcher of the collection.
+    """
+    with _batchers_lock:
+        batcher = _batchers.get(collection_name)
+        if batcher is None or not batcher._sender.is_alive():
+            batcher = QdrantPointBatcher(client, collection_name)
+            _batchers[collection_name] = batcher
+        return batcher
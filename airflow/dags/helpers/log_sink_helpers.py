@@ -0,0 +1,227 @@
+import atexit
+import os
+import threading
+import time
+from collections import deque
+
+from pymongo import MongoClient
+from helpers.mongodb_helpers import MONGO_LOGS_COLLECTION
+
+# DAG log sink configuration
+DAG_LOG_MIN_LEVEL = os.environ.get("DAG_LOG_MIN_LEVEL", "INFO").upper()
+DAG_LOG_BUFFER_SIZE = int(os.environ.get("DAG_LOG_BUFFER_SIZE", "10000"))
+DAG_LOG_FLUSH_BATCH_SIZE = int(os.environ.get("DAG_LOG_FLUSH_BATCH_SIZE", "200"))
+DAG_LOG_FLUSH_INTERVAL_MS = float(os.environ.get("DAG_LOG_FLUSH_INTERVAL_MS", "1000"))
+DAG_LOG_FLUSH_TIMEOUT_SECONDS = float(os.environ.get("DAG_LOG_FLUSH_TIMEOUT_SECONDS", "5"))
+# Above half of the buffer only one in this many records below WARNING is kept
+DAG_LOG_PRESSURE_SAMPLING = int(os.environ.get("DAG_LOG_PRESSURE_SAMPLING", "10"))
+
+LOG_LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "WARN": 30, "ERROR": 40, "CRITICAL": 50}
+
+# Process-wide sinks, guarded by _sinks_lock
+_sinks_lock = threading.Lock()
+_sinks = {}
+# Whether operators wait for their records when 'execute' ends, see set_flush_after_execute
+_flush_after_execute = True
+
+def get_log_level(level_name):
+    """
+    Returns the numeric value of a log level name, INFO for unknown names.
+    """
+    return LOG_LEVELS.get(str(level_name).upper(), LOG_LEVELS["INFO"])
+
+class MongoLogSink:
+    """
+    Buffers the log records of the operators in memory and writes them to MongoDB in batches.
+
+    Records below 'min_level' are discarded on arrival. The others are queued and a
+    background thread writes them with 'insert_many' once 'flush_batch_size' records are
+    pending or 'flush_interval_ms' has elapsed. When more than half of the buffer is
+    used only one in 'pressure_sampling' records below WARNING is kept, and when it is
+    full those records are dropped; warnings and errors are always queued. Records at
+    ERROR or above are written before 'emit' returns, so they are stored even if the
+    task process exits right after logging them.
+
+    Args:
+    - mongo_uri (str): The URI for the MongoDB connection.
+    - mongo_db (str): The name of the MongoDB database.
+    - collection_name (str): The name of the logs collection.
+    - min_level (str): Minimum level of the records stored.
+    - buffer_size (int): Maximum number of records waiting to be written.
+    - flush_batch_size (int): Number of records written by a single insert.
+    - flush_interval_ms (float): Maximum time a record waits before being written.
+    - pressure_sampling (int): One in this many low level records is kept under pressure.
+    """
+
+    def __init__(self, mongo_uri, mongo_db, collection_name=MONGO_LOGS_COLLECTION, min_level=DAG_LOG_MIN_LEVEL,
+                 buffer_size=DAG_LOG_BUFFER_SIZE, flush_batch_size=DAG_LOG_FLUSH_BATCH_SIZE,
+                 flush_interval_ms=DAG_LOG_FLUSH_INTERVAL_MS, pressure_sampling=DAG_LOG_PRESSURE_SAMPLING):
+        self.collection = MongoClient(mongo_uri, connect=False)[mongo_db][collection_name]
+        self.min_level = get_log_level(min_level)
+        self.buffer_size = max(1, int(buffer_size))
+        self.flush_batch_size = max(1, int(flush_batch_size))
+        self.flush_interval_ms = max(0.0, float(flush_interval_ms))
+        self.pressure_sampling = max(1, int(pressure_sampling))
+        self._records = deque()
+        self._condition = threading.Condition()
+        # Records queued and records written (or failed) so far, to wait for flushes
+        self._queued = 0
+        self._done = 0
+        self._flush_requested = False
+        self._sampled = 0
+        self._stats = {"written": 0, "filtered": 0, "sampled_out": 0, "dropped": 0, "failed": 0, "inserts": 0}
+        self._worker = threading.Thread(target=self._run, name="mongo-log-sink", daemon=True)
+        self._worker.start()
+
+    def emit(self, record):
+        """
+        Queues a log record.
+
+        Args:
+        - record (dict): The log document, with its level name in 'log_level'.
+
+        Returns:
+        - bool: Whether the record was queued.
+        """
+        level = get_log_level(record.get("log_level"))
+        with self._condition:
+            if level < self.min_level:
+                self._stats["filtered"] += 1
+                return False
+            if level < LOG_LEVELS["WARNING"]:
+                if len(self._records) >= self.buffer_size:
+                    self._stats["dropped"] += 1
+                    return False
+                if len(self._records) >= self.buffer_size // 2:
+                    self._sampled += 1
+                    if self._sampled % self.pressure_sampling:
+                        self._stats["sampled_out"] += 1
+                        return False
+            self._records.append(record)
+            self._queued += 1
+            # Wake up the writer to start the flush interval, or to write a full batch
+            if len(self._records) == 1 or len(self._records) >= self.flush_batch_size:
+                self._condition.notify_all()
+        if level >= LOG_LEVELS["ERROR"]:
+            self.flush()
+        return True
+
+    def flush(self, timeout=DAG_LOG_FLUSH_TIMEOUT_SECONDS):
+        """
+        Writes the queued records, waiting until they are stored.
+
+        Args:
+        - timeout (float): Maximum number of seconds to wait.
+
+        Returns:
+        - bool: Whether every record queued before the call was written.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            target = self._queued
+            self._flush_requested = True
+            self._condition.notify_all()
+            while self._done < target:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._worker.is_alive():
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+    def stats(self):
+        """
+        Returns counters describing the records handled by the sink.
+
+        Returns:
+        - dict: Records written, filtered by level, sampled out, dropped and failed, plus the pending ones.
+        """
+        with self._condition:
+            return {**self._stats, "pending": len(self._records)}
+
+    def _take_batch(self):
+        with self._condition:
+            deadline = time.monotonic() + self.flush_interval_ms / 1000.0
+            while len(self._records) < self.flush_batch_size and not self._flush_requested:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 and self._records:
+                    break
+                # Nothing to write yet, the interval restarts with the next record
+                self._condition.wait(remaining if remaining > 0 else None)
+                if remaining <= 0:
+                    deadline = time.monotonic() + self.flush_interval_ms / 1000.0
+            batch = [self._records.popleft() for _ in range(min(self.flush_batch_size, len(self._records)))]
+            if not self._records:
+                self._flush_requested = False
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                continue
+            try:
+                self.collection.insert_many(batch, ordered=False)
+                written, failed = len(batch), 0
+            except Exception as e:
+                print(f"Error writing {len(batch)} log messages to MongoDB: {e}")
+                written, failed = 0, len(batch)
+            with self._condition:
+                self._stats["inserts"] += 1
+                self._stats["written"] += written
+                self._stats["failed"] += failed
+                self._done += len(batch)
+                self._condition.notify_all()
+
+def get_log_sink(mongo_uri, mongo_db):
+    """
+    Returns the log sink of the current process for the given database, starting it on first use.
+
+    The sink thread does not survive a fork, so a process forked from one that already
+    started a sink gets a fresh one.
+
+    Args:
+    - mongo_uri (str): The URI for the MongoDB connection.
+    - mongo_db (str): The name of the MongoDB database.
+
+    Returns:
+    - MongoLogSink: The process-wide log sink.
+    """
+    key = (os.getpid(), mongo_uri, mongo_db)
+    with _sinks_lock:
+        sink = _sinks.get(key)
+        if sink is None or not sink._worker.is_alive():
+            sink = MongoLogSink(mongo_uri, mongo_db)
+            _sinks[key] = sink
+        return sink
+
+def flush_log_sinks(timeout=DAG_LOG_FLUSH_TIMEOUT_SECONDS):
+    """
+    Writes the records queued in the log sinks of the current process.
+    """
+    with _sinks_lock:
+        sinks = [sink for (pid, _, _), sink in _sinks.items() if pid == os.getpid()]
+    for sink in sinks:
+        sink.flush(timeout)
+
+def set_flush_after_execute(enabled):
+    """
+    Sets whether operators wait for their queued records to be written when 'execute' ends.
+
+    A forked Airflow task process may exit right after its task, so it waits for its
+    records; a long-lived process running tasks inline, like the synchronous
+    authentication service, clears it and relies on the sink writer and the exit flush.
+
+    Args:
+    - enabled (bool): Whether to flush after every 'execute'.
+    """
+    global _flush_after_execute
+    _flush_after_execute = bool(enabled)
+
+def flush_after_execute_enabled():
+    """
+    Returns whether operators flush the log sink when 'execute' ends.
+    """
+    return _flush_after_execute
+
+# Long-lived processes, like the synchronous authentication service, flush on exit
+atexit.register(flush_log_sinks)
@@ -0,0 +1,139 @@
+import os
+import threading
+
+import certifi
+import urllib3
+from minio import Minio
+from minio.commonconfig import ENABLED, Filter
+from minio.error import S3Error
+from minio.lifecycleconfig import Expiration, LifecycleConfig, Rule
+
+# MinIO client configuration
+MINIO_MAX_CONNECTIONS = int(os.environ.get("MINIO_MAX_CONNECTIONS", "20"))
+MINIO_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("MINIO_CONNECT_TIMEOUT_SECONDS", "3"))
+MINIO_READ_TIMEOUT_SECONDS = float(os.environ.get("MINIO_READ_TIMEOUT_SECONDS", "30"))
+MINIO_MAX_RETRIES = int(os.environ.get("MINIO_MAX_RETRIES", "3"))
+MINIO_RETRY_BACKOFF_SECONDS = float(os.environ.get("MINIO_RETRY_BACKOFF_SECONDS", "0.2"))
+
+# Process-wide clients and verified buckets, guarded by _clients_lock
+_clients_lock = threading.Lock()
+_clients = {}
+_verified_buckets = set()
+_ensured_lifecycle_rules = set()
+
+def create_minio_http_client():
+    """
+    Creates the connection pool used by the MinIO clients.
+
+    Connections are kept alive and shared by the threads of the process, up to
+    MINIO_MAX_CONNECTIONS per host. Requests failing to connect, or answered with a
+    server error or a throttling response, are retried with exponential backoff.
+
+    Returns:
+    - urllib3.PoolManager: The connection pool.
+    """
+    return urllib3.PoolManager(
+        num_pools=4,
+        maxsize=MINIO_MAX_CONNECTIONS,
+        block=False,
+        timeout=urllib3.Timeout(connect=MINIO_CONNECT_TIMEOUT_SECONDS, read=MINIO_READ_TIMEOUT_SECONDS),
+        cert_reqs="CERT_REQUIRED",
+        ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+        retries=urllib3.Retry(
+            total=MINIO_MAX_RETRIES,
+            backoff_factor=MINIO_RETRY_BACKOFF_SECONDS,
+            status_forcelist=[500, 502, 503, 504]
+        )
+    )
+
+def get_minio_client(endpoint, access_key, secret_key, secure=False):
+    """
+    Returns the MinIO client of this process for the given server and credentials.
+
+    The client and its connection pool are created once per process, so consecutive
+    calls reuse open connections. Clients are never shared with forked processes.
+
+    Args:
+    - endpoint (str): The MinIO server endpoint.
+    - access_key (str): The access key for MinIO.
+    - secret_key (str): The secret key for MinIO.
+    - secure (bool): Whether the server is reached over TLS.
+
+    Returns:
+    - Minio: The client.
+    """
+    key = (os.getpid(), endpoint, access_key, secure)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = Minio(endpoint, access_key=access_key, secret_key=secret_key, secure=secure,
+                           http_client=create_minio_http_client())
+            _clients[key] = client
+        return client
+
+def ensure_minio_bucket(client, bucket_name):
+    """
+    Creates a bucket if it does not exist yet.
+
+    The existence of each bucket is checked once per process, instead of on every
+    access to the bucket.
+
+    Args:
+    - client (Minio): The MinIO client.
+    - bucket_name (str): The name of the bucket.
+
+    Returns:
+    - bool: Whether the bucket was created by this call.
+    """
+    key = (os.getpid(), id(client), bucket_name)
+    if key in _verified_buckets:
+        return False
+    created = False
+    if not client.bucket_exists(bucket_name):
+        try:
+            client.make_bucket(bucket_name)
+            created = True
+        except S3Error as e:
+            # Created meanwhile by another process
+            if e.code not in ("BucketAlreadyOwnedByYou", "BucketAlreadyExists"):
+                raise
+    with _clients_lock:
+        _verified_buckets.add(key)
+    return created
+
+def ensure_minio_expiration_rule(client, bucket_name, rule_id, prefix, days):
+    """
+    Adds a lifecycle rule expiring the objects under a prefix, keeping the other rules of the bucket.
+
+    The lifecycle configuration of a bucket is replaced as a whole, so the existing
+    rules are read and the one with the same ID, if any, is updated. The rule is
+    checked once per process.
+
+    Args:
+    - client (Minio): The MinIO client.
+    - bucket_name (str): The name of the bucket.
+    - rule_id (str): The ID of the rule.
+    - prefix (str): The prefix of the objects expired.
+    - days (int): Days after which the objects are removed.
+
+    Returns:
+    - bool: Whether the lifecycle configuration was written by this call.
+    """
+    key = (os.getpid(), id(client), bucket_name, rule_id)
+    if key in _ensured_lifecycle_rules:
+        return False
+    lifecycle = client.get_bucket_lifecycle(bucket_name)
+    rules, current = [], None
+    for existing in (lifecycle.rules if lifecycle else []):
+        if existing.rule_id == rule_id:
+            current = existing
+        else:
+            rules.append(existing)
+    written = (current is None or current.rule_filter is None or current.rule_filter.prefix != prefix
+               or current.expiration is None or current.expiration.days != days)
+    if written:
+        rule = Rule(ENABLED, rule_filter=Filter(prefix=prefix), rule_id=rule_id, expiration=Expiration(days=days))
+        client.set_bucket_lifecycle(bucket_name, LifecycleConfig(rules + [rule]))
+    with _clients_lock:
+        _ensured_lifecycle_rules.add(key)
+    return written
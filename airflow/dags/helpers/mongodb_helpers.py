@@ -0,0 +1,145 @@
+import logging
+import os
+import threading
+import time
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from helpers.reembedding_helpers import REEMBEDDING_JOBS_COLLECTION
+
+# MongoDB collections written by the operators
+MONGO_LOGS_COLLECTION = "dags_execution_logs"
+
+# Slow query diagnostics, meant for debugging: queries slower than the threshold are explained
+MONGO_EXPLAIN_SLOW_QUERIES = os.environ.get("MONGO_EXPLAIN_SLOW_QUERIES", "false").lower() == "true"
+MONGO_SLOW_QUERY_MS = float(os.environ.get("MONGO_SLOW_QUERY_MS", "100"))
+
+# Indexes of the users collection. Email and voice ID identify a user, so they are
+# unique; the voice ID one only covers the users whose voice is already stored.
+USERS_INDEXES = [
+    IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    IndexModel([("voice_id", ASCENDING)], name="voice_id_unique", unique=True,
+               partialFilterExpression={"voice_id": {"$type": "string"}}),
+    IndexModel([("fullname", ASCENDING)], name="fullname"),
+    IndexModel([("timestamp", ASCENDING)], name="timestamp")
+]
+
+# Indexes of the execution logs, read per task instance and newest first
+LOGS_INDEXES = [
+    IndexModel([("task_instance_id", ASCENDING), ("timestamp", DESCENDING)], name="task_instance_id_timestamp")
+]
+
+# Indexes of the re-embedding jobs, looked up by alias and status
+REEMBEDDING_JOBS_INDEXES = [
+    IndexModel([("alias", ASCENDING), ("status", ASCENDING)], name="alias_status")
+]
+
+logger = logging.getLogger(__name__)
+
+_ensured_indexes_lock = threading.Lock()
+# Whether the unique email index exists, per process, database and users collection
+_ensured_indexes = {}
+
+def ensure_mongodb_indexes(db, users_collection_name):
+    """
+    Creates the indexes declared for the collections of the operators.
+
+    Index creation is idempotent, and it is only attempted once per process and
+    database, so it can be called before every use of the collections. Each index is
+    created on its own: one that cannot be created, e.g. a unique index over duplicated
+    documents or one conflicting with an existing index of the same name, is reported
+    without blocking the others or failing the caller. Whether the unique email index
+    exists is recorded for has_unique_email_index.
+
+    Args:
+    - db (pymongo.database.Database): The database holding the collections.
+    - users_collection_name (str): The name of the users collection.
+
+    Returns:
+    - bool: Whether the indexes were provisioned by this call.
+    """
+    key = (os.getpid(), db.name, users_collection_name)
+    with _ensured_indexes_lock:
+        if key in _ensured_indexes:
+            return False
+        _ensured_indexes[key] = False
+    for collection_name, indexes in ((users_collection_name, USERS_INDEXES),
+                                     (MONGO_LOGS_COLLECTION, LOGS_INDEXES),
+                                     (REEMBEDDING_JOBS_COLLECTION, REEMBEDDING_JOBS_INDEXES)):
+        for index in indexes:
+            try:
+                db[collection_name].create_indexes([index])
+            except OperationFailure as e:
+                logger.error(f"Could not create the index '{index.document['name']}' of collection '{collection_name}': {e}")
+    email_unique_index = "email_unique" in db[users_collection_name].index_information()
+    if not email_unique_index:
+        logger.error(f"The collection '{users_collection_name}' has no unique email index, duplicated users are only detected by lookups")
+    with _ensured_indexes_lock:
+        _ensured_indexes[key] = email_unique_index
+    return True
+
+def has_unique_email_index(db, users_collection_name):
+    """
+    Tells whether the users collection has its unique email index, checked once per process.
+
+    Args:
+    - db (pymongo.database.Database): The database holding the collections.
+    - users_collection_name (str): The name of the users collection.
+
+    Returns:
+    - bool: True if inserting an existing email is rejected by MongoDB.
+    """
+    ensure_mongodb_indexes(db, users_collection_name)
+    with _ensured_indexes_lock:
+        return _ensured_indexes.get((os.getpid(), db.name, users_collection_name), False)
+
+def find_one_explained(collection, query, projection=None):
+    """
+    Finds a single document, explaining the query when it is slow.
+
+    With MONGO_EXPLAIN_SLOW_QUERIES enabled, a query taking more than MONGO_SLOW_QUERY_MS
+    is run again with explain and its plan summary is logged as a warning.
+
+    Args:
+    - collection (pymongo.collection.Collection): The collection to query.
+    - query (dict): The query filter.
+    - projection (dict, optional): The fields to return.
+
+    Returns:
+    - dict or None: The document found, or None.
+    """
+    if not MONGO_EXPLAIN_SLOW_QUERIES:
+        return collection.find_one(query, projection)
+    start_time = time.perf_counter()
+    document = collection.find_one(query, projection)
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+    if elapsed_ms >= MONGO_SLOW_QUERY_MS:
+        explain = collection.find(query, projection).limit(1).explain()
+        logger.warning(f"Slow query on '{collection.name}' ({elapsed_ms:.1f} ms) {query}: {summarize_query_plan(explain)}")
+    return document
+
+def summarize_query_plan(explain):
+    """
+    Summarizes the output of an explain command.
+
+    Args:
+    - explain (dict): The explain output of a find query.
+
+    Returns:
+    - dict: The stages and index of the winning plan, and the keys and documents examined.
+    """
+    plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+    plan = plan.get("queryPlan", plan)
+    stages, index_name = [], None
+    while plan:
+        stages.append(plan.get("stage"))
+        index_name = index_name or plan.get("indexName")
+        plan = plan.get("inputStage")
+    execution_stats = explain.get("executionStats", {})
+    return {
+        "stages": stages,
+        "index": index_name,
+        "keys_examined": execution_stats.get("totalKeysExamined"),
+        "docs_examined": execution_stats.get("totalDocsExamined"),
+        "returned": execution_stats.get("nReturned")
+    }
@@ -0,0 +1,121 @@
+import os
+
+import numpy as np
+
+# Voice preprocessing configuration
+VOICE_MAX_INPUT_SECONDS = float(os.environ.get("VOICE_MAX_INPUT_SECONDS", "180"))
+VOICE_OVERLONG_POLICY = os.environ.get("VOICE_OVERLONG_POLICY", "truncate").lower()
+# Speech window handed to the encoder, 0 to keep every voiced frame. Stored embeddings come
+# from whole recordings, so enabling it requires running voice_reembedding_dag
+VOICE_MAX_EMBED_SECONDS = float(os.environ.get("VOICE_MAX_EMBED_SECONDS", "0"))
+VOICE_VAD_FRAME_MS = float(os.environ.get("VOICE_VAD_FRAME_MS", "30"))
+VOICE_VAD_RELATIVE_THRESHOLD_DB = float(os.environ.get("VOICE_VAD_RELATIVE_THRESHOLD_DB", "-40"))
+VOICE_VAD_ABSOLUTE_THRESHOLD_DB = float(os.environ.get("VOICE_VAD_ABSOLUTE_THRESHOLD_DB", "-60"))
+VOICE_VAD_HANGOVER_FRAMES = int(os.environ.get("VOICE_VAD_HANGOVER_FRAMES", "5"))
+
+class VoiceInputTooLongError(ValueError):
+    """
+    Raised when a recording exceeds the maximum input duration and the policy is 'reject'.
+    """
+
+def get_preprocessing_signature():
+    """
+    Returns a short description of the preprocessing settings.
+
+    Embeddings depend on these settings, so the signature is part of the version that
+    tags cached embeddings.
+
+    Returns:
+    - str: The preprocessing signature.
+    """
+    return (f"vad{VOICE_VAD_FRAME_MS:g}ms{VOICE_VAD_RELATIVE_THRESHOLD_DB:g}db{VOICE_VAD_ABSOLUTE_THRESHOLD_DB:g}db"
+            f"h{VOICE_VAD_HANGOVER_FRAMES}-max{VOICE_MAX_INPUT_SECONDS:g}s{VOICE_OVERLONG_POLICY}-win{VOICE_MAX_EMBED_SECONDS:g}s")
+
+def trim_voice_activity(wav, sampling_rate,
+                        max_input_seconds=VOICE_MAX_INPUT_SECONDS,
+                        overlong_policy=VOICE_OVERLONG_POLICY,
+                        max_embed_seconds=VOICE_MAX_EMBED_SECONDS,
+                        frame_ms=VOICE_VAD_FRAME_MS,
+                        relative_threshold_db=VOICE_VAD_RELATIVE_THRESHOLD_DB,
+                        absolute_threshold_db=VOICE_VAD_ABSOLUTE_THRESHOLD_DB,
+                        hangover_frames=VOICE_VAD_HANGOVER_FRAMES):
+    """
+    Caps the duration of a waveform and keeps only its speech-dense part.
+
+    Recordings longer than 'max_input_seconds' are truncated or rejected. The rest is
+    split into fixed-size frames whose energy is computed in one vectorised pass;
+    frames louder than both the relative threshold (below the loudest frame) and the
+    absolute threshold are voiced, widened by a few hangover frames so word edges are
+    kept. When 'max_embed_seconds' is set, the window of that duration holding the most
+    voiced frames is selected; the silent frames are dropped.
+
+    Args:
+    - wav (np.ndarray): The mono waveform.
+    - sampling_rate (int): Sampling rate of the waveform.
+    - max_input_seconds (float): Maximum accepted input duration.
+    - overlong_policy (str): 'truncate' or 'reject' for inputs longer than the maximum.
+    - max_embed_seconds (float): Duration of the speech window handed to the encoder, 0 for no window.
+    - frame_ms (float): Frame length of the energy detector, in milliseconds.
+    - relative_threshold_db (float): Voicing threshold relative to the loudest frame.
+    - absolute_threshold_db (float): Voicing threshold in dB relative to full scale.
+    - hangover_frames (int): Frames kept on each side of every voiced frame.
+
+    Returns:
+    - tuple: The trimmed waveform (np.ndarray) and a report (dict) with the input,
+      kept and trimmed durations in seconds, whether the input was truncated and
+      whether voiced frames outside the speech window were dropped.
+
+    Raises:
+    - VoiceInputTooLongError: If the input is too long and the policy is 'reject'.
+    """
+    input_samples = len(wav)
+    max_input_samples = int(max_input_seconds * sampling_rate)
+    truncated = input_samples > max_input_samples
+    if truncated:
+        if overlong_policy == "reject":
+            raise VoiceInputTooLongError(
+                f"Voice recording lasts {input_samples / sampling_rate:.1f} s, the maximum is {max_input_seconds:g} s")
+        wav = wav[:max_input_samples]
+
+    frame_length = max(1, int(sampling_rate * frame_ms / 1000))
+    n_frames = len(wav) // frame_length
+    if n_frames == 0:
+        return wav, _build_report(input_samples, len(wav), sampling_rate, truncated)
+    window_frames = n_frames
+    if max_embed_seconds > 0:
+        window_frames = min(n_frames, max(1, int(max_embed_seconds * 1000 / frame_ms)))
+
+    # Frame energy in dBFS, computed for every frame at once
+    frames = wav[:n_frames * frame_length].reshape(n_frames, frame_length)
+    energy_db = 10.0 * np.log10(np.einsum('ij,ij->i', frames, frames) / frame_length + 1e-12)
+    threshold_db = max(energy_db.max() + relative_threshold_db, absolute_threshold_db)
+    voiced = energy_db > threshold_db
+    if not voiced.any():
+        # Nothing above the thresholds: leave the decision to the downstream VAD
+        kept = frames[:window_frames].reshape(-1)
+        return kept, _build_report(input_samples, len(kept), sampling_rate, truncated)
+
+    if hangover_frames > 0:
+        kernel = np.ones(2 * hangover_frames + 1)
+        voiced = np.convolve(voiced, kernel, mode='same') > 0
+
+    # Pick the window holding the most voiced frames
+    voiced_cumsum = np.concatenate(([0], np.cumsum(voiced)))
+    density = voiced_cumsum[window_frames:] - voiced_cumsum[:-window_frames]
+    start = int(np.argmax(density))
+    window = slice(start, start + window_frames)
+
+    kept = frames[window][voiced[window]].reshape(-1)
+    windowed = bool(density[start] < voiced_cumsum[-1])
+    return kept, _build_report(input_samples, len(kept), sampling_rate, truncated, windowed)
+
+def _build_report(input_samples, kept_samples, sampling_rate, truncated, windowed=False):
+    input_seconds = input_samples / sampling_rate
+    kept_seconds = kept_samples / sampling_rate
+    return {
+        "input_seconds": round(input_seconds, 3),
+        "kept_seconds": round(kept_seconds, 3),
+        "trimmed_seconds": round(input_seconds - kept_seconds, 3),
+        "truncated": truncated,
+        "windowed": windowed
+    }
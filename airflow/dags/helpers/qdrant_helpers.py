@@ -0,0 +1,472 @@
+import os
+import threading
+import time
+
+import httpx
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+from qdrant_client.http.exceptions import ResponseHandlingException, UnexpectedResponse
+
+# Client configuration
+QDRANT_PREFER_GRPC = os.environ.get("QDRANT_PREFER_GRPC", "true").lower() == "true"
+QDRANT_GRPC_PORT = int(os.environ.get("QDRANT_GRPC_PORT", "6334"))
+QDRANT_TIMEOUT_SECONDS = int(os.environ.get("QDRANT_TIMEOUT_SECONDS", "5"))
+QDRANT_MAX_RETRIES = int(os.environ.get("QDRANT_MAX_RETRIES", "2"))
+QDRANT_RETRY_BACKOFF_SECONDS = float(os.environ.get("QDRANT_RETRY_BACKOFF_SECONDS", "0.2"))
+QDRANT_MAX_CONNECTIONS = int(os.environ.get("QDRANT_MAX_CONNECTIONS", "20"))
+QDRANT_KEEPALIVE_SECONDS = float(os.environ.get("QDRANT_KEEPALIVE_SECONDS", "60"))
+
+# Voice collection configuration: the operators use an alias, first pointed at the
+# collection of the original deployments, so re-embeddings can swap it atomically
+QDRANT_COLLECTION = os.environ.get("QDRANT_COLLECTION", "user_voice_embeddings")
+QDRANT_COLLECTION_ALIAS = os.environ.get("QDRANT_COLLECTION_ALIAS", "user_voice_embeddings_live")
+QDRANT_VECTOR_SIZE = 256  # Size required for embeddings from resemblyzer
+QDRANT_HNSW_M = int(os.environ.get("QDRANT_HNSW_M", "16"))
+QDRANT_HNSW_EF_CONSTRUCT = int(os.environ.get("QDRANT_HNSW_EF_CONSTRUCT", "100"))
+QDRANT_HNSW_EF = int(os.environ.get("QDRANT_HNSW_EF", "128"))
+QDRANT_ON_DISK_VECTORS = os.environ.get("QDRANT_ON_DISK_VECTORS", "false").lower() == "true"
+QDRANT_QUANTIZATION = os.environ.get("QDRANT_QUANTIZATION", "none").lower()
+QDRANT_QUANTIZATION_QUANTILE = float(os.environ.get("QDRANT_QUANTIZATION_QUANTILE", "0.99"))
+QDRANT_QUANTIZATION_ALWAYS_RAM = os.environ.get("QDRANT_QUANTIZATION_ALWAYS_RAM", "true").lower() == "true"
+QDRANT_QUANTIZATION_RESCORE = os.environ.get("QDRANT_QUANTIZATION_RESCORE", "true").lower() == "true"
+QDRANT_QUANTIZATION_OVERSAMPLING = float(os.environ.get("QDRANT_QUANTIZATION_OVERSAMPLING", "2.0"))
+QDRANT_QUANTIZATION_MODES = ("none", "int8")
+
+# Identity payload of every voice point, indexed so that searches can filter on it
+QDRANT_PAYLOAD_INDEXES = {
+    "user_id": models.PayloadSchemaType.KEYWORD,
+    "enabled": models.PayloadSchemaType.BOOL,
+    "model_version": models.PayloadSchemaType.KEYWORD,
+    "enrolled_at": models.PayloadSchemaType.FLOAT
+}
+
+# Process-wide clients and known collections, guarded by _clients_lock
+_clients_lock = threading.Lock()
+_clients = {}
+_known_collections = set()
+
+class RetryingQdrantClient:
+    """
+    Proxy of a QdrantClient that retries the calls failing with a transient error.
+
+    Connection errors, timeouts, 5xx responses and unavailable gRPC channels are retried
+    with exponential backoff; any other error is raised straight away. Every call the
+    operators make is idempotent (searches, reads and upserts by point ID).
+
+    Args:
+    - client (QdrantClient): The client whose calls are retried.
+    - max_retries (int): Maximum number of retries of a failed call.
+    - backoff_seconds (float): Delay before the first retry, doubled on every retry.
+    """
+
+    def __init__(self, client, max_retries=QDRANT_MAX_RETRIES, backoff_seconds=QDRANT_RETRY_BACKOFF_SECONDS):
+        self.client = client
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+
+    def __getattr__(self, name):
+        attribute = getattr(self.client, name)
+        if not callable(attribute):
+            return attribute
+
+        def call_with_retries(*args, **kwargs):
+            for attempt in range(self.max_retries + 1):
+                try:
+                    return attribute(*args, **kwargs)
+                except Exception as e:
+                    if attempt == self.max_retries or not _is_transient_error(e):
+                        raise
+                    time.sleep(self.backoff_seconds * (2 ** attempt))
+        return call_with_retries
+
+def _is_transient_error(error):
+    if isinstance(error, (ResponseHandlingException, httpx.TransportError)):
+        return True
+    if isinstance(error, UnexpectedResponse):
+        return error.status_code is not None and error.status_code >= 500
+    # gRPC errors expose their status through code(); grpc itself is only imported by the client
+    code = getattr(error, "code", None)
+    if callable(code):
+        return getattr(code(), "name", None) in ("UNAVAILABLE", "DEADLINE_EXCEEDED", "RESOURCE_EXHAUSTED")
+    return False
+
+def get_qdrant_client(url, api_key=None):
+    """
+    Returns the QDrant client of this process for the given server.
+
+    The client is created once per process and server, preferring gRPC and keeping its
+    connections alive, so consecutive calls skip the connection setup. Clients are never
+    shared with forked processes, since gRPC channels are not fork-safe.
+
+    Args:
+    - url (str): The URI of the QDrant server.
+    - api_key (str, optional): The API key for accessing the QDrant server.
+
+    Returns:
+    - RetryingQdrantClient: The client, retrying the calls failing with a transient error.
+    """
+    key = (os.getpid(), url, api_key or None)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = RetryingQdrantClient(QdrantClient(
+                url=url,
+                api_key=api_key or None,
+                prefer_grpc=QDRANT_PREFER_GRPC,
+                grpc_port=QDRANT_GRPC_PORT,
+                timeout=QDRANT_TIMEOUT_SECONDS,
+                limits=httpx.Limits(
+                    max_connections=QDRANT_MAX_CONNECTIONS,
+                    max_keepalive_connections=QDRANT_MAX_CONNECTIONS,
+                    keepalive_expiry=QDRANT_KEEPALIVE_SECONDS
+                )
+            ))
+            _clients[key] = client
+        return client
+
+def ensure_voice_collection(client, collection_name, settings=None):
+    """
+    Creates the voice collection if it does not exist yet.
+
+    The existence of each collection is checked once per process, instead of listing
+    the collections on every write.
+
+    Args:
+    - client (QdrantClient): Initialized QDrant client.
+    - collection_name (str): Name of the collection.
+    - settings (dict, optional): Collection settings, as returned by get_collection_settings.
+
+    Returns:
+    - bool: True if the collection was created.
+    """
+    if collection_name == QDRANT_COLLECTION_ALIAS:
+        return ensure_collection_alias(client, collection_name)
+    key = (os.getpid(), collection_name)
+    if key in _known_collections:
+        return False
+    # The name may also be an alias of a versioned collection
+    collection_names = [collection.name for collection in client.get_collections().collections]
+    created = collection_name not in collection_names and get_alias_target(client, collection_name) is None
+    if created:
+        create_voice_collection(client, collection_name, settings)
+    _known_collections.add(key)
+    return created
+
+def ensure_collection_alias(client, alias_name=QDRANT_COLLECTION_ALIAS, collection_name=QDRANT_COLLECTION):
+    """
+    Creates the alias the operators use if it does not exist yet, pointing at the voice collection.
+
+    The collection is created first when it does not exist either. Nothing is ever
+    deleted: a collection already named as the alias is reported as a configuration
+    error. The alias is checked once per process.
+
+    Args:
+    - client (QdrantClient): Initialized QDrant client.
+    - alias_name (str): Name of the alias.
+    - collection_name (str): Name of the collection the alias first points to.
+
+    Returns:
+    - bool: True if the alias was created.
+    """
+    key = (os.getpid(), alias_name)
+    if key in _known_collections:
+        return False
+    created = get_alias_target(client, alias_name) is None
+    if created:
+        collection_names = [collection.name for collection in client.get_collections().collections]
+        if alias_name in collection_names:
+            raise ValueError(f"QDrant collection {alias_name} uses the name of the alias, QDRANT_COLLECTION_ALIAS must differ from the collection names")
+        if collection_name not in collection_names:
+            create_voice_collection(client, collection_name)
+        try:
+            client.update_collection_aliases(change_aliases_operations=[models.CreateAliasOperation(
+                create_alias=models.CreateAlias(collection_name=collection_name, alias_name=alias_name)
+            )])
+        except Exception:
+            # Another process may have created it meanwhile
+            if get_alias_target(client, alias_name) is None:
+                raise
+            created = False
+    _known_collections.add(key)
+    return created
+
+def get_alias_target(client, alias_name):
+    """
+    Returns the collection an alias points to.
+
+    Args:
+    - client (QdrantClient): Initialized QDrant client.
+    - alias_name (str): Name of the alias.
+
+    Returns:
+    - str: The name of the collection, or None if there is no such alias.
+    """
+    for alias in client.get_aliases().aliases:
+        if alias.alias_name == alias_name:
+            return alias.collection_name
+    return None
+
+def resolve_collection_name(client, collection_name):
+    """
+    Resolves the name used by the operators to the collection actually holding the voices.
+
+    Args:
+    - client (QdrantClient): Initialized QDrant client.
+    - collection_name (str): Name of a collection or of an alias.
+
+    Returns:
+    - str: The collection the alias points to, or the name itself if it is not an alias.
+    """
+    return get_alias_target(client, collection_name) or collection_name
+
+def get_next_collection_version(client, alias_name):
+    """
+    Returns the next version number of the versioned collections behind an alias.
+
+    Versioned collections are named '<alias>_v<version>'.
+
+    Args:
+    - client (QdrantClient): Initialized QDrant client.
+    - alias_name (str): Name of the alias.
+
+    Returns:
+    - int: One more than the highest existing version, 1 if there is none.
+    """
+    prefix = f"{alias_name}_v"
+    versions = [
+        int(collection.name[len(prefix):])
+        for collection in client.get_collections().collections
+        if collection.name.startswith(prefix) and collection.name[len(prefix):].isdigit()
+    ]
+    return max(versions, default=0) + 1
+
+def switch_collection_alias(client, alias_name, collection_name):
+    """
+    Points an alias to another collection.
+
+    When the alias already exists it is dropped and recreated in a single request, which
+    QDrant applies atomically, so searches through the alias never fail. No collection is
+    ever deleted; a collection named as the alias is reported as a configuration error.
+
+    Args:
+    - client (QdrantClient): Initialized QDrant client.
+    - alias_name (str): Name of the alias.
+    - collection_name (str): Name of the collection the alias must point to.
+
+    Returns:
+    - str: The collection the alias pointed to before, or None.
+    """
+    previous = get_alias_target(client, alias_name)
+    operations = []
+    if previous is not None:
+        operations.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias_name)))
+    elif alias_name in [collection.name for collection in client.get_collections().collections]:
+        raise ValueError(f"QDrant collection {alias_name} uses the name of the alias, QDRANT_COLLECTION_ALIAS must differ from the collection names")
+    operations.append(models.CreateAliasOperation(
+        create_alias=models.CreateAlias(collection_name=collection_name, alias_name=alias_name)
+    ))
+    client.update_collection_aliases(change_aliases_operations=operations)
+    return previous
+
+def get_collection_settings(**overrides):
+    """
+    Returns the voice collection settings, as configured through the environment.
+
+    Args:
+    - **overrides: Settings that replace the configured ones (e.g. hnsw_m=32).
+
+    Returns:
+    - dict: The index, storage and search settings of the voice collection.
+    """
+    settings = {
+        "hnsw_m": QDRANT_HNSW_M,
+        "hnsw_ef_construct": QDRANT_HNSW_EF_CONSTRUCT,
+        "hnsw_ef": QDRANT_HNSW_EF,
+        "on_disk_vectors": QDRANT_ON_DISK_VECTORS,
+        "quantization": QDRANT_QUANTIZATION,
+        "quantization_quantile": QDRANT_QUANTIZATION_QUANTILE,
+        "quantization_always_ram": QDRANT_QUANTIZATION_ALWAYS_RAM,
+        "quantization_rescore": QDRANT_QUANTIZATION_RESCORE,
+        "quantization_oversampling": QDRANT_QUANTIZATION_OVERSAMPLING
+    }
+    settings.update(overrides)
+    if settings["quantization"] not in QDRANT_QUANTIZATION_MODES:
+        raise ValueError(f"Unsupported QDrant quantization '{settings['quantization']}', expected one of {QDRANT_QUANTIZATION_MODES}")
+    return settings
+
+def build_hnsw_config(settings=None):
+    """
+    Builds the HNSW index configuration of the voice collection.
+    """
+    settings = settings or get_collection_settings()
+    return models.HnswConfigDiff(m=settings["hnsw_m"], ef_construct=settings["hnsw_ef_construct"])
+
+def build_quantization_config(settings=None):
+    """
+    Builds the quantization configuration of the voice collection.
+
+    Returns:
+    - models.ScalarQuantization: The int8 scalar quantization, or None when quantization is disabled.
+    """
+    settings = settings or get_collection_settings()
+    if settings["quantization"] != "int8":
+        return None
+    return models.ScalarQuantization(
+        scalar=models.ScalarQuantizationConfig(
+            type=models.ScalarType.INT8,
+            quantile=settings["quantization_quantile"],
+            always_ram=settings["quantization_always_ram"]
+        )
+    )
+
+def build_search_params(settings=None, hnsw_ef=None):
+    """
+    Builds the search-time parameters matching the voice collection settings.
+
+    With quantization enabled, the candidates found on the int8 vectors are oversampled
+    and rescored with the original vectors, which keeps the recall of the full vectors.
+
+    Args:
+    - settings (dict, optional): Collection settings, as returned by get_collection_settings.
+    - hnsw_ef (int, optional): Size of the HNSW candidate list, overriding the configured one.
+
+    Returns:
+    - models.SearchParams: The parameters to pass to every search.
+    """
+    settings = settings or get_collection_settings()
+    quantization = None
+    if settings["quantization"] != "none":
+        quantization = models.QuantizationSearchParams(
+            ignore=False,
+            rescore=settings["quantization_rescore"],
+            oversampling=settings["quantization_oversampling"]
+        )
+    return models.SearchParams(hnsw_ef=hnsw_ef or settings["hnsw_ef"], exact=False, quantization=quantization)
+
+def create_voice_collection(client, collection_name, settings=None):
+    """
+    Creates the voice collection with the configured index, storage and quantization settings.
+
+    Args:
+    - client (QdrantClient): Initialized QDrant client.
+    - collection_name (str): Name of the collection to create.
+    - settings (dict, optional): Collection settings, as returned by get_collection_settings.
+    """
+    settings = settings or get_collection_settings()
+    client.create_collection(
+        collection_name,
+        vectors_config=models.VectorParams(
+            size=QDRANT_VECTOR_SIZE,
+            distance=models.Distance.COSINE,
+            on_disk=settings["on_disk_vectors"]
+        ),
+        hnsw_config=build_hnsw_config(settings),
+        quantization_config=build_quantization_config(settings)
+    )
+    ensure_payload_indexes(client, collection_name)
+
+def ensure_payload_indexes(client, collection_name):
+    """
+    Creates the missing payload indexes of the identity fields of the voice collection.
+
+    Args:
+    - client (QdrantClient): Initialized QDrant client.
+    - collection_name (str): Name of the existing collection.
+
+    Returns:
+    - list: The names of the fields whose index was created.
+    """
+    payload_schema = client.get_collection(collection_name).payload_schema or {}
+    created = []
+    for field_name, field_schema in QDRANT_PAYLOAD_INDEXES.items():
+        if field_name not in payload_schema:
+            client.create_payload_index(collection_name, field_name=field_name, field_schema=field_schema, wait=True)
+            created.append(field_name)
+    return created
+
+def build_identity_payload(user_id, enabled=True, model_version=None, enrolled_at=None, sample_count=1, mean_norm=1.0):
+    """
+    Builds the identity payload stored along with a voice embedding.
+
+    Args:
+    - user_id (str): The ID of the user owning the voice.
+    - enabled (bool): Whether the identity can be used to authenticate.
+    - model_version (str, optional): Version of the model that computed the embedding.
+    - enrolled_at (float, optional): Enrollment time as a Unix timestamp, now by default.
+    - sample_count (int): Number of voice samples averaged into the embedding.
+    - mean_norm (float): Norm of the mean of the samples, before normalisation.
+
+    Returns:
+    - dict: The payload of the voice point.
+    """
+    payload = {
+        "user_id": str(user_id),
+        "enabled": bool(enabled),
+        "enrolled_at": float(enrolled_at if enrolled_at is not None else time.time()),
+        "sample_count": int(sample_count),
+        "mean_norm": float(mean_norm)
+    }
+    if model_version:
+        payload["model_version"] = model_version
+    return payload
+
+def get_collection_settings_diff(client, collection_name, settings=None):
+    """
+    Compares the settings of an existing voice collection with the configured ones.
+
+    Args:
+    - client (QdrantClient): Initialized QDrant client.
+    - collection_name (str): Name of the existing collection.
+    - settings (dict, optional): Desired settings, as returned by get_collection_settings.
+
+    Returns:
+    - dict: The settings that differ, mapped to a (current, desired) tuple.
+    """
+    settings = settings or get_collection_settings()
+    config = client.get_collection(collection_name).config
+    quantization_config = config.quantization_config
+    scalar = quantization_config.scalar if isinstance(quantization_config, models.ScalarQuantization) else None
+    current = {
+        "hnsw_m": config.hnsw_config.m,
+        "hnsw_ef_construct": config.hnsw_config.ef_construct,
+        "on_disk_vectors": bool(config.params.vectors.on_disk),
+        "quantization": "int8" if scalar is not None else "none"
+    }
+    if scalar is not None and settings["quantization"] == "int8":
+        current["quantization_quantile"] = scalar.quantile
+        current["quantization_always_ram"] = bool(scalar.always_ram)
+    return {
+        name: (value, settings[name])
+        for name, value in current.items()
+        if value != settings[name]
+    }
+
+def migrate_voice_collection(client, collection_name, settings=None, dry_run=False):
+    """
+    Updates an existing voice collection in place to the configured settings.
+
+    Only the settings that differ are sent. QDrant rebuilds the affected index segments
+    and quantized vectors in the background, and the collection stays searchable meanwhile.
+
+    Args:
+    - client (QdrantClient): Initialized QDrant client.
+    - collection_name (str): Name of the existing collection.
+    - settings (dict, optional): Desired settings, as returned by get_collection_settings.
+    - dry_run (bool): Only compute the differences, without updating the collection.
+
+    Returns:
+    - dict: The settings that differed, mapped to a (current, desired) tuple.
+    """
+    settings = settings or get_collection_settings()
+    diff = get_collection_settings_diff(client, collection_name, settings)
+    if not diff or dry_run:
+        return diff
+    update = {}
+    if "hnsw_m" in diff or "hnsw_ef_construct" in diff:
+        update["hnsw_config"] = build_hnsw_config(settings)
+    if "on_disk_vectors" in diff:
+        update["vectors_config"] = {"": models.VectorParamsDiff(on_disk=settings["on_disk_vectors"])}
+    if diff.keys() & {"quantization", "quantization_quantile", "quantization_always_ram"}:
+        update["quantization_config"] = build_quantization_config(settings) or models.Disabled.DISABLED
+    client.update_collection(collection_name, **update)
+    return diff
@@ -0,0 +1,59 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Re-embedding configuration
+REEMBEDDING_MAX_WORKERS = int(os.environ.get("REEMBEDDING_MAX_WORKERS", str(os.cpu_count() or 1)))
+REEMBEDDING_PAGE_SIZE = int(os.environ.get("REEMBEDDING_PAGE_SIZE", "256"))
+REEMBEDDING_JOBS_COLLECTION = os.environ.get("REEMBEDDING_JOBS_COLLECTION", "reembedding_jobs")
+# Users registered this long before the cut-over are embedded again after it, in case
+# their registration upserted into the previous collection
+REEMBEDDING_CATCHUP_SECONDS = float(os.environ.get("REEMBEDDING_CATCHUP_SECONDS", "600"))
+
+def _init_embedding_worker():
+    # Pool processes run a single embedding at a time, each on its own core
+    import torch
+    torch.set_num_threads(1)
+    from helpers.encoder_helpers import get_voice_encoder
+    get_voice_encoder()
+
+def embed_voice_audio(file_data):
+    """
+    Computes the embedding of an audio file with the encoder of the current process.
+
+    Runs the same decoding, voice activity trimming and preprocessing as the
+    registration DAG, so re-embedded vectors match the ones of new registrations.
+
+    Args:
+    - file_data (bytes): Content of the audio file.
+
+    Returns:
+    - np.ndarray: The embedding of the voice.
+    """
+    from resemblyzer import preprocess_wav
+    from helpers.audio_helpers import decode_waveform
+    from helpers.encoder_helpers import get_voice_encoder
+    from helpers.preprocessing_helpers import trim_voice_activity
+
+    wav, sampling_rate = decode_waveform(file_data)
+    wav, _ = trim_voice_activity(wav, sampling_rate)
+    return get_voice_encoder().embed_utterance(preprocess_wav(wav, source_sr=sampling_rate))
+
+def create_embedding_pool(max_workers=None):
+    """
+    Creates a pool of processes that each load the encoder once and embed audio files.
+
+    The processes are spawned rather than forked, so they do not inherit the torch
+    thread pools or the open connections of the task process.
+
+    Args:
+    - max_workers (int, optional): Number of processes, REEMBEDDING_MAX_WORKERS by default.
+
+    Returns:
+    - ProcessPoolExecutor: The pool; submit 'embed_voice_audio' to it.
+    """
+    return ProcessPoolExecutor(
+        max_workers=max_workers or REEMBEDDING_MAX_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_embedding_worker
+    )
@@ -0,0 +1,237 @@
+import csv
+import json
+import os
+
+import numpy as np
+
+# Snapshot configuration
+VOICE_SNAPSHOT_DIR = os.environ.get("VOICE_SNAPSHOT_DIR", "/usr/local/airflow/data/snapshots")
+VOICE_SNAPSHOT_PAGE_SIZE = int(os.environ.get("VOICE_SNAPSHOT_PAGE_SIZE", "4096"))
+# Voices enrolled in the last seconds are left for the next export, so that points
+# upserted shortly after their enrollment time are never skipped
+VOICE_SNAPSHOT_SETTLE_SECONDS = float(os.environ.get("VOICE_SNAPSHOT_SETTLE_SECONDS", "300"))
+
+# Files of a snapshot and of each of its segments
+SNAPSHOT_MANIFEST_NAME = "manifest.json"
+SEGMENT_VECTORS_NAME = "vectors.npy"
+SEGMENT_INDEX_NAME = "index.csv"
+SEGMENT_CHECKPOINT_NAME = "checkpoint.json"
+SEGMENT_INDEX_COLUMNS = ["voice_id", "user_id", "enabled", "enrolled_at"]
+
+def _write_json(path, document):
+    # Write to a temporary file first so a crash never leaves a truncated document
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as json_file:
+        json.dump(document, json_file)
+    os.replace(temporary_path, path)
+
+def _read_json(path, default=None):
+    if not os.path.exists(path):
+        return default
+    with open(path) as json_file:
+        return json.load(json_file)
+
+def read_snapshot_manifest(directory):
+    """
+    Reads the manifest of a snapshot, listing its completed segments in export order.
+
+    Args:
+    - directory (str): The directory of the snapshot.
+
+    Returns:
+    - dict: The manifest, with an empty segment list if nothing was exported yet.
+    """
+    return _read_json(os.path.join(directory, SNAPSHOT_MANIFEST_NAME), {"segments": []})
+
+def write_snapshot_manifest(directory, manifest):
+    """
+    Atomically replaces the manifest of a snapshot.
+
+    Args:
+    - directory (str): The directory of the snapshot.
+    - manifest (dict): The manifest to write.
+    """
+    _write_json(os.path.join(directory, SNAPSHOT_MANIFEST_NAME), manifest)
+
+class SnapshotSegmentWriter:
+    """
+    Writes the voices of one export run into a segment of a snapshot.
+
+    A segment holds 'vectors.npy', a float32 array of L2-normalised embeddings preallocated
+    for the expected number of voices, and 'index.csv', one row per vector with its voice
+    ID, owner, state and enrollment time. After every page, the vectors are flushed and a
+    checkpoint records the rows written, the size of the index and the scroll offset of the
+    next page, so an interrupted export resumes from its last page.
+
+    Args:
+    - directory (str): The directory of the segment.
+    - capacity (int): Number of voices the segment can hold.
+    - dimension (int): Size of the embeddings.
+    - checkpoint (dict, optional): The checkpoint of the interrupted export to resume.
+    """
+
+    def __init__(self, directory, capacity, dimension, checkpoint=None):
+        self.directory = directory
+        self.checkpoint = checkpoint or {"rows": 0, "index_bytes": 0, "offset": None}
+        os.makedirs(directory, exist_ok=True)
+        vectors_path = os.path.join(directory, SEGMENT_VECTORS_NAME)
+        index_path = os.path.join(directory, SEGMENT_INDEX_NAME)
+        if checkpoint is None:
+            self.vectors = np.lib.format.open_memmap(vectors_path, mode="w+", dtype=np.float32, shape=(capacity, dimension))
+            self.index_file = open(index_path, "w", newline="")
+            csv.writer(self.index_file).writerow(SEGMENT_INDEX_COLUMNS)
+        else:
+            self.vectors = np.load(vectors_path, mmap_mode="r+")
+            # Rows written after the last checkpoint are discarded and exported again
+            self.index_file = open(index_path, "r+", newline="")
+            self.index_file.truncate(self.checkpoint["index_bytes"])
+            self.index_file.seek(self.checkpoint["index_bytes"])
+        self.index_writer = csv.writer(self.index_file)
+
+    @property
+    def rows(self):
+        return self.checkpoint["rows"]
+
+    def write_page(self, points, next_offset, extra=None):
+        """
+        Appends a page of scrolled points and checkpoints the segment.
+
+        Args:
+        - points (list): The points of the page, with their vectors and payloads.
+        - next_offset: The scroll offset of the next page, None after the last page.
+        - extra (dict, optional): Additional fields stored in the checkpoint.
+
+        Returns:
+        - int: The number of rows of the segment.
+        """
+        points = points[:len(self.vectors) - self.rows]
+        if points:
+            page = np.asarray([point.vector for point in points], dtype=np.float32)
+            page /= np.linalg.norm(page, axis=1, keepdims=True)
+            self.vectors[self.rows:self.rows + len(points)] = page
+            self.vectors.flush()
+            for point in points:
+                payload = point.payload or {}
+                self.index_writer.writerow([str(point.id), payload.get("user_id", ""),
+                                            payload.get("enabled", True), payload.get("enrolled_at", "")])
+            self.index_file.flush()
+            os.fsync(self.index_file.fileno())
+        self.checkpoint.update(extra or {})
+        self.checkpoint.update({"rows": self.rows + len(points), "index_bytes": self.index_file.tell(), "offset": next_offset})
+        _write_json(os.path.join(self.directory, SEGMENT_CHECKPOINT_NAME), self.checkpoint)
+        return self.rows
+
+    def close(self):
+        """
+        Closes the segment files and removes its checkpoint, once the export is complete.
+        """
+        self.index_file.close()
+        del self.vectors
+        checkpoint_path = os.path.join(self.directory, SEGMENT_CHECKPOINT_NAME)
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+def read_segment_checkpoint(directory):
+    """
+    Reads the checkpoint of an interrupted segment export.
+
+    Returns:
+    - dict: The checkpoint, or None if the segment is complete or was never started.
+    """
+    return _read_json(os.path.join(directory, SEGMENT_CHECKPOINT_NAME))
+
+class VoiceSnapshot:
+    """
+    Read-only view of the completed segments of a snapshot.
+
+    The vectors of each segment are memory-mapped, so opening a snapshot only loads its
+    index; rows are numbered across segments in export order.
+
+    Args:
+    - directory (str): The directory of the snapshot.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.segments = []
+        self.voice_ids = []
+        self.user_ids = []
+        self.enabled = []
+        for segment in read_snapshot_manifest(directory)["segments"]:
+            segment_directory = os.path.join(directory, segment["name"])
+            vectors = np.load(os.path.join(segment_directory, SEGMENT_VECTORS_NAME), mmap_mode="r")
+            # The vectors file may be larger than the voices exported into it
+            self.segments.append(vectors[:segment["rows"]])
+            with open(os.path.join(segment_directory, SEGMENT_INDEX_NAME), newline="") as index_file:
+                for row in csv.DictReader(index_file):
+                    self.voice_ids.append(row["voice_id"])
+                    self.user_ids.append(row["user_id"])
+                    self.enabled.append(row["enabled"] != "False")
+        self.offsets = np.cumsum([0] + [len(vectors) for vectors in self.segments])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def iter_blocks(self, block_size, start=0):
+        """
+        Iterates over the vectors in blocks that never span two segments.
+
+        Args:
+        - block_size (int): Maximum number of rows per block.
+        - start (int): First row of the iteration.
+
+        Yields:
+        - tuple: The first row of the block and its vectors.
+        """
+        for segment_start, vectors in zip(self.offsets, self.segments):
+            segment_start = int(segment_start)
+            for block_start in range(max(start - segment_start, 0), len(vectors), block_size):
+                yield segment_start + block_start, np.asarray(vectors[block_start:block_start + block_size])
+
+def iter_top_k_neighbours(snapshot, k=10, block_size=2048, min_score=None, query_start=0, exclude_same_user=True):
+    """
+    Streams the k most similar voices of every voice of a snapshot.
+
+    Query blocks are scored against every block of the snapshot with one matrix product,
+    keeping a running top-k per query row, so memory stays bounded by the block size and
+    the full N x N similarity matrix is never built.
+
+    Args:
+    - snapshot (VoiceSnapshot): The snapshot to sweep.
+    - k (int): Number of neighbours returned per voice.
+    - block_size (int): Number of rows per query and key block.
+    - min_score (float, optional): Minimum cosine similarity of the neighbours returned.
+    - query_start (int): First row queried, to sweep only the voices exported since then.
+    - exclude_same_user (bool): Whether the other voices of the same user are skipped.
+
+    Yields:
+    - tuple: The voice ID, the user ID and the list of (voice ID, user ID, score) of its neighbours.
+    """
+    # Users are compared as integer codes so the same-user mask is vectorised
+    _, user_codes = np.unique(np.asarray(snapshot.user_ids, dtype=object).astype(str), return_inverse=True)
+    for query_row, queries in snapshot.iter_blocks(block_size, start=query_start):
+        query_rows = np.arange(query_row, query_row + len(queries))
+        top_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        top_rows = np.zeros((len(queries), k), dtype=np.int64)
+        for key_row, keys in snapshot.iter_blocks(block_size):
+            scores = queries @ keys.T
+            key_rows = np.arange(key_row, key_row + len(keys))
+            scores[query_rows[:, None] == key_rows[None, :]] = -np.inf
+            if exclude_same_user:
+                scores[user_codes[query_rows][:, None] == user_codes[key_rows][None, :]] = -np.inf
+            # Merge the best candidates of this block with the running top-k
+            candidate_scores = np.concatenate([top_scores, scores], axis=1)
+            candidate_rows = np.concatenate([top_rows, np.broadcast_to(key_rows, scores.shape)], axis=1)
+            best = np.argpartition(-candidate_scores, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(candidate_scores, best, axis=1)
+            top_rows = np.take_along_axis(candidate_rows, best, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        top_rows = np.take_along_axis(top_rows, order, axis=1)
+        for offset, row in enumerate(query_rows):
+            neighbours = [
+                (snapshot.voice_ids[neighbour], snapshot.user_ids[neighbour], float(score))
+                for neighbour, score in zip(top_rows[offset], top_scores[offset])
+                if np.isfinite(score) and (min_score is None or score >= min_score)
+            ]
+            yield snapshot.voice_ids[row], snapshot.user_ids[row], neighbours
@@ -0,0 +1,78 @@
+import logging
+import os
+from concurrent.futures import TimeoutError
+from functools import wraps
+import jwt
+from airflow.exceptions import AirflowFailException
+from flask import Flask, request, jsonify
+from helpers.cache_helpers import get_embedding_cache, get_user_metadata_cache
+from helpers.encoder_helpers import preload_voice_encoder
+from helpers.sync_authentication_helpers import authenticate_voice
+
+JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY")
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Synchronous authentication service, run behind the API with:
+# gunicorn -w 2 --threads 8 -b 0.0.0.0:5001 helpers.sync_authentication_app:app
+app = Flask(__name__)
+
+# Load the voice encoder before the first request arrives
+preload_voice_encoder()
+
+def validate_jwt(func):
+    # Same check as the API, for the routes exposing process data
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        jwt_token = request.headers.get('Authorization')
+        if not jwt_token:
+            return jsonify({"error": "JWT token missing."}), 403
+        try:
+            jwt.decode(jwt_token, JWT_SECRET_KEY, algorithms=['HS256'])
+        except jwt.ExpiredSignatureError:
+            return jsonify({"error": "JWT token expired."}), 403
+        except jwt.InvalidTokenError:
+            return jsonify({"error": "Invalid JWT token."}), 403
+        return func(*args, **kwargs)
+    return wrapper
+
+@app.route("/authenticate", methods=['POST'])
+def authenticate():
+    data = request.json or {}
+    voice_file_id = data.get('voice_file_id')
+    if not voice_file_id:
+        return jsonify({"error": "Missing parameter: voice_file_id"}), 400
+    try:
+        claim = {key: data[key] for key in ("claimed", "claimed_user_id", "claimed_voice_id", "claimed_email") if key in data}
+        result = authenticate_voice(voice_file_id, data.get('result_webhook'), claim, data.get('content_hash'))
+    except TimeoutError:
+        logger.error(f"Synchronous authentication of '{voice_file_id}' timed out")
+        return jsonify({"error": "Authentication timed out"}), 504
+    except AirflowFailException as e:
+        # The input was rejected, retrying it cannot succeed
+        logger.error(f"Synchronous authentication of '{voice_file_id}' rejected: {str(e)}")
+        return jsonify({"error": f"Authentication rejected: {str(e)}"}), 422
+    except Exception as e:
+        logger.error(f"Synchronous authentication of '{voice_file_id}' failed: {str(e)}")
+        return jsonify({"error": "Authentication failed"}), 500
+    if result is None:
+        logger.error(f"Synchronous authentication of '{voice_file_id}' was skipped")
+        return jsonify({"error": "Authentication skipped, no result was produced"}), 422
+    return jsonify({"result": result}), 200
+
+@app.route("/health", methods=['GET'])
+def health():
+    return jsonify({"status": "ok"}), 200
+
+@app.route("/stats", methods=['GET'])
+@validate_jwt
+def stats():
+    # Counters of the caches of the process serving the request, which require a valid JWT like the API ones
+    embedding_cache = get_embedding_cache()
+    user_cache = get_user_metadata_cache()
+    return jsonify({
+        "embedding_cache": embedding_cache.stats() if embedding_cache else None,
+        "user_cache": user_cache.stats() if user_cache else None
+    }), 200
@@ -0,0 +1,61 @@
+import importlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from helpers.inline_runner_helpers import run_dag_inline
+
+# Synchronous authentication configuration
+SYNC_AUTHENTICATION_MAX_WORKERS = int(os.environ.get("SYNC_AUTHENTICATION_MAX_WORKERS", "8"))
+SYNC_AUTHENTICATION_TIMEOUT_SECONDS = float(os.environ.get("SYNC_AUTHENTICATION_TIMEOUT_SECONDS", "6"))
+AUTHENTICATION_DAG_MODULE = "voice_authentication_dag"
+WEBHOOK_TASK_ID = "process_result_webhook_task"
+VERIFY_TASK_ID = "verify_voice_id_task"
+
+# Dedicated worker pool and authentication DAG of this process
+_executor = ThreadPoolExecutor(max_workers=SYNC_AUTHENTICATION_MAX_WORKERS, thread_name_prefix="sync-authentication")
+_dag_lock = threading.Lock()
+_dag = None
+
+def authenticate_voice(voice_file_id, result_webhook=None, claim=None, content_hash=None):
+    """
+    Authenticates a voice file synchronously with the operators of the authentication DAG.
+
+    The tasks run on the dedicated worker pool of this process. The result webhook
+    task only runs when a webhook is given, since the result is returned directly.
+    On timeout the run is cancelled before its next task, so it releases its pool
+    thread instead of working on a request already answered.
+
+    Args:
+    - voice_file_id (str): The ID of the voice file stored in MinIO.
+    - result_webhook (str, optional): Webhook that must also receive the result.
+    - claim (dict, optional): The 'claimed' marker with the 'claimed_user_id', 'claimed_voice_id' and 'claimed_email' to verify the voice against.
+    - content_hash (str, optional): The SHA-256 of the voice file, computed while it was uploaded.
+
+    Returns:
+    - dict or None: The authentication result, as sent to the result webhook, or None if the verification was skipped.
+
+    Raises:
+    - concurrent.futures.TimeoutError: If the authentication exceeds the configured timeout.
+    - AirflowFailException: If a task rejects the input, e.g. a recording too long.
+    """
+    conf = {"voice_file_id": voice_file_id, "result_webhook": result_webhook, **(claim or {})}
+    if content_hash:
+        conf["content_hash"] = content_hash
+    skip_task_ids = () if result_webhook else (WEBHOOK_TASK_ID,)
+    cancel_event = threading.Event()
+    future = _executor.submit(run_dag_inline, _get_authentication_dag(), conf, skip_task_ids, cancel_event)
+    try:
+        xcoms = future.result(timeout=SYNC_AUTHENTICATION_TIMEOUT_SECONDS)
+    except TimeoutError:
+        cancel_event.set()
+        raise
+    return (xcoms.get(VERIFY_TASK_ID) or {}).get("result")
+
+def _get_authentication_dag():
+    global _dag
+    with _dag_lock:
+        if _dag is None:
+            # Reuse the DAG definition so both paths share operators and configuration
+            _dag = importlib.import_module(AUTHENTICATION_DAG_MODULE).dag
+        return _dag
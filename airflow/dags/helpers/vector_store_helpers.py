@@ -0,0 +1,384 @@
+import fcntl
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from contextlib import contextmanager
+
+import numpy as np
+from qdrant_client.http import models
+
+from helpers.ingestion_helpers import QDRANT_UPSERT_BATCHING_ENABLED, get_point_batcher
+from helpers.qdrant_helpers import (
+    QDRANT_COLLECTION, QDRANT_COLLECTION_ALIAS, QDRANT_VECTOR_SIZE, build_search_params, ensure_collection_alias,
+    ensure_voice_collection, get_qdrant_client
+)
+
+# Vector store configuration
+VECTOR_STORE_BACKEND = os.environ.get("VECTOR_STORE_BACKEND", "qdrant").lower()
+LOCAL_VECTOR_STORE_DIR = os.environ.get("LOCAL_VECTOR_STORE_DIR", "/usr/local/airflow/data/vector_store")
+VECTOR_STORE_BACKENDS = ("qdrant", "local")
+
+# Process-wide local stores by directory, guarded by _local_stores_lock
+_local_stores_lock = threading.Lock()
+_local_stores = {}
+
+# A stored voice, as returned by searches and lookups
+VectorMatch = namedtuple("VectorMatch", ["id", "score", "payload", "vector"])
+
+class VectorStore(ABC):
+    """
+    Storage and similarity search of voice embeddings, behind which QDrant or the local
+    engine can be used interchangeably by the operators.
+
+    Disabled identities (payload 'enabled' set to False) are never returned by searches.
+    """
+
+    @abstractmethod
+    def ensure_collection(self):
+        """
+        Creates the underlying collection if it does not exist yet.
+        """
+
+    @abstractmethod
+    def upsert(self, point_id, vector, payload):
+        """
+        Stores a voice embedding, replacing the one stored with the same ID.
+
+        Args:
+        - point_id (str): The ID of the voice.
+        - vector (np.ndarray): The embedding.
+        - payload (dict): The identity payload stored with the embedding.
+        """
+
+    def upsert_many(self, points):
+        """
+        Stores several voice embeddings at once.
+
+        Args:
+        - points (list[tuple]): The (point_id, vector, payload) of each voice.
+        """
+        for point_id, vector, payload in points:
+            self.upsert(point_id, vector, payload)
+
+    @abstractmethod
+    def search(self, vector, limit=1, score_threshold=None):
+        """
+        Finds the enabled voices most similar to an embedding, by cosine similarity.
+
+        Args:
+        - vector (np.ndarray): The embedding to search for.
+        - limit (int): Maximum number of voices returned.
+        - score_threshold (float, optional): Minimum similarity of the voices returned.
+
+        Returns:
+        - list[VectorMatch]: The matches, most similar first, without their vectors.
+        """
+
+    @abstractmethod
+    def retrieve(self, point_id):
+        """
+        Fetches a stored voice by ID.
+
+        Returns:
+        - VectorMatch: The voice with its vector and payload, or None if it is not stored.
+        """
+
+    @abstractmethod
+    def update_identity(self, user_id, payload, point_ids=()):
+        """
+        Merges a payload into the voices of a user.
+
+        Args:
+        - user_id (str): The user whose voices, by 'user_id' payload, are updated.
+        - payload (dict): The payload fields to set.
+        - point_ids (iterable): Additional voice IDs to update, for voices stored without payload.
+        """
+
+    @abstractmethod
+    def delete(self, point_id):
+        """
+        Deletes a stored voice.
+        """
+
+class QdrantVectorStore(VectorStore):
+    """
+    Vector store backed by a QDrant collection.
+
+    Args:
+    - client (RetryingQdrantClient): The QDrant client.
+    - collection_name (str): The name of the collection holding the voice embeddings.
+    """
+
+    def __init__(self, client, collection_name):
+        self.client = client
+        self.collection_name = collection_name
+
+    def ensure_collection(self):
+        ensure_voice_collection(self.client, self.collection_name)
+
+    def upsert(self, point_id, vector, payload):
+        if QDRANT_UPSERT_BATCHING_ENABLED:
+            # The process-wide batcher upserts the point along with the concurrent ones
+            # and returns once it is confirmed
+            get_point_batcher(self.client, self.collection_name).upsert(point_id, vector, payload)
+            return
+        self.upsert_many([(point_id, vector, payload)])
+
+    def upsert_many(self, points):
+        self.client.upsert(self.collection_name, [
+            models.PointStruct(id=str(point_id), vector=np.asarray(vector).tolist(), payload=payload)
+            for point_id, vector, payload in points
+        ])
+
+    def search(self, vector, limit=1, score_threshold=None):
+        # Points without an 'enabled' field are kept, so identities stored before the
+        # field existed are still searchable
+        enabled_identities = models.Filter(
+            must_not=[models.FieldCondition(key="enabled", match=models.MatchValue(value=False))]
+        )
+        results = self.client.search(
+            self.collection_name,
+            query_vector=vector,
+            query_filter=enabled_identities,
+            limit=limit,
+            score_threshold=score_threshold,
+            search_params=build_search_params(),
+            with_payload=["user_id"],
+            with_vectors=False
+        )
+        return [VectorMatch(str(result.id), result.score, result.payload or {}, None) for result in results]
+
+    def retrieve(self, point_id):
+        points = self.client.retrieve(self.collection_name, [point_id], with_payload=True, with_vectors=True)
+        if not points:
+            return None
+        return VectorMatch(str(points[0].id), None, points[0].payload or {}, np.asarray(points[0].vector, dtype=np.float32))
+
+    def update_identity(self, user_id, payload, point_ids=()):
+        conditions = [models.FieldCondition(key="user_id", match=models.MatchValue(value=str(user_id)))]
+        if point_ids:
+            conditions.append(models.HasIdCondition(has_id=list(point_ids)))
+        self.client.set_payload(
+            self.collection_name,
+            payload=payload,
+            points=models.FilterSelector(filter=models.Filter(should=conditions)),
+            wait=True
+        )
+
+    def delete(self, point_id):
+        self.client.delete(self.collection_name, points_selector=models.PointIdsList(points=[point_id]), wait=True)
+
+def _checked_norm(vectors, **kwargs):
+    # A zero or non-finite norm has no direction, so its cosine similarity is undefined
+    norms = np.linalg.norm(vectors, **kwargs)
+    if not np.all(np.isfinite(norms) & (norms > 0)):
+        raise ValueError("Embeddings with a zero or non-finite norm cannot be stored or searched")
+    return norms
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process vector store keeping the embeddings in a contiguous float32 matrix memory-mapped from disk.
+
+    The store directory holds 'vectors.f32', the L2-normalised embeddings one row per
+    voice, and 'points.jsonl', an append-only log of upserts, payload updates and
+    deletes. A search is a single matrix-vector product over the mapped rows. Deleted
+    rows are tombstoned and skipped by searches; an upsert of a stored ID rewrites its
+    row in place. Writers from several processes are serialised with a file lock, and
+    every process replays the new log records before reading, so processes sharing the
+    directory see each other's writes.
+
+    Args:
+    - directory (str): The directory holding the store files.
+    - dimension (int): Size of the embeddings.
+    """
+
+    def __init__(self, directory, dimension=QDRANT_VECTOR_SIZE):
+        self.directory = directory
+        self.dimension = dimension
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._log_path = os.path.join(directory, "points.jsonl")
+        self._lock_path = os.path.join(directory, "store.lock")
+        self._lock = threading.RLock()
+        self._ids = []
+        self._rows = {}
+        self._payloads = []
+        self._searchable = np.zeros(0, dtype=bool)
+        self._matrix = None
+        self._log_offset = 0
+
+    def ensure_collection(self):
+        os.makedirs(self.directory, exist_ok=True)
+        for path in (self._vectors_path, self._log_path):
+            if not os.path.exists(path):
+                open(path, "ab").close()
+
+    def upsert(self, point_id, vector, payload):
+        self.upsert_many([(point_id, vector, payload)])
+
+    def upsert_many(self, points):
+        if not points:
+            return
+        vectors = np.asarray([vector for _, vector, _ in points], dtype=np.float32)
+        vectors /= _checked_norm(vectors, axis=1, keepdims=True)
+        row_bytes = self.dimension * 4
+        with self._exclusive():
+            # Stored IDs are rewritten in place, new ones are appended after the last row
+            next_row = len(self._ids)
+            rows = dict(self._rows)
+            records = []
+            for (point_id, _, payload), vector in zip(points, vectors):
+                point_id = str(point_id)
+                row = rows.get(point_id)
+                if row is None:
+                    row, next_row = next_row, next_row + 1
+                    rows[point_id] = row
+                records.append(({"op": "upsert", "id": point_id, "row": row, "payload": payload or {}}, vector))
+            with open(self._vectors_path, "r+b") as vectors_file:
+                # Grow the file by doubling so appends keep a contiguous matrix
+                capacity = os.fstat(vectors_file.fileno()).st_size // row_bytes
+                if next_row > capacity:
+                    vectors_file.truncate(max(next_row, capacity * 2, 1024) * row_bytes)
+                for record, vector in records:
+                    vectors_file.seek(record["row"] * row_bytes)
+                    vectors_file.write(vector.tobytes())
+            # The rows are written before they are logged, so readers never see a partial vector
+            self._append_records([record for record, _ in records])
+
+    def search(self, vector, limit=1, score_threshold=None):
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / _checked_norm(query)
+        with self._lock:
+            self._refresh()
+            count = len(self._ids)
+            if count == 0:
+                return []
+            scores = self._matrix[:count] @ query
+            scores[~self._searchable[:count]] = -np.inf
+            limit = min(limit, count)
+            if limit == 1:
+                top_rows = np.array([int(np.argmax(scores))])
+            else:
+                top_rows = np.argpartition(-scores, limit - 1)[:limit]
+                top_rows = top_rows[np.argsort(-scores[top_rows])]
+            return [
+                VectorMatch(self._ids[row], float(scores[row]), dict(self._payloads[row]), None)
+                for row in top_rows
+                if np.isfinite(scores[row]) and (score_threshold is None or scores[row] >= score_threshold)
+            ]
+
+    def retrieve(self, point_id):
+        with self._lock:
+            self._refresh()
+            row = self._rows.get(str(point_id))
+            if row is None:
+                return None
+            return VectorMatch(self._ids[row], None, dict(self._payloads[row]), np.array(self._matrix[row]))
+
+    def update_identity(self, user_id, payload, point_ids=()):
+        with self._exclusive():
+            ids = {str(point_id) for point_id in point_ids if str(point_id) in self._rows}
+            ids.update(self._ids[row] for row in self._rows.values() if self._payloads[row].get("user_id") == str(user_id))
+            if ids:
+                self._append_records([{"op": "payload", "ids": sorted(ids), "payload": payload}])
+
+    def delete(self, point_id):
+        with self._exclusive():
+            if str(point_id) in self._rows:
+                self._append_records([{"op": "delete", "id": str(point_id)}])
+
+    def stats(self):
+        """
+        Returns the number of rows of the matrix and of searchable voices.
+        """
+        with self._lock:
+            self._refresh()
+            return {"rows": len(self._ids), "voices": len(self._rows), "searchable": int(self._searchable[:len(self._ids)].sum())}
+
+    @contextmanager
+    def _exclusive(self):
+        # Serialise the writers of this process and of every other process sharing the directory
+        with self._lock:
+            self.ensure_collection()
+            with open(self._lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._refresh()
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _append_records(self, records):
+        with open(self._log_path, "a") as log_file:
+            log_file.write("".join(json.dumps(record) + "\n" for record in records))
+        self._refresh()
+
+    def _refresh(self):
+        # Replay the complete records appended since the last refresh, by any process
+        if not os.path.exists(self._log_path):
+            return
+        with open(self._log_path, "rb") as log_file:
+            log_file.seek(self._log_offset)
+            data = log_file.read()
+        complete = data[:data.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            self._apply(json.loads(line))
+        self._log_offset += len(complete)
+        if len(self._ids) and (self._matrix is None or self._matrix.shape[0] < len(self._ids)):
+            rows = os.path.getsize(self._vectors_path) // (self.dimension * 4)
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dimension))
+
+    def _apply(self, record):
+        if record["op"] == "upsert":
+            row = record["row"]
+            if row == len(self._ids):
+                self._ids.append(record["id"])
+                self._payloads.append({})
+                if row >= len(self._searchable):
+                    self._searchable = np.concatenate([self._searchable, np.zeros(max(1024, len(self._searchable)), dtype=bool)])
+            self._rows[record["id"]] = row
+            self._payloads[row] = record["payload"]
+            changed_rows = [row]
+        elif record["op"] == "payload":
+            changed_rows = [self._rows[point_id] for point_id in record["ids"] if point_id in self._rows]
+            for row in changed_rows:
+                self._payloads[row].update(record["payload"])
+        else:
+            # Tombstone: the row stays in the matrix but is never returned again
+            row = self._rows.pop(record["id"], None)
+            if row is not None:
+                self._searchable[row] = False
+            return
+        for row in changed_rows:
+            self._searchable[row] = self._payloads[row].get("enabled") is not False
+
+def get_vector_store(qdrant_uri, qdrant_api_key, collection_name):
+    """
+    Returns the vector store of the voice collection, as selected by VECTOR_STORE_BACKEND.
+
+    Args:
+    - qdrant_uri (str): The URI of the QDrant server, used by the QDrant backend.
+    - qdrant_api_key (str): The API key for accessing the QDrant server.
+    - collection_name (str): The name of the collection holding the voice embeddings.
+
+    Returns:
+    - VectorStore: The QDrant store, or the local store of the collection in LOCAL_VECTOR_STORE_DIR.
+    """
+    if VECTOR_STORE_BACKEND not in VECTOR_STORE_BACKENDS:
+        raise ValueError(f"Unsupported vector store backend '{VECTOR_STORE_BACKEND}', expected one of {VECTOR_STORE_BACKENDS}")
+    if VECTOR_STORE_BACKEND == "qdrant":
+        client = get_qdrant_client(qdrant_uri, qdrant_api_key)
+        if collection_name == QDRANT_COLLECTION_ALIAS:
+            ensure_collection_alias(client, collection_name)
+        return QdrantVectorStore(client, collection_name)
+    # The local engine has no aliases, the alias keeps the directory of the collection it first points to
+    if collection_name == QDRANT_COLLECTION_ALIAS:
+        collection_name = QDRANT_COLLECTION
+    key = (os.getpid(), collection_name)
+    with _local_stores_lock:
+        store = _local_stores.get(key)
+        if store is None:
+            store = LocalVectorStore(os.path.join(LOCAL_VECTOR_STORE_DIR, collection_name))
+            _local_stores[key] = store
+        return store
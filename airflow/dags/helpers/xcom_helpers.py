@@ -0,0 +1,164 @@
+import base64
+import io
+import logging
+import os
+import re
+import uuid
+
+import numpy as np
+from airflow.configuration import conf
+from airflow.models.xcom import BaseXCom
+from helpers.audio_helpers import read_object_bytes
+from helpers.minio_helpers import ensure_minio_expiration_rule, get_minio_client
+
+# Embedding XCom configuration
+XCOM_EMBEDDING_DTYPE = os.environ.get("XCOM_EMBEDDING_DTYPE", "float32").lower()
+XCOM_EMBEDDING_OFFLOAD_BYTES = int(os.environ.get("XCOM_EMBEDDING_OFFLOAD_BYTES", "16384"))
+XCOM_OBJECT_PREFIX = os.environ.get("XCOM_OBJECT_PREFIX", "xcom")
+# Offloaded blobs left behind by 'airflow db clean', which skips the backend, expire after these days
+XCOM_OBJECT_EXPIRATION_DAYS = int(os.environ.get("XCOM_OBJECT_EXPIRATION_DAYS", "7"))
+
+# MinIO configuration for offloaded payloads
+MINIO_ENDPOINT = os.environ.get("MINIO_ENDPOINT")
+MINIO_ACCESS_KEY = os.environ.get("MINIO_ACCESS_KEY")
+MINIO_SECRET_KEY = os.environ.get("MINIO_SECRET_KEY")
+MINIO_BUCKET_NAME = os.environ.get("MINIO_BUCKET_NAME")
+
+# Marker identifying an encoded embedding inside an XCom value
+EMBEDDING_MARKER = "__voice_embedding__"
+
+_WIRE_DTYPES = {"float32": "<f4", "float16": "<f2"}
+
+logger = logging.getLogger(__name__)
+
+def encode_embeddings(value, binary=True, object_name_factory=None):
+    """
+    Replaces every NumPy array of an XCom value by a compact embedding descriptor.
+
+    Arrays are stored as fixed-size little-endian float32 (or float16) blobs. Blobs
+    larger than XCOM_EMBEDDING_OFFLOAD_BYTES are written to MinIO and the descriptor
+    only keeps the object name.
+
+    Args:
+    - value: The XCom value, possibly nesting dicts, lists and arrays.
+    - binary (bool): Keep blobs as bytes (pickled XComs) instead of base64 text (JSON XComs).
+    - object_name_factory (callable, optional): Returns the MinIO object name of an offloaded blob.
+
+    Returns:
+    - The value with its arrays replaced by descriptors.
+    """
+    if isinstance(value, np.ndarray):
+        wire_dtype = _WIRE_DTYPES.get(XCOM_EMBEDDING_DTYPE, "<f4")
+        blob = np.ascontiguousarray(value, dtype=wire_dtype).tobytes()
+        descriptor = {"dtype": wire_dtype, "shape": list(value.shape)}
+        if object_name_factory is not None and len(blob) > XCOM_EMBEDDING_OFFLOAD_BYTES:
+            object_name = object_name_factory()
+            minio_client = _get_minio_client()
+            ensure_minio_expiration_rule(minio_client, MINIO_BUCKET_NAME, "expire-offloaded-xcoms",
+                                         f"{XCOM_OBJECT_PREFIX}/", XCOM_OBJECT_EXPIRATION_DAYS)
+            minio_client.put_object(MINIO_BUCKET_NAME, object_name, io.BytesIO(blob), len(blob),
+                                           content_type="application/octet-stream")
+            descriptor["ref"] = object_name
+        else:
+            descriptor["data"] = blob if binary else base64.b64encode(blob).decode("ascii")
+        return {EMBEDDING_MARKER: descriptor}
+    if isinstance(value, dict):
+        return {k: encode_embeddings(v, binary, object_name_factory) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(encode_embeddings(v, binary, object_name_factory) for v in value)
+    return value
+
+def find_embedding_refs(value):
+    """
+    Returns the MinIO object names of the blobs offloaded by an encoded XCom value.
+
+    Args:
+    - value: The XCom value holding embedding descriptors.
+
+    Returns:
+    - list[str]: The object names.
+    """
+    if isinstance(value, dict):
+        descriptor = value.get(EMBEDDING_MARKER)
+        if isinstance(descriptor, dict) and len(value) == 1:
+            return [descriptor["ref"]] if "ref" in descriptor else []
+        return [ref for v in value.values() for ref in find_embedding_refs(v)]
+    if isinstance(value, (list, tuple)):
+        return [ref for v in value for ref in find_embedding_refs(v)]
+    return []
+
+def decode_embeddings(value, resolve_refs=True):
+    """
+    Restores the NumPy arrays of an XCom value encoded by 'encode_embeddings'.
+
+    Args:
+    - value: The XCom value holding embedding descriptors.
+    - resolve_refs (bool): Fetch offloaded blobs from MinIO. When False, offloaded
+      descriptors are returned untouched.
+
+    Returns:
+    - The value with float32 arrays in place of the descriptors.
+    """
+    if isinstance(value, dict):
+        descriptor = value.get(EMBEDDING_MARKER)
+        if isinstance(descriptor, dict) and len(value) == 1:
+            if "ref" in descriptor:
+                if not resolve_refs:
+                    return value
+                blob = read_object_bytes(_get_minio_client().get_object(MINIO_BUCKET_NAME, descriptor["ref"]))
+            else:
+                blob = descriptor["data"]
+                if isinstance(blob, str):
+                    blob = base64.b64decode(blob)
+            array = np.frombuffer(blob, dtype=descriptor["dtype"]).reshape(descriptor["shape"])
+            return array.astype(np.float32)
+        return {k: decode_embeddings(v, resolve_refs) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(decode_embeddings(v, resolve_refs) for v in value)
+    return value
+
+class EmbeddingXComBackend(BaseXCom):
+    """
+    XCom backend storing voice embeddings as compact binary blobs.
+
+    Values without arrays are stored exactly as with the default backend. Arrays are
+    encoded as little-endian float blobs; large ones are written to MinIO under
+    XCOM_OBJECT_PREFIX so the metadata database only keeps a small pointer. Those
+    blobs are removed when the XCom is cleared or overwritten, and a bucket lifecycle
+    rule expires the ones of XComs deleted without the backend, e.g. by 'airflow db clean'.
+    Configure it with '[core] xcom_backend = helpers.xcom_helpers.EmbeddingXComBackend'.
+    """
+
+    @staticmethod
+    def serialize_value(value, *, key=None, task_id=None, dag_id=None, run_id=None, map_index=None, **kwargs):
+        def object_name_factory():
+            path = "/".join(_safe_path_part(part) for part in (dag_id, run_id, task_id, map_index, key))
+            return f"{XCOM_OBJECT_PREFIX}/{path}/{uuid.uuid4()}.bin"
+
+        binary = conf.getboolean("core", "enable_xcom_pickling")
+        value = encode_embeddings(value, binary=binary, object_name_factory=object_name_factory)
+        return BaseXCom.serialize_value(value, key=key, task_id=task_id, dag_id=dag_id, run_id=run_id, map_index=map_index)
+
+    @staticmethod
+    def deserialize_value(result):
+        return decode_embeddings(BaseXCom.deserialize_value(result))
+
+    @staticmethod
+    def purge(xcom, session):
+        # Called before the XCom row is deleted or overwritten; a failure must not block clearing the task
+        try:
+            refs = find_embedding_refs(BaseXCom.deserialize_value(xcom))
+            for ref in refs:
+                _get_minio_client().remove_object(MINIO_BUCKET_NAME, ref)
+        except Exception as e:
+            logger.warning(f"Could not remove the offloaded blobs of XCom '{xcom.key}': {e}")
+
+    def orm_deserialize_value(self):
+        # The web UI shows the pointer of offloaded blobs instead of fetching them
+        return decode_embeddings(BaseXCom.deserialize_value(self), resolve_refs=False)
+
+def _safe_path_part(part):
+    return re.sub(r'[^A-Za-z0-9._=-]', '_', str(part))
+
+def _get_minio_client():
+    return get_minio_client(MINIO_ENDPOINT, MINIO_ACCESS_KEY, MINIO_SECRET_KEY)
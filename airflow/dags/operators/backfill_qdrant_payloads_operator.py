@@ -0,0 +1,129 @@
+from datetime import timezone
+from airflow.utils.decorators import apply_defaults
+from operators.base_qdrant_custom_operator import BaseQdrantCustomOperator
+from qdrant_client.http import models
+from helpers.encoder_helpers import get_encoder_model_version
+from helpers.qdrant_helpers import build_identity_payload, ensure_payload_indexes
+
+class BackfillQdrantPayloadsOperator(BaseQdrantCustomOperator):
+    """
+    Custom Airflow operator to fill in the identity payload of voice points stored without it.
+
+    The collection is scrolled page by page. The owners of the points of each page missing
+    a 'user_id' are resolved with a single MongoDB query on their voice IDs, and the payloads
+    of the page are written with a single batch update.
+
+    Args:
+    - qdrant_uri (str): The URI of the QDrant server.
+    - qdrant_api_key (str): The API key for accessing the QDrant server.
+    - qdrant_collection (str): The name of the collection holding the voice embeddings.
+    - page_size (int): Number of points read and updated per request.
+    """
+
+    @apply_defaults
+    def __init__(
+        self,
+        qdrant_uri,
+        qdrant_api_key,
+        qdrant_collection,
+        page_size=256,
+        *args, **kwargs
+    ):
+        """
+        Initialize the operator with the required parameters.
+
+        Args:
+        - qdrant_uri (str): The URI of the QDrant server.
+        - qdrant_api_key (str): The API key for accessing the QDrant server.
+        - qdrant_collection (str): The name of the collection holding the voice embeddings.
+        - page_size (int): Number of points read and updated per request.
+
+        Inherits:
+        - *args: Additional arguments.
+        - **kwargs: Additional keyword arguments.
+        """
+        super().__init__(qdrant_uri, qdrant_api_key, qdrant_collection, *args, **kwargs)
+        self.page_size = int(page_size)
+
+    def _find_owners(self, voice_ids):
+        """
+        Find the owners of a page of voice IDs with a single MongoDB query.
+
+        Args:
+        - voice_ids (list): The voice IDs to resolve.
+
+        Returns:
+        - dict: The user ID and registration time of every voice ID found, keyed by voice ID.
+        """
+        collection = self._get_mongodb_collection()
+        users = collection.find({"voice_id": {"$in": voice_ids}}, {"_id": 1, "voice_id": 1, "timestamp": 1})
+        return {user["voice_id"]: (str(user["_id"]), user.get("timestamp")) for user in users}
+
+    def execute(self, context):
+        """
+        Execute the operator, backfilling the identity payload of the collection.
+
+        The DAG run configuration may set 'enabled' (default True) and 'model_version'
+        (default the version of the deployed encoder) for the backfilled points.
+
+        Args:
+        - context (dict): The context dictionary passed by Airflow.
+
+        Returns:
+        - dict: The number of points scanned, updated and left without owner.
+        """
+        # Log the start of the execution
+        self._log_to_mongodb(f"Starting execution of BackfillQdrantPayloadsOperator", context, "INFO")
+        conf = context['dag_run'].conf or {}
+        enabled = bool(conf.get('enabled', True))
+        model_version = conf.get('model_version') or get_encoder_model_version()
+        client = self._get_qdrant_client()
+
+        created_indexes = ensure_payload_indexes(client, self.qdrant_collection)
+        if created_indexes:
+            self._log_to_mongodb(f"Created payload indexes: {created_indexes}", context, "INFO")
+
+        # Only points without an owner need a payload
+        missing_owner = models.Filter(must=[models.IsEmptyCondition(is_empty=models.PayloadField(key="user_id"))])
+        scanned, updated, orphans = 0, 0, []
+        offset = None
+        while True:
+            points, offset = client.scroll(
+                self.qdrant_collection,
+                scroll_filter=missing_owner,
+                limit=self.page_size,
+                offset=offset,
+                with_payload=False,
+                with_vectors=False
+            )
+            scanned += len(points)
+            owners = self._find_owners([str(point.id) for point in points])
+            operations = []
+            for point in points:
+                owner = owners.get(str(point.id))
+                if owner is None:
+                    orphans.append(str(point.id))
+                    continue
+                user_id, registered_at = owner
+                # MongoDB returns naive UTC datetimes
+                enrolled_at = registered_at.replace(tzinfo=timezone.utc).timestamp() if registered_at is not None else None
+                operations.append(models.SetPayloadOperation(set_payload=models.SetPayload(
+                    payload=build_identity_payload(user_id, enabled=enabled, model_version=model_version, enrolled_at=enrolled_at),
+                    points=[point.id]
+                )))
+            if operations:
+                client.batch_update_points(self.qdrant_collection, update_operations=operations, wait=True)
+                updated += len(operations)
+            if offset is None:
+                break
+
+        if orphans:
+            self._log_to_mongodb(f"{len(orphans)} voice point(s) have no owner in MongoDB and were left unchanged: {orphans[:20]}", context, "WARNING")
+        # Log the end of the execution
+        self._log_to_mongodb(f"Execution of BackfillQdrantPayloadsOperator completed: {scanned} scanned, {updated} updated", context, "INFO")
+        return {"result": {
+            "type": "payload_backfill",
+            "scanned": scanned,
+            "updated": updated,
+            "orphans": len(orphans)
+        }}
@@ -1,12 +1,36 @@
-import tempfile
+from functools import wraps
 from bson import ObjectId
 from airflow.models import BaseOperator
 from airflow.utils.decorators import apply_defaults
 from pymongo import MongoClient
-from minio import Minio
 from datetime import datetime
+from helpers.audio_helpers import read_object_bytes
+from helpers.cache_helpers import USER_METADATA_PROJECTION, get_user_metadata_cache
+from helpers.log_sink_helpers import flush_after_execute_enabled, get_log_sink
+from helpers.minio_helpers import ensure_minio_bucket, get_minio_client
+from helpers.mongodb_helpers import ensure_mongodb_indexes, find_one_explained
+
+def _flush_logs_after(execute):
+    # The queued log records are written whether the task succeeds, fails or is skipped,
+    # unless the process runs tasks inline and outlives them
+    @wraps(execute)
+    def wrapper(self, context, *args, **kwargs):
+        try:
+            return execute(self, context, *args, **kwargs)
+        finally:
+            if flush_after_execute_enabled():
+                get_log_sink(self.mongo_uri, self.mongo_db).flush()
+    return wrapper
 
 class BaseCustomOperator(BaseOperator):
+
+    def __init_subclass__(cls, **kwargs):
+        """
+        Make the execute method of every operator write its queued log messages before returning or raising.
+        """
+        super().__init_subclass__(**kwargs)
+        if "execute" in cls.__dict__:
+            cls.execute = _flush_logs_after(cls.execute)
     
     @apply_defaults
     def __init__(
@@ -52,6 +76,8 @@ class BaseCustomOperator(BaseOperator):
         """
         client = MongoClient(self.mongo_uri)
         db = client[self.mongo_db]
+        # Provision the indexes the lookups rely on, once per process
+        ensure_mongodb_indexes(db, self.mongo_db_collection)
         
         if collection_name:
             return db[collection_name]
@@ -71,17 +97,13 @@ class BaseCustomOperator(BaseOperator):
         current_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         log_document = {
             "task_instance_id": task_instance_id,
+            "run_id": context.get('run_id'),
             "log_level": log_level,
             "timestamp": current_timestamp,
             "log_message": message
         }
-        client = MongoClient(self.mongo_uri)
-        db = client[self.mongo_db]
-        try:
-            db.dags_execution_logs.insert_one(log_document)
-            print("Log message registered in MongoDB")
-        except Exception as e:
-            print(f"Error writing log message to MongoDB: {e}")
+        # The record is queued and written in a batch by the log sink of the process
+        get_log_sink(self.mongo_uri, self.mongo_db).emit(log_document)
 
     def _get_minio_client(self, context):
         """
@@ -92,20 +114,10 @@ class BaseCustomOperator(BaseOperator):
         :return: A MinIO client instance.
         """
         try:
-            self._log_to_mongodb(f"MinIO Endpoint: {self.minio_endpoint}  Bucket Name: {self.minio_bucket_name}", context, "INFO")
-            self._log_to_mongodb(f"Access Key: {self.minio_access_key}", context, "INFO")
-            self._log_to_mongodb("Connecting to MinIO...", context, "INFO")
-            minio_client = Minio(
-                self.minio_endpoint,
-                access_key=self.minio_access_key,
-                secret_key=self.minio_secret_key,
-                secure=False
-            )
-            bucket_exists = minio_client.bucket_exists(self.minio_bucket_name)
-            if not bucket_exists:
-                self._log_to_mongodb(f"Bucket '{self.minio_bucket_name}' does not exist; creating...", context, "INFO")
-                minio_client.make_bucket(self.minio_bucket_name)
-            self._log_to_mongodb(f"Connected to MinIO and bucket '{self.minio_bucket_name}' exists", context, "INFO")
+            # The client of the process is reused and the bucket is only checked on first use
+            minio_client = get_minio_client(self.minio_endpoint, self.minio_access_key, self.minio_secret_key)
+            if ensure_minio_bucket(minio_client, self.minio_bucket_name):
+                self._log_to_mongodb(f"Bucket '{self.minio_bucket_name}' did not exist and was created", context, "INFO")
             return minio_client
 
         except Exception as e:
@@ -114,11 +126,10 @@ class BaseCustomOperator(BaseOperator):
             raise Exception(error_message)
         
     def _get_user_info(self, context, user_id):
-        # Get a reference to the MongoDB collection
-        collection = self._get_mongodb_collection()
-
-        # Retrieve meeting information from MongoDB based on user_id
-        user_info = collection.find_one({"_id": ObjectId(user_id)})
+        # Retrieve the user from the metadata cache, or from MongoDB based on user_id
+        load_user_info = lambda: find_one_explained(self._get_mongodb_collection(), {"_id": ObjectId(user_id)}, USER_METADATA_PROJECTION)
+        user_cache = get_user_metadata_cache()
+        user_info = user_cache.get_by_user_id(user_id, load_user_info) if user_cache else load_user_info()
         if user_info is None:
             error_message = f"User with ID {user_id} not found in MongoDB"
             self._log_to_mongodb(error_message, context, "ERROR")
@@ -155,33 +166,42 @@ class BaseCustomOperator(BaseOperator):
         Returns:
         - dict or None: A dictionary containing the user details if found, or None if not found.
         """
-        # Get a reference to the MongoDB collection
-        collection = self._get_mongodb_collection()
-        user_info = collection.find_one({"voice_id": voice_id})  # Find user details by voice ID
-        return user_info
+        # Find user details by voice ID, in the metadata cache first
+        load_user_info = lambda: find_one_explained(self._get_mongodb_collection(), {"voice_id": voice_id}, USER_METADATA_PROJECTION)
+        user_cache = get_user_metadata_cache()
+        return user_cache.get_by_voice_id(voice_id, load_user_info) if user_cache else load_user_info()
+
+    def _invalidate_user_info(self, user_id, voice_id=None):
+        """
+        Removes a user from the metadata cache after it changed.
+
+        Parameters:
+        - user_id (str): The ID of the user.
+        - voice_id (str, optional): The voice ID of the user.
+        """
+        user_cache = get_user_metadata_cache()
+        if user_cache:
+            user_cache.invalidate(user_id, voice_id)
     
-    def _download_file_from_minio(self, context, file_path):
+    def _read_file_from_minio(self, context, file_path):
         """
-        Downloads a file from MinIO to a temporary file.
+        Reads a file from MinIO into memory.
 
         Args:
         - context (dict): The execution context.
-        - minio_client: MinIO client instance.
         - file_path (str): Path to the file in MinIO.
 
         Returns:
-        - str: Path to the downloaded temporary file.
+        - bytes: The content of the file.
         """
         try:
             # Get MinIO client
             minio_client = self._get_minio_client(context)
-            file_data = minio_client.get_object(self.minio_bucket_name, file_path)
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_file:
-                temp_file_path = temp_file.name
-                temp_file.write(file_data.read())
-            self._log_to_mongodb(f"Downloaded file '{file_path}' from MinIO to temporary file", context, "INFO")
-            return temp_file_path
+            response = minio_client.get_object(self.minio_bucket_name, file_path)
+            file_data = read_object_bytes(response)
+            self._log_to_mongodb(f"Read file '{file_path}' from MinIO ({len(file_data)} bytes)", context, "INFO")
+            return file_data
         except Exception as e:
-            error_message = f"Error downloading file '{file_path}' from MinIO: {str(e)}"
+            error_message = f"Error reading file '{file_path}' from MinIO: {str(e)}"
             self._log_to_mongodb(error_message, context, "ERROR")
             raise e
\ No newline at end of file
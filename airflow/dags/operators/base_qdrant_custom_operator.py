@@ -0,0 +1,100 @@
+from airflow.utils.decorators import apply_defaults
+from operators.base_custom_operator import BaseCustomOperator
+from helpers.centroid_helpers import QDRANT_SAMPLES_COLLECTION
+from helpers.qdrant_helpers import (
+    QDRANT_COLLECTION_ALIAS, build_identity_payload, ensure_collection_alias, ensure_voice_collection, get_qdrant_client
+)
+from helpers.vector_store_helpers import get_vector_store
+
+class BaseQdrantCustomOperator(BaseCustomOperator):
+    """
+    Base class for custom operators working on the QDrant voice collection.
+
+    Attributes:
+    - qdrant_uri (str): The URI of the QDrant server.
+    - qdrant_api_key (str): The API key for accessing the QDrant server.
+    - qdrant_collection (str): The name of the collection holding the voice embeddings.
+    """
+
+    @apply_defaults
+    def __init__(
+        self,
+        qdrant_uri,
+        qdrant_api_key,
+        qdrant_collection,
+        *args, **kwargs
+    ):
+        """
+        Initialize the BaseQdrantCustomOperator.
+
+        Args:
+        - qdrant_uri (str): The URI of the QDrant server.
+        - qdrant_api_key (str): The API key for accessing the QDrant server.
+        - qdrant_collection (str): The name of the collection holding the voice embeddings.
+        - mongo_uri (str): MongoDB URI.
+        - mongo_db (str): MongoDB database name.
+        - mongo_db_collection (str): MongoDB collection name.
+        - minio_endpoint (str): MinIO endpoint URL.
+        - minio_access_key (str): MinIO access key.
+        - minio_secret_key (str): MinIO secret key.
+        - minio_bucket_name (str): Name of the MinIO bucket.
+        """
+        super().__init__(*args, **kwargs)
+        self.qdrant_uri = qdrant_uri
+        self.qdrant_api_key = qdrant_api_key
+        self.qdrant_collection = qdrant_collection
+
+    def _get_qdrant_client(self):
+        """
+        Get the QDrant client of this process, shared by every operator using the same server.
+
+        The alias of the voice collection is created on first use, pointing at the existing collection.
+
+        Returns:
+        - RetryingQdrantClient: The QDrant client.
+        """
+        client = get_qdrant_client(self.qdrant_uri, self.qdrant_api_key)
+        if self.qdrant_collection == QDRANT_COLLECTION_ALIAS:
+            ensure_collection_alias(client, self.qdrant_collection)
+        return client
+
+    def _ensure_qdrant_collection(self, client):
+        """
+        Create the voice collection if it does not exist yet, checking it once per process.
+
+        Args:
+        - client (RetryingQdrantClient): The QDrant client.
+        """
+        ensure_voice_collection(client, self.qdrant_collection)
+
+    def _get_vector_store(self):
+        """
+        Get the vector store of the voice collection, QDrant or local as selected by VECTOR_STORE_BACKEND.
+
+        Returns:
+        - VectorStore: The vector store.
+        """
+        return get_vector_store(self.qdrant_uri, self.qdrant_api_key, self.qdrant_collection)
+
+    def _store_sample_embeddings(self, context, user_id, voice_id, sample_ids, sample_embeddings, model_version):
+        """
+        Keep the embedding of every sample in the samples collection, for audits.
+
+        Does nothing unless QDRANT_SAMPLES_COLLECTION is set. Sample points are never
+        searched by authentication; their payload links them to the centroid point.
+
+        Args:
+        - context (dict): The context dictionary passed by Airflow.
+        - user_id (str): The ID of the user owning the samples.
+        - voice_id (str): The ID of the centroid point of the user.
+        - sample_ids (list[str]): The IDs of the voice files of the samples.
+        - sample_embeddings (np.ndarray): The embedding of every sample.
+        - model_version (str): Version of the model that computed the embeddings.
+        """
+        if not QDRANT_SAMPLES_COLLECTION:
+            return
+        store = get_vector_store(self.qdrant_uri, self.qdrant_api_key, QDRANT_SAMPLES_COLLECTION)
+        store.ensure_collection()
+        payload = {**build_identity_payload(user_id, model_version=model_version), "voice_id": str(voice_id)}
+        store.upsert_many([(sample_id, embedding, payload) for sample_id, embedding in zip(sample_ids, sample_embeddings)])
+        self._log_to_mongodb(f"{len(sample_ids)} sample embeddings stored in {QDRANT_SAMPLES_COLLECTION}", context, "INFO")
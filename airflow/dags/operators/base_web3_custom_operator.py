@@ -2,6 +2,7 @@ import hashlib
 import json
 from airflow.utils.decorators import apply_defaults
 from operators.base_custom_operator import BaseCustomOperator
+from helpers.audio_helpers import read_object_bytes
 from web3.middleware import geth_poa_middleware
 from web3 import Web3
 
@@ -110,7 +111,7 @@ class BaseWeb3CustomOperator(BaseCustomOperator):
         try:
             minio_client = self._get_minio_client(context)
             response = minio_client.get_object(self.minio_bucket_name, self.contract_abi)
-            contract_abi_json = response.read()
+            contract_abi_json = read_object_bytes(response)
             contract_abi = json.loads(contract_abi_json)
             return contract_abi
         except Exception as e:
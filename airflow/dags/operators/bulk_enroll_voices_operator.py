@@ -0,0 +1,277 @@
+import csv
+import io
+import os
+import tarfile
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from qdrant_client.http import models
+from resemblyzer import preprocess_wav
+from airflow.utils.decorators import apply_defaults
+from operators.base_qdrant_custom_operator import BaseQdrantCustomOperator
+from helpers.audio_helpers import decode_waveform, sniff_audio_format
+from helpers.batching_helpers import get_embedding_batcher
+from helpers.encoder_helpers import get_encoder_model_version
+from helpers.ingestion_helpers import QdrantPointBatcher
+from helpers.mongodb_helpers import has_unique_email_index
+from helpers.preprocessing_helpers import trim_voice_activity
+from helpers.qdrant_helpers import build_identity_payload
+
+class BulkEnrollVoicesOperator(BaseQdrantCustomOperator):
+    """
+    Custom Airflow operator to enroll a set of pre-recorded voice samples in bulk.
+
+    The samples are read from a directory, a zip archive or a tar archive holding a
+    'manifest.csv' file with the 'fullname', 'email' and 'file' columns. Each sample is
+    stored in MinIO, embedded and upserted into QDrant by a pool of threads. Embeddings
+    are computed in micro-batches across threads and points are upserted in bulk, then
+    the users are saved to MongoDB with a single insert per chunk. Points are upserted
+    disabled and only enabled once their user is saved, so a failed insert never leaves
+    an identity that can authenticate; the points of the users not saved are deleted.
+
+    Args:
+    - qdrant_uri (str): The URI of the QDrant server.
+    - qdrant_api_key (str): The API key for accessing the QDrant server.
+    - qdrant_collection (str): The name of the collection holding the voice embeddings.
+    - max_workers (int): Number of samples processed concurrently.
+    - chunk_size (int): Number of samples read ahead and saved to MongoDB at once.
+    """
+
+    MANIFEST_NAME = "manifest.csv"
+    CONTENT_TYPES = {"wav": "audio/wav", "mp3": "audio/mpeg", "flac": "audio/flac", "ogg": "audio/ogg"}
+
+    @apply_defaults
+    def __init__(
+        self,
+        qdrant_uri,
+        qdrant_api_key,
+        qdrant_collection,
+        max_workers=8,
+        chunk_size=512,
+        *args, **kwargs
+    ):
+        """
+        Initialize the operator with the required parameters.
+
+        Args:
+        - qdrant_uri (str): The URI of the QDrant server.
+        - qdrant_api_key (str): The API key for accessing the QDrant server.
+        - qdrant_collection (str): The name of the collection holding the voice embeddings.
+        - max_workers (int): Number of samples processed concurrently.
+        - chunk_size (int): Number of samples read ahead and saved to MongoDB at once.
+
+        Inherits:
+        - *args: Additional arguments.
+        - **kwargs: Additional keyword arguments.
+        """
+        super().__init__(qdrant_uri, qdrant_api_key, qdrant_collection, *args, **kwargs)
+        self.max_workers = int(max_workers)
+        self.chunk_size = int(chunk_size)
+
+    def _iter_samples(self, source):
+        """
+        Iterate over the samples listed in the manifest of a directory or an archive.
+
+        Args:
+        - source (str): Path of the directory, zip archive or tar archive.
+
+        Yields:
+        - tuple: The full name, email, file name and audio content of each sample.
+        """
+        if os.path.isdir(source):
+            def read(name):
+                with open(os.path.join(source, name), 'rb') as sample_file:
+                    return sample_file.read()
+        elif zipfile.is_zipfile(source):
+            archive = zipfile.ZipFile(source)
+            read = archive.read
+        elif tarfile.is_tarfile(source):
+            archive = tarfile.open(source)
+            read = lambda name: archive.extractfile(name).read()
+        else:
+            raise ValueError(f"Unsupported enrollment source '{source}', expected a directory, a zip or a tar archive")
+
+        manifest = csv.DictReader(io.StringIO(read(self.MANIFEST_NAME).decode("utf-8")))
+        missing_columns = {"fullname", "email", "file"} - set(manifest.fieldnames or [])
+        if missing_columns:
+            raise ValueError(f"The manifest is missing the columns {sorted(missing_columns)}")
+        for row in manifest:
+            yield row["fullname"].strip(), row["email"].strip(), row["file"].strip(), read(row["file"].strip())
+
+    def _chunks(self, samples):
+        chunk = []
+        for sample in samples:
+            chunk.append(sample)
+            if len(chunk) == self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _enroll_sample(self, minio_client, point_batcher, model_version, fullname, email, file_data):
+        """
+        Store, embed and upsert a single sample.
+
+        Returns:
+        - dict: The MongoDB document of the enrolled user.
+        """
+        voice_id = str(uuid.uuid4())
+        minio_client.put_object(self.minio_bucket_name, voice_id, io.BytesIO(file_data), len(file_data),
+                                content_type=self.CONTENT_TYPES.get(sniff_audio_format(file_data), "application/octet-stream"))
+        user_id = ObjectId()
+        try:
+            wav, sampling_rate = decode_waveform(file_data)
+            wav, _ = trim_voice_activity(wav, sampling_rate)
+            embedding = get_embedding_batcher().embed(preprocess_wav(wav, source_sr=sampling_rate))
+            # Enabled once the user is saved
+            point_batcher.upsert(voice_id, embedding, build_identity_payload(user_id, enabled=False, model_version=model_version))
+        except Exception:
+            # The sample is never enrolled, so its audio is not kept; the original error is raised
+            self._remove_samples(minio_client, [voice_id])
+            raise
+        return {
+            "_id": user_id,
+            "fullname": fullname,
+            "email": email,
+            "voice_id": voice_id,
+            "timestamp": datetime.now(timezone.utc)
+        }
+
+    def _insert_users(self, users_collection, users):
+        """
+        Save the enrolled users, leaving out the ones that cannot be inserted.
+
+        Returns:
+        - tuple: The users rejected by the unique indexes of the collection, and the users
+          rejected for any other reason with their error message.
+        """
+        try:
+            users_collection.insert_many(users, ordered=False)
+            return [], []
+        except BulkWriteError as e:
+            duplicates, rejected = [], []
+            for error in e.details.get("writeErrors", []):
+                if error["code"] == 11000:
+                    duplicates.append(users[error["index"]])
+                else:
+                    rejected.append((users[error["index"]], error.get("errmsg", f"write error {error['code']}")))
+            return duplicates, rejected
+
+    def _remove_samples(self, minio_client, voice_ids):
+        """
+        Remove the stored audio of samples that were not enrolled.
+
+        Returns:
+        - list: The voice IDs whose audio could not be removed.
+        """
+        not_removed = []
+        for voice_id in voice_ids:
+            try:
+                minio_client.remove_object(self.minio_bucket_name, voice_id)
+            except Exception:
+                not_removed.append(voice_id)
+        return not_removed
+
+    def _delete_points(self, qdrant_client, voice_ids):
+        if voice_ids:
+            qdrant_client.delete(self.qdrant_collection, points_selector=models.PointIdsList(points=voice_ids), wait=True)
+
+    def execute(self, context):
+        """
+        Execute the operator, enrolling every sample of the source given in the DAG run configuration.
+
+        Args:
+        - context (dict): The context dictionary passed by Airflow.
+
+        Returns:
+        - dict: The enrolled users, the failures and the throughput of the load.
+        """
+        # Log the start of the execution
+        self._log_to_mongodb(f"Starting execution of BulkEnrollVoicesOperator", context, "INFO")
+        source = (context['dag_run'].conf or {}).get('source')
+        if not source:
+            self._log_to_mongodb("The 'source' parameter is not defined", context, "ERROR")
+            raise ValueError("The 'source' parameter is not defined")
+
+        qdrant_client = self._get_qdrant_client()
+        self._ensure_qdrant_collection(qdrant_client)
+        point_batcher = QdrantPointBatcher(qdrant_client, self.qdrant_collection)
+        minio_client = self._get_minio_client(context)
+        users_collection = self._get_mongodb_collection()
+        if not has_unique_email_index(users_collection.database, users_collection.name):
+            self._log_to_mongodb("The users collection has no unique email index, users registered meanwhile through the API may be duplicated", context, "WARNING")
+        model_version = get_encoder_model_version()
+
+        enrolled, failures, skipped = [], [], 0
+        start_time = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bulk-enrollment") as executor:
+                for chunk in self._chunks(self._iter_samples(source)):
+                    # Identities already registered are left untouched
+                    existing_emails = {user["email"] for user in users_collection.find(
+                        {"email": {"$in": [email for _, email, _, _ in chunk]}}, {"email": 1})}
+                    futures = {}
+                    for fullname, email, file_name, file_data in chunk:
+                        if email in existing_emails:
+                            skipped += 1
+                            continue
+                        existing_emails.add(email)
+                        future = executor.submit(self._enroll_sample, minio_client, point_batcher, model_version, fullname, email, file_data)
+                        futures[future] = file_name
+                    wait(futures)
+                    users, file_names = [], {}
+                    for future, file_name in futures.items():
+                        if future.exception() is not None:
+                            failures.append({"file": file_name, "error": str(future.exception())})
+                        else:
+                            users.append(future.result())
+                            file_names[users[-1]["voice_id"]] = file_name
+                    if users:
+                        try:
+                            duplicates, rejected = self._insert_users(users_collection, users)
+                        except Exception:
+                            # Which users were saved is unknown, so none of the disabled points is kept
+                            self._delete_points(qdrant_client, [user["voice_id"] for user in users])
+                            raise
+                        # Duplicates were registered meanwhile through the API
+                        skipped += len(duplicates)
+                        failures.extend({"file": file_names[user["voice_id"]], "error": error} for user, error in rejected)
+                        not_saved = {user["_id"] for user in duplicates} | {user["_id"] for user, _ in rejected}
+                        not_saved_voice_ids = [user["voice_id"] for user in users if user["_id"] in not_saved]
+                        self._delete_points(qdrant_client, not_saved_voice_ids)
+                        not_removed = self._remove_samples(minio_client, not_saved_voice_ids)
+                        if not_removed:
+                            self._log_to_mongodb(f"The audio of the samples not enrolled {not_removed} could not be removed from MinIO", context, "WARNING")
+                        saved = [user for user in users if user["_id"] not in not_saved]
+                        if saved:
+                            qdrant_client.set_payload(self.qdrant_collection, payload={"enabled": True},
+                                                      points=[user["voice_id"] for user in saved], wait=True)
+                        enrolled.extend({"user_id": str(user["_id"]), "voice_id": user["voice_id"]} for user in saved)
+                    elapsed = time.perf_counter() - start_time
+                    self._log_to_mongodb(f"{len(enrolled)} voices enrolled in {elapsed:.1f} s ({len(enrolled) / elapsed:.1f} points/s), "
+                                         f"{len(failures)} failed, {skipped} already registered", context, "INFO")
+        finally:
+            # Stops the sender and confirmer threads even if the load failed
+            point_batcher.close()
+        elapsed = time.perf_counter() - start_time
+
+        for failure in failures[:20]:
+            self._log_to_mongodb(f"Enrollment of '{failure['file']}' failed: {failure['error']}", context, "ERROR")
+        # Log the end of the execution
+        self._log_to_mongodb(f"Execution of BulkEnrollVoicesOperator completed, point batcher stats: {point_batcher.stats()}", context, "INFO")
+        return {
+            "enrolled": enrolled,
+            "result": {
+                "type": "bulk_enrollment",
+                "enrolled": len(enrolled),
+                "failed": len(failures),
+                "skipped": skipped,
+                "seconds": round(elapsed, 3),
+                "points_per_second": round(len(enrolled) / elapsed, 2) if elapsed else 0.0
+            }
+        }
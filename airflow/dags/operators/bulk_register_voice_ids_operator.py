@@ -0,0 +1,90 @@
+from airflow.utils.decorators import apply_defaults
+from operators.base_web3_custom_operator import BaseWeb3CustomOperator
+
+class BulkRegisterVoiceIDsOperator(BaseWeb3CustomOperator):
+    """
+    Operator to register on the Smart Contract the VoiceIDs enrolled by the bulk enrollment task.
+
+    Every transaction is signed with consecutive nonces and sent without waiting for the
+    previous one to be mined; the receipts are collected once all of them are sent. A
+    transaction that cannot be sent or mined is reported as failed for its user, and the
+    receipts of the transactions already sent are still collected.
+
+    Inherits:
+    - BaseWeb3CustomOperator: Base class for Ethereum blockchain interaction operators.
+    """
+
+    @apply_defaults
+    def __init__(
+        self,
+        *args, **kwargs
+    ):
+        """
+        Initialize the operator.
+
+        Inherits:
+        - *args: Additional arguments.
+        - **kwargs: Additional keyword arguments.
+        """
+        super().__init__(*args, **kwargs)
+
+    def execute(self, context):
+        """
+        Execute operator logic.
+
+        Parameters:
+        - context (dict): Execution context containing information about the DAG run.
+
+        Returns:
+        - dict: The number of VoiceIDs registered and failed.
+        """
+        # Log the start of the execution
+        self._log_to_mongodb(f"Starting execution of BulkRegisterVoiceIDsOperator", context, "INFO")
+        args = context['task_instance'].xcom_pull(task_ids='bulk_enroll_voices_task') or {}
+        enrolled = args.get('enrolled') or []
+
+        web3 = self._connect_to_web3()
+        self._check_connection(web3, context)
+        chain_id = self._get_chain_id(web3)
+        nonce = self._get_nonce(web3)
+        contract = self._get_contract_instance(web3, self._load_contract_abi(context))
+
+        tx_hashes, failed = [], []
+        for identity in enrolled:
+            try:
+                tx_data = contract.functions.registerVoiceIDVerification(
+                    self._sha256(identity["user_id"]),
+                    self._sha256(identity["voice_id"])
+                ).build_transaction({
+                    "chainId": chain_id,
+                    "from": self.caller_address,
+                    # Nonces only advance with the transactions actually sent, so a failure leaves no gap
+                    "nonce": nonce + len(tx_hashes)
+                })
+                signed_tx = web3.eth.account.sign_transaction(tx_data, private_key=self.caller_private_key)
+                tx_hashes.append((identity["user_id"], web3.eth.send_raw_transaction(signed_tx.rawTransaction)))
+            except Exception as e:
+                failed.append({"user_id": identity["user_id"], "error": str(e)})
+
+        registered = 0
+        for user_id, tx_hash in tx_hashes:
+            try:
+                tx_receipt = web3.eth.wait_for_transaction_receipt(tx_hash)
+            except Exception as e:
+                failed.append({"user_id": user_id, "error": str(e)})
+                continue
+            if tx_receipt['status'] == 1:
+                registered += 1
+            else:
+                failed.append({"user_id": user_id, "error": f"transaction {tx_hash.hex()} reverted"})
+        if failed:
+            self._log_to_mongodb(f"Registration of {len(failed)} VoiceID(s) failed: {failed[:20]}", context, "ERROR")
+
+        # Log completion of operator execution
+        self._log_to_mongodb(f"Execution of BulkRegisterVoiceIDsOperator completed: {registered} registered, {len(failed)} failed", context, "INFO")
+        return {"result": {
+            "type": "bulk_identity_registration",
+            "registered": registered,
+            "failed": len(failed),
+            "failures": failed
+        }}
@@ -1,5 +1,6 @@
 from operators.base_web3_custom_operator import BaseWeb3CustomOperator
 from airflow.utils.decorators import apply_defaults
+from helpers.vector_store_helpers import get_vector_store
 
 class ChangeVoiceIdVerificationStateOperator(BaseWeb3CustomOperator):
     """
@@ -7,7 +8,13 @@ class ChangeVoiceIdVerificationStateOperator(BaseWeb3CustomOperator):
 
     Inherits from BaseWeb3CustomOperator.
 
+    Once the transaction succeeds, the 'enabled' payload of the user's voice points in QDrant
+    is updated too, so that authentication searches skip disabled identities.
+
     Args:
+    - qdrant_uri (str, optional): The URI of the QDrant server.
+    - qdrant_api_key (str, optional): The API key for accessing the QDrant server.
+    - qdrant_collection (str, optional): The name of the collection holding the voice embeddings.
     - *args: Variable length argument list.
     - **kwargs: Arbitrary keyword arguments.
 
@@ -21,16 +28,46 @@ class ChangeVoiceIdVerificationStateOperator(BaseWeb3CustomOperator):
     @apply_defaults
     def __init__(
         self,
+        qdrant_uri=None,
+        qdrant_api_key=None,
+        qdrant_collection=None,
         *args, **kwargs
     ):
         """
         Initializes the ChangeVoiceIdVerificationStateOperator.
 
         Args:
+        - qdrant_uri (str, optional): The URI of the QDrant server.
+        - qdrant_api_key (str, optional): The API key for accessing the QDrant server.
+        - qdrant_collection (str, optional): The name of the collection holding the voice embeddings.
         - *args: Variable length argument list.
         - **kwargs: Arbitrary keyword arguments.
         """
         super().__init__(*args, **kwargs)
+        self.qdrant_uri = qdrant_uri
+        self.qdrant_api_key = qdrant_api_key
+        self.qdrant_collection = qdrant_collection
+
+    def _update_qdrant_payload(self, context, user_id, is_enabled):
+        """
+        Updates the identity payload of the voice points owned by the user.
+
+        Points are selected by their 'user_id' payload, and also by the voice ID stored in
+        MongoDB for points that were stored before the payload existed.
+
+        Args:
+        - context (dict): The context containing information about the DAG run.
+        - user_id (str): The ID of the user.
+        - is_enabled (bool): The new verification state.
+        """
+        voice_id = self._get_user_info(context, user_id).get("voice_id")
+        store = get_vector_store(self.qdrant_uri, self.qdrant_api_key, self.qdrant_collection)
+        store.update_identity(
+            str(user_id),
+            {"user_id": str(user_id), "enabled": is_enabled},
+            point_ids=[voice_id] if voice_id else ()
+        )
+        self._log_to_mongodb(f"Vector store payload of user {user_id} updated with enabled={is_enabled}", context, "INFO")
 
     def execute(self, context):
         """
@@ -93,9 +130,15 @@ class ChangeVoiceIdVerificationStateOperator(BaseWeb3CustomOperator):
         # Log transaction details
         self._log_transaction_details(tx_receipt, context)
 
+        result = tx_receipt['status'] == 1
+        if result and self.qdrant_collection:
+            self._update_qdrant_payload(context, user_id, is_enabled)
+        if result:
+            # Readers of the user metadata must not keep serving the previous state
+            self._invalidate_user_info(user_id)
+
         # Log completion of operator execution
         self._log_to_mongodb(f"Execution of ChangeVoiceIdVerificationState completed", context, "INFO")
-        result = tx_receipt['status'] == 1
         # Return information about the executed operation
         return {"result": {
             "type": "change_state",
@@ -0,0 +1,160 @@
+import os
+import time
+
+from airflow.utils.decorators import apply_defaults
+from operators.base_qdrant_custom_operator import BaseQdrantCustomOperator
+from qdrant_client.http import models
+from helpers.qdrant_helpers import QDRANT_VECTOR_SIZE
+from helpers.snapshot_helpers import (
+    SEGMENT_INDEX_COLUMNS, VOICE_SNAPSHOT_DIR, VOICE_SNAPSHOT_PAGE_SIZE, VOICE_SNAPSHOT_SETTLE_SECONDS,
+    SnapshotSegmentWriter, read_segment_checkpoint, read_snapshot_manifest, write_snapshot_manifest
+)
+
+class ExportVoiceSnapshotOperator(BaseQdrantCustomOperator):
+    """
+    Custom Airflow operator to export the voice collection into a memory-mapped snapshot for offline scoring.
+
+    Each run scrolls, in large pages, the voices enrolled since the previous export and
+    writes them into a new segment of the snapshot: a float32 '.npy' array of vectors and
+    an index file with the voice ID and owner of every row. The first run exports the whole
+    collection, including voices stored before their enrollment time was recorded. A run
+    interrupted midway is resumed from its last checkpointed page by the next run.
+
+    Payload changes and deletions of voices already exported are not reflected in the
+    snapshot; a full export is taken by exporting into a new snapshot directory.
+
+    Args:
+    - qdrant_uri (str): The URI of the QDrant server.
+    - qdrant_api_key (str): The API key for accessing the QDrant server.
+    - qdrant_collection (str): The name of the collection holding the voice embeddings.
+    - snapshot_dir (str): The directory holding the snapshots, one per collection.
+    - page_size (int): Number of points read per scroll request.
+    """
+
+    @apply_defaults
+    def __init__(
+        self,
+        qdrant_uri,
+        qdrant_api_key,
+        qdrant_collection,
+        snapshot_dir=VOICE_SNAPSHOT_DIR,
+        page_size=VOICE_SNAPSHOT_PAGE_SIZE,
+        *args, **kwargs
+    ):
+        """
+        Initialize the operator with the required parameters.
+
+        Args:
+        - qdrant_uri (str): The URI of the QDrant server.
+        - qdrant_api_key (str): The API key for accessing the QDrant server.
+        - qdrant_collection (str): The name of the collection holding the voice embeddings.
+        - snapshot_dir (str): The directory holding the snapshots, one per collection.
+        - page_size (int): Number of points read per scroll request.
+
+        Inherits:
+        - *args: Additional arguments.
+        - **kwargs: Additional keyword arguments.
+        """
+        super().__init__(qdrant_uri, qdrant_api_key, qdrant_collection, *args, **kwargs)
+        self.snapshot_dir = snapshot_dir
+        self.page_size = int(page_size)
+
+    def _export_filter(self, since, until):
+        """
+        Build the filter selecting the voices enrolled in the (since, until] window.
+
+        Voices without enrollment time only match when there is no lower bound, so they
+        are exported once, by the first run.
+
+        Args:
+        - since (float, optional): Enrollment time of the previous export.
+        - until (float): Enrollment time up to which voices are exported.
+
+        Returns:
+        - models.Filter: The QDrant scroll filter.
+        """
+        must = [models.FieldCondition(key="enrolled_at", range=models.Range(gt=since))] if since is not None else None
+        return models.Filter(
+            must=must,
+            must_not=[models.FieldCondition(key="enrolled_at", range=models.Range(gt=until))]
+        )
+
+    def execute(self, context):
+        """
+        Execute the operator, exporting the voices enrolled since the previous snapshot segment.
+
+        The DAG run configuration may set 'snapshot' to export into another snapshot of the
+        collection, for example to take a new full export.
+
+        Args:
+        - context (dict): The context dictionary passed by Airflow.
+
+        Returns:
+        - dict: The snapshot directory, the rows exported before and by this run, and its throughput.
+        """
+        # Log the start of the execution
+        self._log_to_mongodb(f"Starting execution of ExportVoiceSnapshotOperator", context, "INFO")
+        conf = context['dag_run'].conf or {}
+        directory = os.path.join(self.snapshot_dir, conf.get('snapshot') or self.qdrant_collection)
+        os.makedirs(directory, exist_ok=True)
+        manifest = read_snapshot_manifest(directory)
+        exported_rows = sum(segment["rows"] for segment in manifest["segments"])
+        client = self._get_qdrant_client()
+
+        segment = manifest.get("pending")
+        if segment is None:
+            since = manifest["segments"][-1]["until"] if manifest["segments"] else None
+            until = time.time() - VOICE_SNAPSHOT_SETTLE_SECONDS
+            capacity = client.count(self.qdrant_collection, count_filter=self._export_filter(since, until), exact=True).count
+            if capacity == 0:
+                self._log_to_mongodb(f"Execution of ExportVoiceSnapshotOperator completed, no voice enrolled since the last export", context, "INFO")
+                return {"result": {"type": "voice_snapshot_export", "snapshot": directory, "segment": None,
+                                   "previous_rows": exported_rows, "exported": 0}}
+            segment = {"name": f"segment-{len(manifest['segments']) + 1:05d}", "since": since, "until": until, "capacity": capacity}
+            manifest["pending"] = segment
+            write_snapshot_manifest(directory, manifest)
+            checkpoint = None
+        else:
+            checkpoint = read_segment_checkpoint(os.path.join(directory, segment["name"]))
+            self._log_to_mongodb(f"Resuming export of {segment['name']} from row {(checkpoint or {}).get('rows', 0)}", context, "INFO")
+
+        writer = SnapshotSegmentWriter(os.path.join(directory, segment["name"]), segment["capacity"], QDRANT_VECTOR_SIZE, checkpoint)
+        scroll_filter = self._export_filter(segment["since"], segment["until"])
+        offset = writer.checkpoint["offset"]
+        finished = checkpoint is not None and offset is None
+        start_rows, start_time = writer.rows, time.perf_counter()
+        while not finished:
+            points, offset = client.scroll(
+                self.qdrant_collection,
+                scroll_filter=scroll_filter,
+                limit=self.page_size,
+                offset=offset,
+                with_payload=SEGMENT_INDEX_COLUMNS[1:],
+                with_vectors=True
+            )
+            writer.write_page(points, offset)
+            finished = offset is None or writer.rows == segment["capacity"]
+            self._log_to_mongodb(f"{writer.rows}/{segment['capacity']} voices exported into {segment['name']}", context, "DEBUG")
+        writer.close()
+        elapsed = time.perf_counter() - start_time
+
+        # Voices deleted during the export leave the end of the vectors file unused
+        manifest["segments"].append({"name": segment["name"], "rows": writer.rows, "since": segment["since"], "until": segment["until"]})
+        manifest.pop("pending")
+        manifest["collection"] = self.qdrant_collection
+        manifest["dimension"] = QDRANT_VECTOR_SIZE
+        write_snapshot_manifest(directory, manifest)
+
+        exported = writer.rows - start_rows
+        # Log the end of the execution
+        self._log_to_mongodb(f"Execution of ExportVoiceSnapshotOperator completed: {writer.rows} voices in {segment['name']}, "
+                             f"{exported / elapsed if elapsed else 0.0:.1f} points/s", context, "INFO")
+        return {"result": {
+            "type": "voice_snapshot_export",
+            "snapshot": directory,
+            "segment": segment["name"],
+            "previous_rows": exported_rows,
+            "exported": writer.rows,
+            "seconds": round(elapsed, 3),
+            "points_per_second": round(exported / elapsed, 2) if elapsed else 0.0
+        }}
@@ -1,30 +1,42 @@
-from operators.base_custom_operator import BaseCustomOperator
+from operators.base_qdrant_custom_operator import BaseQdrantCustomOperator
+import numpy as np
 from airflow.utils.decorators import apply_defaults
-from qdrant_client import QdrantClient
 
-class FindMostSimilarVoiceOperator(BaseCustomOperator):
+# Minimum cosine similarity accepted as a match unless configured otherwise
+DEFAULT_QDRANT_SCORE_THRESHOLD = 0.75
+
+class FindMostSimilarVoiceOperator(BaseQdrantCustomOperator):
     """
     Custom Airflow operator to find the most similar voice based on audio embeddings.
 
     This operator searches for the most similar voice in a given collection using audio embeddings 
-    generated from an input audio file. It connects to a QDrant server to perform the search.
+    generated from an input audio file. The search runs on the vector store selected by
+    VECTOR_STORE_BACKEND, either the QDrant server or the local in-process engine.
+    Only the best match is requested, and only if it reaches the score threshold; disabled
+    identities are filtered out by the store itself, and the owner of the match is read from
+    the point payload. When the DAG run claims an identity ('claimed', or any claimed
+    field), only the stored vector of that identity is fetched and compared locally (1:1
+    verification); a claim that cannot be resolved never matches, and neither does any
+    claim when the score threshold is disabled.
 
     Args:
     - qdrant_uri (str): The URI of the QDrant server.
     - qdrant_api_key (str): The API key for accessing the QDrant server.
     - qdrant_collection (str): The name of the collection in QDrant to search for similar voices.
+    - qdrant_score_threshold (float, optional): Minimum cosine similarity accepted as a match.
 
     Inherits:
-    - BaseOperator: The base class for all operators in Airflow.
+    - BaseQdrantCustomOperator: Base class for operators working on the QDrant voice collection.
 
     Methods:
-    - _initialize_qdrant_client(): Initialize the QDrant client with the provided URI and API key.
+    - _verify_claimed_identity(store, context, embeddings, claimed_user_id, claimed_voice_id): Compare the embeddings with the claimed identity only.
     - execute(context): Execute the operator, performing the search for the most similar voice.
 
     Attributes:
     - qdrant_uri (str): The URI of the QDrant server.
     - qdrant_api_key (str): The API key for accessing the QDrant server.
     - qdrant_collection (str): The name of the collection in QDrant to search for similar voices.
+    - qdrant_score_threshold (float): Minimum cosine similarity accepted as a match.
     """
 
     @apply_defaults
@@ -33,6 +45,7 @@ class FindMostSimilarVoiceOperator(BaseCustomOperator):
         qdrant_uri,
         qdrant_api_key,
         qdrant_collection,
+        qdrant_score_threshold=DEFAULT_QDRANT_SCORE_THRESHOLD,
         *args, **kwargs
     ):
         """
@@ -42,25 +55,63 @@ class FindMostSimilarVoiceOperator(BaseCustomOperator):
         - qdrant_uri (str): The URI of the QDrant server.
         - qdrant_api_key (str): The API key for accessing the QDrant server.
         - qdrant_collection (str): The name of the collection in QDrant to search for similar voices.
+        - qdrant_score_threshold (float, optional): Minimum cosine similarity accepted as a match,
+          DEFAULT_QDRANT_SCORE_THRESHOLD when empty. None, or 'none', explicitly accepts the best
+          match whatever its score.
 
         Inherits:
         - *args: Additional arguments.
         - **kwargs: Additional keyword arguments.
         """
-        super().__init__(*args, **kwargs)
-        self.qdrant_uri = qdrant_uri
-        self.qdrant_api_key = qdrant_api_key
-        self.qdrant_collection = qdrant_collection
-
-    def _initialize_qdrant_client(self):
+        super().__init__(qdrant_uri, qdrant_api_key, qdrant_collection, *args, **kwargs)
+        if qdrant_score_threshold is None or str(qdrant_score_threshold).strip().lower() == "none":
+            self.qdrant_score_threshold = None
+        elif str(qdrant_score_threshold).strip() == "":
+            self.qdrant_score_threshold = DEFAULT_QDRANT_SCORE_THRESHOLD
+        else:
+            self.qdrant_score_threshold = float(qdrant_score_threshold)
+
+    def _verify_claimed_identity(self, store, context, embeddings, claimed_user_id, claimed_voice_id):
         """
-        Initialize the QDrant client with the provided URI and API key.
+        Compare the embeddings with the stored vector of the claimed identity only.
+
+        The point is fetched by ID and the cosine similarity is computed locally, so the
+        cost does not depend on the size of the collection and no other identity can match.
+
+        Args:
+        - store (VectorStore): The vector store of the voice collection.
+        - context (dict): The context dictionary passed by Airflow.
+        - embeddings (np.ndarray): The embeddings of the voice to authenticate.
+        - claimed_user_id (str): The ID of the claimed user, None if the claim was not resolved.
+        - claimed_voice_id (str): The voice ID of the claimed user, if it exists.
 
         Returns:
-        - QdrantClient: An instance of the QDrant client.
+        - dict: The matched voice, or a result without match.
         """
-        # Initialize QDrant client
-        return QdrantClient(url=self.qdrant_uri, api_key=self.qdrant_api_key)
+        no_match = {"voice_matched_id": None, "user_id": None, "score": None, "mode": "verification"}
+        # Without a threshold any recording would verify, so verification fails closed
+        if self.qdrant_score_threshold is None:
+            self._log_to_mongodb(f"Claimed identity {claimed_user_id} rejected: no score threshold is configured", context, "ERROR")
+            return no_match
+        if not claimed_user_id or not claimed_voice_id:
+            self._log_to_mongodb(f"Claimed identity {claimed_user_id} is not registered", context, "INFO")
+            return no_match
+        point = store.retrieve(claimed_voice_id)
+        if point is None:
+            self._log_to_mongodb(f"No voice stored for claimed identity {claimed_user_id}", context, "INFO")
+            return no_match
+        payload = point.payload
+        if payload.get("enabled") is False or payload.get("user_id", claimed_user_id) != claimed_user_id:
+            self._log_to_mongodb(f"Claimed identity {claimed_user_id} is disabled or does not own voice {claimed_voice_id}", context, "INFO")
+            return no_match
+        stored = np.asarray(point.vector, dtype=np.float32)
+        query = np.asarray(embeddings, dtype=np.float32)
+        score = float(np.dot(stored, query) / (np.linalg.norm(stored) * np.linalg.norm(query)))
+        if score < self.qdrant_score_threshold:
+            self._log_to_mongodb(f"Claimed identity {claimed_user_id} rejected with score {score} below threshold {self.qdrant_score_threshold}", context, "INFO")
+            return {**no_match, "score": score}
+        self._log_to_mongodb(f"Claimed identity {claimed_user_id} verified with score {score}", context, "INFO")
+        return {"voice_matched_id": point.id, "user_id": claimed_user_id, "score": score, "mode": "verification"}
 
     def execute(self, context):
         """
@@ -88,20 +139,29 @@ class FindMostSimilarVoiceOperator(BaseCustomOperator):
             self._log_to_mongodb("embeddings is not defined", context, "ERROR")
             raise ValueError("embeddings is not defined")
 
-        qdrant_client = self._initialize_qdrant_client()
-        # Search related embeddings
-        results = qdrant_client.search(self.qdrant_collection, embeddings)
+        store = self._get_vector_store()
+        dag_run_conf = context['dag_run'].conf or {}
+        # Any claim, even one that could not be resolved, must never fall back to identification
+        if dag_run_conf.get('claimed') or any(dag_run_conf.get(key) for key in ("claimed_user_id", "claimed_voice_id", "claimed_email")):
+            return self._verify_claimed_identity(store, context, embeddings,
+                                                 dag_run_conf.get('claimed_user_id'), dag_run_conf.get('claimed_voice_id'))
+
+        # Ask only for the best enabled match above the threshold, with its owner but without vectors
+        results = store.search(embeddings, limit=1, score_threshold=self.qdrant_score_threshold)
 
-        # Get the most similar audio based on the highest score
-        most_similar_audio = max(results, key=lambda result: result.score)
+        if not results:
+            self._log_to_mongodb(f"Execution of FindMostSimilarVoiceOperator completed without any voice matched above threshold {self.qdrant_score_threshold}", context, "INFO")
+            return {"voice_matched_id": None, "user_id": None, "score": None, "mode": "identification"}
+
+        most_similar_audio = results[0]
 
         # Log the end of the execution
         self._log_to_mongodb(f"Execution of FindMostSimilarVoiceOperator completed with voice matched id {str(most_similar_audio.id)} and score {most_similar_audio.score}", context, "INFO")
 
         # Return information about the executed operation
-        return {"voice_matched_id": str(most_similar_audio.id)}
-
-       
-       
-        
-        
+        return {
+            "voice_matched_id": most_similar_audio.id,
+            "user_id": most_similar_audio.payload.get("user_id"),
+            "score": most_similar_audio.score,
+            "mode": "identification"
+        }
@@ -1,19 +1,32 @@
-from resemblyzer import preprocess_wav, VoiceEncoder
+import numpy as np
+from resemblyzer import preprocess_wav
 from airflow.utils.decorators import apply_defaults
+from airflow.exceptions import AirflowFailException
 from operators.base_custom_operator import BaseCustomOperator
+from helpers.encoder_helpers import get_voice_encoder, get_encoder_model_version
+from helpers.batching_helpers import EMBEDDING_BATCHING_ENABLED, embed_utterances, get_embedding_batcher
+from helpers.centroid_helpers import ENROLLMENT_MAX_SAMPLES, compute_centroid
+from helpers.audio_helpers import decode_waveform, sniff_audio_format
+from helpers.cache_helpers import get_embedding_cache, sha256_digest
+from helpers.preprocessing_helpers import trim_voice_activity, get_preprocessing_signature, VoiceInputTooLongError
 
 class GenerateVoiceEmbeddingsOperator(BaseCustomOperator):
     """
     Custom Airflow operator to generate voice embeddings from audio files.
 
     This operator preprocesses an audio file, generates embeddings from the audio data, 
-    and logs the execution details to MongoDB.
+    and logs the execution details to MongoDB. Embeddings are cached by the SHA-256 of
+    the audio bytes, so retried uploads of the same audio skip decoding and embedding.
+    When the DAG run configuration lists several samples ('voice_file_ids'), they are
+    embedded in a single batch and compacted into their centroid.
 
     Inherits:
     - BaseCustomOperator: The base class for custom operators in Airflow.
 
     Methods:
-    - _process_audio(file_path): Preprocess the audio file and generate embeddings.
+    - _process_audio(file_data): Preprocess the audio file and generate embeddings.
+    - _embed_waveform(wav): Generate the embedding of a preprocessed waveform.
+    - _embed_samples(context, voice_file_ids): Generate the embeddings of several samples in one batch.
     - execute(context): Execute the operator, generating embeddings for the provided audio file.
 
     """
@@ -31,23 +44,114 @@ class GenerateVoiceEmbeddingsOperator(BaseCustomOperator):
         """
         super().__init__(*args, **kwargs)
 
-    def _process_audio(self, file_path):
+    def _process_audio(self, file_data):
         """
         Preprocess the audio file and generate embeddings.
 
         Args:
-        - file_path (str): Path to the audio file.
+        - file_data (bytes): Content of the audio file.
 
         Returns:
-        - np.ndarray: Array of embeddings generated from the audio file.
+        - tuple: Array of embeddings generated from the audio file and the preprocessing report.
         """
-        # Preprocess the audio file
-        wav = preprocess_wav(file_path)
+        # Decode the audio file in memory with the decoder matching its content
+        wav, sampling_rate = decode_waveform(file_data)
+        # Cap the duration and keep only the speech-dense window before the costly steps
+        wav, preprocessing_report = trim_voice_activity(wav, sampling_rate)
+        preprocessing_report["format"] = sniff_audio_format(file_data)
+        wav = preprocess_wav(wav, source_sr=sampling_rate)
 
         # Generate embeddings
-        encoder = VoiceEncoder()
-        embedding = encoder.embed_utterance(wav)
-        return embedding
+        return self._embed_waveform(wav), preprocessing_report
+
+    def _embed_waveform(self, wav):
+        """
+        Generate the embedding of a preprocessed waveform.
+
+        When batching is enabled the waveform is handed to the process-wide embedding
+        batcher, which embeds it together with the ones submitted concurrently.
+        Otherwise the encoder kept warm in this worker process embeds it directly.
+
+        Args:
+        - wav (np.ndarray): The preprocessed waveform.
+
+        Returns:
+        - np.ndarray: The embedding of the waveform.
+        """
+        if EMBEDDING_BATCHING_ENABLED:
+            return get_embedding_batcher().embed(wav)
+        encoder = get_voice_encoder()
+        return encoder.embed_utterance(wav)
+
+    def _read_voice_file(self, context, voice_file_id, expected_hash=None):
+        """
+        Reads a voice file from MinIO and computes the SHA-256 of its content.
+
+        Args:
+        - context (dict): The context dictionary passed by Airflow.
+        - voice_file_id (str): The ID of the voice file.
+        - expected_hash (str, optional): The SHA-256 computed by the API while the file was uploaded.
+
+        Returns:
+        - tuple: The content of the file and its SHA-256.
+        """
+        file_data = self._read_file_from_minio(context, voice_file_id)
+        content_hash = sha256_digest(file_data)
+        if expected_hash and content_hash != expected_hash:
+            # The stored object is not the one uploaded, retrying cannot fix it
+            error_message = f"Integrity check of voice file {voice_file_id} failed: SHA-256 {content_hash}, expected {expected_hash}"
+            self._log_to_mongodb(error_message, context, "ERROR")
+            raise AirflowFailException(error_message)
+        return file_data, content_hash
+
+    def _embed_samples(self, context, voice_file_ids, content_hashes=None):
+        """
+        Generate the embeddings of several voice samples with a single forward pass of the encoder.
+
+        Samples found in the embedding cache are not decoded again, and when the API
+        sent the SHA-256 of the samples they are not even downloaded; the others are
+        preprocessed one by one and embedded together.
+
+        Args:
+        - context (dict): The context dictionary passed by Airflow.
+        - voice_file_ids (list[str]): The IDs of the voice files of the samples.
+        - content_hashes (list[str], optional): The SHA-256 of the samples, computed during the upload.
+
+        Returns:
+        - np.ndarray: A (samples, 256) array with the embedding of every sample.
+        """
+        cache_version = f"{get_encoder_model_version()}+{get_preprocessing_signature()}"
+        embedding_cache = get_embedding_cache()
+        embeddings = [None] * len(voice_file_ids)
+        wavs, pending = [], []
+        for position, voice_file_id in enumerate(voice_file_ids):
+            expected_hash = content_hashes[position] if content_hashes else None
+            if expected_hash and embedding_cache:
+                embeddings[position] = embedding_cache.get(expected_hash, cache_version)
+                if embeddings[position] is not None:
+                    continue
+            file_data, content_hash = self._read_voice_file(context, voice_file_id, expected_hash)
+            if not expected_hash and embedding_cache:
+                embeddings[position] = embedding_cache.get(content_hash, cache_version)
+                if embeddings[position] is not None:
+                    continue
+            try:
+                wav, sampling_rate = decode_waveform(file_data)
+                wav, preprocessing_report = trim_voice_activity(wav, sampling_rate)
+            except VoiceInputTooLongError as e:
+                # Retrying cannot make the recording shorter
+                self._log_to_mongodb(f"Sample {voice_file_id}: {e}", context, "ERROR")
+                raise AirflowFailException(str(e))
+            self._log_to_mongodb(f"Preprocessing report of sample {voice_file_id}: {preprocessing_report}", context, "INFO")
+            wavs.append(preprocess_wav(wav, source_sr=sampling_rate))
+            pending.append((position, content_hash))
+        if wavs:
+            for (position, content_hash), embedding in zip(pending, embed_utterances(get_voice_encoder(), wavs)):
+                embeddings[position] = embedding
+                if embedding_cache:
+                    embedding_cache.set(content_hash, cache_version, embedding)
+        self._log_to_mongodb(f"{len(voice_file_ids)} samples embedded, {len(voice_file_ids) - len(wavs)} from the cache", context, "INFO")
+        return np.stack(embeddings)
 
     def execute(self, context):
         """
@@ -64,17 +168,69 @@ class GenerateVoiceEmbeddingsOperator(BaseCustomOperator):
         # Get the configuration passed to the DAG from the execution context
         dag_run_conf = context['dag_run'].conf
 
+        # Several samples are compacted into a single centroid
+        voice_file_ids = dag_run_conf.get('voice_file_ids')
+        if voice_file_ids:
+            if len(voice_file_ids) > ENROLLMENT_MAX_SAMPLES:
+                error_message = f"{len(voice_file_ids)} samples received, at most {ENROLLMENT_MAX_SAMPLES} are accepted"
+                self._log_to_mongodb(error_message, context, "ERROR")
+                raise AirflowFailException(error_message)
+            sample_embeddings = self._embed_samples(context, voice_file_ids, dag_run_conf.get('content_hashes'))
+            centroid, mean_norm, sample_count = compute_centroid(sample_embeddings)
+            model_version = get_encoder_model_version()
+            self._log_to_mongodb(f"Execution of GenerateVoiceEmbeddingsOperator completed with a centroid of {sample_count} samples, encoder model {model_version}", context, "INFO")
+            return {
+                "voice_file_id": dag_run_conf.get('voice_file_id'),
+                "embeddings": centroid,
+                "model_version": model_version,
+                "sample_ids": list(voice_file_ids),
+                "sample_embeddings": sample_embeddings,
+                "sample_count": sample_count,
+                "mean_norm": mean_norm
+            }
+
         # Get the user_id from the configuration
         voice_file_id = dag_run_conf['voice_file_id']
         self._log_to_mongodb(f"Received voice_file_id: {voice_file_id}", context, "INFO")
-        self._log_to_mongodb(f"Attempting to download file '{voice_file_id}' from MinIO...", context, "INFO")
-        # Download the file from MinIO and get the file path
-        file_path = self._download_file_from_minio(context, voice_file_id)
 
-        # Preprocess the audio file and generate embeddings
-        embeddings = self._process_audio(file_path)
+        # Look up the embeddings of the same audio content before decoding it. Cached
+        # entries are tagged with the model version and the preprocessing settings.
+        # With the SHA-256 computed by the API during the upload, a hit skips the download.
+        content_hash = dag_run_conf.get('content_hash')
+        model_version = get_encoder_model_version()
+        cache_version = f"{model_version}+{get_preprocessing_signature()}"
+        embedding_cache = get_embedding_cache()
+        embeddings = embedding_cache.get(content_hash, cache_version) if embedding_cache and content_hash else None
+        if embeddings is None:
+            # Read the file from MinIO into memory
+            file_data, content_hash = self._read_voice_file(context, voice_file_id, content_hash)
+            embeddings = embedding_cache.get(content_hash, cache_version) if embedding_cache else None
+        preprocessing_report = None
+        if embeddings is not None:
+            cache_status = "hit"
+        else:
+            cache_status = "miss"
+            # Preprocess the audio file and generate embeddings
+            try:
+                embeddings, preprocessing_report = self._process_audio(file_data)
+            except VoiceInputTooLongError as e:
+                # Retrying cannot make the recording shorter
+                self._log_to_mongodb(str(e), context, "ERROR")
+                raise AirflowFailException(str(e))
+            self._log_to_mongodb(f"Preprocessing report: {preprocessing_report}", context, "INFO")
+            if embedding_cache:
+                embedding_cache.set(content_hash, cache_version, embeddings)
+        if embedding_cache:
+            self._log_to_mongodb(f"Embedding cache {cache_status} for content hash {content_hash}, stats: {embedding_cache.stats()}", context, "INFO")
 
         # Log the end of the execution
-        self._log_to_mongodb(f"Execution of GenerateVoiceEmbeddingsOperator completed", context, "INFO")
-
-        return {"voice_file_id": str(voice_file_id), "embeddings": embeddings}
+        self._log_to_mongodb(f"Execution of GenerateVoiceEmbeddingsOperator completed with encoder model {model_version}", context, "INFO")
+
+        return {
+            "voice_file_id": str(voice_file_id),
+            "embeddings": embeddings,
+            "model_version": model_version,
+            "content_hash": content_hash,
+            "embedding_cache": cache_status,
+            "preprocessing": preprocessing_report
+        }
@@ -0,0 +1,64 @@
+from operators.base_qdrant_custom_operator import BaseQdrantCustomOperator
+from helpers.qdrant_helpers import (
+    create_voice_collection, ensure_payload_indexes, get_collection_settings, migrate_voice_collection, resolve_collection_name
+)
+
+class MigrateQdrantCollectionOperator(BaseQdrantCustomOperator):
+    """
+    Custom Airflow operator to migrate the voice collection to the configured QDrant settings.
+
+    The HNSW parameters, on-disk storage and quantization of an existing collection are
+    compared with the configuration and only the differences are applied, and the missing
+    payload indexes are created. A missing collection is created with the configured settings.
+
+    Args:
+    - qdrant_uri (str): The URI of the QDrant server.
+    - qdrant_api_key (str): The API key for accessing the QDrant server.
+    - qdrant_collection (str): The name of the collection to migrate.
+    """
+
+    def execute(self, context):
+        """
+        Execute the operator, migrating the collection to the configured settings.
+
+        The DAG run configuration may set 'dry_run' to only report the differences.
+
+        Args:
+        - context (dict): The context dictionary passed by Airflow.
+
+        Returns:
+        - dict: The settings that changed, with their previous and new values.
+        """
+        # Log the start of the execution
+        self._log_to_mongodb(f"Starting execution of MigrateQdrantCollectionOperator", context, "INFO")
+        dry_run = bool((context['dag_run'].conf or {}).get('dry_run', False))
+        settings = get_collection_settings()
+        client = self._get_qdrant_client()
+        try:
+            # The configured name may be the alias of a versioned collection
+            collection_name = resolve_collection_name(client, self.qdrant_collection)
+            collection_names = [collection.name for collection in client.get_collections().collections]
+            if collection_name not in collection_names:
+                self._log_to_mongodb(f"Collection {collection_name} does not exist, creating it with settings {settings}", context, "INFO")
+                if not dry_run:
+                    create_voice_collection(client, collection_name, settings)
+                changes = {}
+            else:
+                changes = migrate_voice_collection(client, collection_name, settings, dry_run=dry_run)
+                for name, (current, desired) in changes.items():
+                    self._log_to_mongodb(f"Collection setting {name}: {current} -> {desired}{' (dry run)' if dry_run else ''}", context, "INFO")
+                if not dry_run:
+                    created_indexes = ensure_payload_indexes(client, collection_name)
+                    if created_indexes:
+                        self._log_to_mongodb(f"Created payload indexes: {created_indexes}", context, "INFO")
+        except Exception as e:
+            self._log_to_mongodb(f"Error while migrating QDrant collection {self.qdrant_collection}: {str(e)}", context, "ERROR")
+            raise
+        # Log the end of the execution
+        self._log_to_mongodb(f"Execution of MigrateQdrantCollectionOperator completed with {len(changes)} setting(s) changed", context, "INFO")
+        return {"result": {
+            "type": "collection_migration",
+            "collection": collection_name,
+            "dry_run": dry_run,
+            "changes": {name: {"current": current, "desired": desired} for name, (current, desired) in changes.items()}
+        }}
@@ -37,7 +37,7 @@ class ProcessResultWebhookOperator(BaseCustomOperator):
         dag_run_conf = context['dag_run'].conf
         result_webhook = dag_run_conf.get('result_webhook')
 
-        tasks = ['register_voice_id_task', 'verify_voice_id_task', 'change_voice_id_verification_state_task']
+        tasks = ['register_voice_id_task', 'verify_voice_id_task', 'change_voice_id_verification_state_task', 'update_voice_centroid_task']
         args_list = [context['task_instance'].xcom_pull(task_ids=task) for task in tasks]
         
         # Retrieve and combine result data from specified tasks
@@ -1,8 +1,7 @@
-from airflow.utils.decorators import apply_defaults
-from operators.base_custom_operator import BaseCustomOperator
-from qdrant_client import QdrantClient, http
+from operators.base_qdrant_custom_operator import BaseQdrantCustomOperator
+from helpers.qdrant_helpers import build_identity_payload
 
-class QDrantEmbeddingsOperator(BaseCustomOperator):
+class QDrantEmbeddingsOperator(BaseQdrantCustomOperator):
     """
     Custom Apache Airflow operator for upserting voice embeddings into the QDrant vector database.
     
@@ -12,59 +11,32 @@ class QDrantEmbeddingsOperator(BaseCustomOperator):
     :type qdrant_api_key: str
     :param qdrant_collection: The name of the collection in which the embeddings will be upserted.
     :type qdrant_collection: str
-    """
 
-    @apply_defaults
-    def __init__(
-        self,
-        qdrant_uri,
-        qdrant_api_key,
-        qdrant_collection,
-        *args, **kwargs
-    ):
-        super().__init__(*args, **kwargs)
-        self.qdrant_uri = qdrant_uri
-        self.qdrant_api_key = qdrant_api_key
-        self.qdrant_collection = qdrant_collection
+    When the embeddings are the centroid of several samples, the number of samples and the
+    norm of their mean are stored in the payload, so samples added later update the
+    centroid incrementally, and the sample embeddings are kept in the samples collection.
+    """
 
-    def _initialize_qdrant_client(self):
-        """
-        Initialize the QDrant client with the provided URI and API key.
-        
-        :return: Initialized QDrant client.
+    def _resolve_user_id(self, context, voice_file_id):
         """
-        # Initialize QDrant client
-        return QdrantClient(url=self.qdrant_uri, api_key=self.qdrant_api_key)
+        Resolve the ID of the user owning the voice file.
 
-    def _create_or_verify_collection(self, client):
-        """
-        Create or verify the existence of the specified collection in QDrant.
-        
-        :param client: Initialized QDrant client.
-        """
-        # Get collections response
-        collections_response = client.get_collections()
-        # Extract collection names
-        collection_names = [collection.name for collection in collections_response.collections]
-        print(collection_names)
-        if self.qdrant_collection not in collection_names:
-            # Create a collection with specified parameters
-            vectors_config = http.models.VectorParams(
-                size=256,  # Size required for embeddings from resemblyzer
-                distance=http.models.Distance.COSINE
-            )
-            client.create_collection(self.qdrant_collection, vectors_config)
-            
-    def _upsert_embeddings(self, client, id, embeddings):
-        """
-        Upsert the provided embeddings into the specified collection in QDrant.
-        
-        :param client: Initialized QDrant client.
-        :param id: Unique identifier for the embeddings.
-        :param embeddings: List of voice embeddings.
+        The ID is passed in the DAG run configuration; runs triggered without it fall back
+        to a MongoDB lookup by voice ID.
+
+        :param context: Task execution context.
+        :param voice_file_id: The ID of the voice file.
+        :return: The user ID.
         """
-        # Upsert embeddings into the collection
-        client.upsert(self.qdrant_collection, [{"id": id, "vector": embeddings.tolist()}])
+        user_id = context['dag_run'].conf.get('user_id')
+        if user_id:
+            return str(user_id)
+        user_info = self._find_user_by_voice_id(voice_file_id)
+        if user_info is None:
+            error_message = f"No user found for voice ID {voice_file_id}"
+            self._log_to_mongodb(error_message, context, "ERROR")
+            raise ValueError(error_message)
+        return str(user_info["_id"])
 
     def execute(self, context):
        """
@@ -90,14 +62,25 @@ class QDrantEmbeddingsOperator(BaseCustomOperator):
 
        self._log_to_mongodb(f"Received voice_file_id: {voice_file_id}", context, "INFO")
        try:
-            # Initialize QDrant client
-            client = self._initialize_qdrant_client()
+            # Get the vector store of the voice collection
+            store = self._get_vector_store()
 
-            # Create or verify the existence of the collection
-            self._create_or_verify_collection(client)
+            # Create the collection unless this process already knows it exists
+            store.ensure_collection()
 
-            # Upsert embeddings into the collection
-            self._upsert_embeddings(client, voice_file_id, embeddings)
+            # Upsert embeddings into the collection, along with the identity they belong to
+            user_id = self._resolve_user_id(context, voice_file_id)
+            payload = build_identity_payload(
+                user_id,
+                enabled=True,
+                model_version=args.get('model_version'),
+                sample_count=args.get('sample_count', 1),
+                mean_norm=args.get('mean_norm', 1.0)
+            )
+            store.upsert(voice_file_id, embeddings, payload)
+            if args.get('sample_ids'):
+                self._store_sample_embeddings(context, user_id, voice_file_id, args['sample_ids'],
+                                              args['sample_embeddings'], args.get('model_version'))
             # Log success
             self._log_to_mongodb(f"Embeddings successfully upserted into QDrant", context, "INFO")
        except Exception as e:
@@ -0,0 +1,306 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from airflow.utils.decorators import apply_defaults
+from operators.base_qdrant_custom_operator import BaseQdrantCustomOperator
+from qdrant_client.http import models
+from helpers.audio_helpers import read_object_bytes
+from helpers.centroid_helpers import compute_centroid
+from helpers.encoder_helpers import get_encoder_model_version
+from helpers.qdrant_helpers import (
+    build_identity_payload, create_voice_collection, get_alias_target, get_next_collection_version, switch_collection_alias
+)
+from helpers.reembedding_helpers import (
+    REEMBEDDING_CATCHUP_SECONDS, REEMBEDDING_JOBS_COLLECTION, REEMBEDDING_MAX_WORKERS, REEMBEDDING_PAGE_SIZE,
+    create_embedding_pool, embed_voice_audio
+)
+
+class ReembedVoicesOperator(BaseQdrantCustomOperator):
+    """
+    Custom Airflow operator to rebuild every stored voice embedding with the current encoder settings.
+
+    The original audio samples of every enrolled user are streamed from MinIO and embedded by a pool
+    of processes into a new versioned collection, '<collection>_v<version>', while the
+    current collection keeps serving authentication. Once every user is embedded, the
+    'enabled' state of the identities is copied over and the collection alias the
+    operators use is switched to the new collection in one atomic request. Users whose
+    registration completed around the switch are embedded again afterwards, and voices
+    whose audio cannot be embedded again keep their current vector. Only users with a
+    voice point in the live collection are embedded, so users whose registration never
+    stored one do not get an identity, and no collection is ever deleted.
+
+    Progress is checkpointed in MongoDB after every page of users, so a failed run is
+    resumed by the next one. Nothing is written to the blockchain.
+
+    Args:
+    - qdrant_uri (str): The URI of the QDrant server.
+    - qdrant_api_key (str): The API key for accessing the QDrant server.
+    - qdrant_collection (str): The name of the alias the operators use for the voice collection.
+    - max_workers (int): Number of embedding processes.
+    - page_size (int): Number of users embedded and checkpointed at once.
+    """
+
+    @apply_defaults
+    def __init__(
+        self,
+        qdrant_uri,
+        qdrant_api_key,
+        qdrant_collection,
+        max_workers=REEMBEDDING_MAX_WORKERS,
+        page_size=REEMBEDDING_PAGE_SIZE,
+        *args, **kwargs
+    ):
+        """
+        Initialize the operator with the required parameters.
+
+        Args:
+        - qdrant_uri (str): The URI of the QDrant server.
+        - qdrant_api_key (str): The API key for accessing the QDrant server.
+        - qdrant_collection (str): The name of the alias the operators use for the voice collection.
+        - max_workers (int): Number of embedding processes.
+        - page_size (int): Number of users embedded and checkpointed at once.
+
+        Inherits:
+        - *args: Additional arguments.
+        - **kwargs: Additional keyword arguments.
+        """
+        super().__init__(qdrant_uri, qdrant_api_key, qdrant_collection, *args, **kwargs)
+        self.max_workers = int(max_workers)
+        self.page_size = int(page_size)
+
+    def _start_job(self, context, client, jobs):
+        """
+        Resume the unfinished re-embedding job of the collection, or create the versioned collection of a new one.
+
+        Returns:
+        - dict: The job document.
+        """
+        job = jobs.find_one({"alias": self.qdrant_collection, "status": {"$ne": "completed"}})
+        if job is not None:
+            self._log_to_mongodb(f"Resuming re-embedding into {job['_id']} ({job['status']}) after {job['processed']} users", context, "INFO")
+            return job
+        version = (context['dag_run'].conf or {}).get('version') or get_next_collection_version(client, self.qdrant_collection)
+        job = {
+            "_id": f"{self.qdrant_collection}_v{int(version)}",
+            "alias": self.qdrant_collection,
+            "status": "embedding",
+            "model_version": get_encoder_model_version(),
+            "last_user_id": None,
+            "processed": 0,
+            "failed": 0,
+            "started_at": datetime.now(timezone.utc)
+        }
+        create_voice_collection(client, job["_id"])
+        jobs.insert_one(job)
+        self._log_to_mongodb(f"Re-embedding the voices of {self.qdrant_collection} into {job['_id']}", context, "INFO")
+        return job
+
+    def _fetch_audio(self, minio_client, voice_id):
+        try:
+            return read_object_bytes(minio_client.get_object(self.minio_bucket_name, voice_id))
+        except Exception as e:
+            return e
+
+    def _retrieve_current_points(self, client, source_collections, voice_ids, with_vectors=False):
+        """
+        Fetch the current points of voices, each from the first source collection holding it.
+
+        Returns:
+        - dict: The points by voice ID, without the voices stored in none of the collections.
+        """
+        points = {}
+        for collection_name in source_collections:
+            missing_voice_ids = [voice_id for voice_id in voice_ids if voice_id not in points]
+            if not missing_voice_ids:
+                break
+            for point in client.retrieve(collection_name, missing_voice_ids, with_payload=True, with_vectors=with_vectors):
+                points[str(point.id)] = point
+        return points
+
+    def _reembed_users(self, context, client, minio_client, jobs, job, after_user_id, source_collections, checkpoint=True):
+        """
+        Embed the users registered after a user ID into the versioned collection, page by page.
+
+        The audio of a page is downloaded by threads and handed to the process pool as
+        each download completes; the embeddings are upserted with the identity payload
+        of the current collection, so the state of the identities is preserved. Users
+        without a point in the source collections are skipped.
+
+        Args:
+        - after_user_id (ObjectId, optional): The users after this ID are embedded, all of them if None.
+        - source_collections (list[str]): The collections holding the current points, by precedence.
+        - checkpoint (bool): Whether the progress is saved to the job after every page.
+
+        Returns:
+        - tuple: The number of users embedded and failed.
+        """
+        users = self._get_mongodb_collection()
+        query = {"voice_id": {"$exists": True}}
+        if after_user_id is not None:
+            query["_id"] = {"$gt": after_user_id}
+        total = users.count_documents(query)
+        processed, failed, skipped = 0, 0, 0
+        if total == 0:
+            return processed, failed
+        start_time = time.perf_counter()
+        with create_embedding_pool(self.max_workers) as embedding_pool, \
+                ThreadPoolExecutor(max_workers=self.max_workers * 2, thread_name_prefix="reembedding-fetch") as fetch_pool:
+            while True:
+                page = list(users.find(query, {"_id": 1, "voice_id": 1, "sample_ids": 1, "timestamp": 1}).sort("_id", 1).limit(self.page_size))
+                if not page:
+                    break
+                after_user_id = page[-1]["_id"]
+                current_points = self._retrieve_current_points(client, source_collections, [user["voice_id"] for user in page])
+                current_payloads = {voice_id: point.payload or {} for voice_id, point in current_points.items()}
+                # Users without a current point never completed their registration, or were
+                # removed, and must not get an enabled identity in the new collection
+                embedded_users = [user for user in page if user["voice_id"] in current_payloads]
+                skipped += len(page) - len(embedded_users)
+
+                # Users enrolled with several samples get the centroid of all of them
+                sample_ids = [user.get("sample_ids") or [user["voice_id"]] for user in embedded_users]
+                embeddings = iter([
+                    audio if isinstance(audio, Exception) else embedding_pool.submit(embed_voice_audio, audio)
+                    for audio in fetch_pool.map(lambda sample_id: self._fetch_audio(minio_client, sample_id),
+                                                [sample_id for user_sample_ids in sample_ids for sample_id in user_sample_ids])
+                ])
+                points, failed_voice_ids = [], []
+                for user, user_sample_ids in zip(embedded_users, sample_ids):
+                    user_embeddings = [next(embeddings) for _ in user_sample_ids]
+                    try:
+                        vectors = []
+                        for embedding in user_embeddings:
+                            if isinstance(embedding, Exception):
+                                raise embedding
+                            vectors.append(embedding.result())
+                    except Exception as e:
+                        failed_voice_ids.append(user["voice_id"])
+                        self._log_to_mongodb(f"Re-embedding of voice {user['voice_id']} of user {user['_id']} failed: {e}", context, "WARNING")
+                        continue
+                    centroid, mean_norm, sample_count = compute_centroid(vectors)
+                    current_payload = current_payloads[user["voice_id"]]
+                    registered_at = user.get("timestamp")
+                    points.append(models.PointStruct(id=user["voice_id"], vector=centroid.tolist(), payload=build_identity_payload(
+                        user["_id"],
+                        enabled=current_payload.get("enabled", True),
+                        model_version=job["model_version"],
+                        enrolled_at=current_payload.get("enrolled_at") or (registered_at.replace(tzinfo=timezone.utc).timestamp() if registered_at else None),
+                        sample_count=sample_count,
+                        mean_norm=mean_norm
+                    )))
+                # Voices that cannot be embedded again keep their current vector, so their
+                # owners can still authenticate after the switch
+                if failed_voice_ids:
+                    points.extend(
+                        models.PointStruct(id=point.id, vector=point.vector, payload=point.payload)
+                        for point in self._retrieve_current_points(client, source_collections, failed_voice_ids, with_vectors=True).values()
+                    )
+                if points:
+                    client.upsert(job["_id"], points, wait=True)
+                failed += len(failed_voice_ids)
+                processed += len(embedded_users) - len(failed_voice_ids)
+                query["_id"] = {"$gt": after_user_id}
+                if checkpoint:
+                    job.update({"last_user_id": after_user_id, "processed": job["processed"] + len(embedded_users) - len(failed_voice_ids),
+                                "failed": job["failed"] + len(failed_voice_ids)})
+                    jobs.update_one({"_id": job["_id"]}, {"$set": {key: job[key] for key in ("last_user_id", "processed", "failed")}})
+                elapsed = time.perf_counter() - start_time
+                self._log_to_mongodb(f"{processed + failed + skipped}/{total} users re-embedded into {job['_id']} in {elapsed:.1f} s "
+                                     f"({processed / elapsed:.1f} points/s), {failed} failed, {skipped} skipped without a current point", context, "INFO")
+        return processed, failed
+
+    def _copy_identity_states(self, client, source_collection, target_collection):
+        """
+        Copy the 'enabled' state of every identity of the current collection to the versioned one.
+
+        Identities enabled or disabled while the job was running keep their latest state.
+
+        Returns:
+        - int: The number of voices whose state was copied.
+        """
+        copied, offset = 0, None
+        while True:
+            points, offset = client.scroll(source_collection, limit=1024, offset=offset, with_payload=["enabled"], with_vectors=False)
+            present = {str(point.id) for point in client.retrieve(target_collection, [point.id for point in points], with_payload=False, with_vectors=False)}
+            states = {True: [], False: []}
+            for point in points:
+                if str(point.id) in present:
+                    states[(point.payload or {}).get("enabled", True) is not False].append(point.id)
+            operations = [
+                models.SetPayloadOperation(set_payload=models.SetPayload(payload={"enabled": enabled}, points=point_ids))
+                for enabled, point_ids in states.items() if point_ids
+            ]
+            if operations:
+                client.batch_update_points(target_collection, update_operations=operations, wait=True)
+                copied += sum(len(point_ids) for point_ids in states.values())
+            if offset is None:
+                return copied
+
+    def execute(self, context):
+        """
+        Execute the operator, re-embedding every enrolled voice and switching the collection alias.
+
+        The DAG run configuration may set 'version' to choose the version of the new collection.
+
+        Args:
+        - context (dict): The context dictionary passed by Airflow.
+
+        Returns:
+        - dict: The new and previous collections, the users re-embedded and the throughput.
+        """
+        # Log the start of the execution
+        self._log_to_mongodb(f"Starting execution of ReembedVoicesOperator", context, "INFO")
+        client = self._get_qdrant_client()
+        minio_client = self._get_minio_client(context)
+        jobs = self._get_mongodb_collection(REEMBEDDING_JOBS_COLLECTION)
+        job = self._start_job(context, client, jobs)
+        start_time = time.perf_counter()
+        processed_before = job["processed"]
+
+        if job["status"] == "embedding":
+            # The alias resolves to the live collection on every request
+            self._reembed_users(context, client, minio_client, jobs, job, job["last_user_id"], [self.qdrant_collection])
+            job["status"] = "cutover"
+            jobs.update_one({"_id": job["_id"]}, {"$set": {"status": job["status"]}})
+
+        previous_collection = get_alias_target(client, self.qdrant_collection)
+        if previous_collection != job["_id"]:
+            copied = self._copy_identity_states(client, previous_collection, job["_id"])
+            self._log_to_mongodb(f"Copied the state of {copied} identities from {previous_collection} to {job['_id']}", context, "INFO")
+            switch_collection_alias(client, self.qdrant_collection, job["_id"])
+            cutover_at = datetime.now(timezone.utc)
+            jobs.update_one({"_id": job["_id"]}, {"$set": {"previous_collection": previous_collection, "cutover_at": cutover_at}})
+            self._log_to_mongodb(f"Alias {self.qdrant_collection} switched from {previous_collection} to {job['_id']}", context, "INFO")
+        else:
+            previous_collection = job.get("previous_collection")
+            cutover_at = job.get("cutover_at") or datetime.now(timezone.utc)
+
+        # Registrations that upserted into the previous collection just before the switch
+        catchup_from = ObjectId.from_datetime(cutover_at - timedelta(seconds=REEMBEDDING_CATCHUP_SECONDS))
+        if job["last_user_id"] is not None and job["last_user_id"] < catchup_from:
+            catchup_from = job["last_user_id"]
+        # Their points live in the new collection if they registered after the switch, in the previous one otherwise
+        source_collections = [job["_id"]] + ([previous_collection] if previous_collection else [])
+        caught_up, _ = self._reembed_users(context, client, minio_client, jobs, job, catchup_from, source_collections, checkpoint=False)
+        jobs.update_one({"_id": job["_id"]}, {"$set": {"status": "completed", "completed_at": datetime.now(timezone.utc)}})
+        elapsed = time.perf_counter() - start_time
+        processed = job["processed"] - processed_before
+
+        # Log the end of the execution
+        self._log_to_mongodb(f"Execution of ReembedVoicesOperator completed: {job['processed']} users in {job['_id']}, "
+                             f"{job['failed']} failed, {caught_up} caught up after the switch", context, "INFO")
+        if previous_collection is not None:
+            self._log_to_mongodb(f"Previous collection {previous_collection} is kept for rollback", context, "INFO")
+        return {"result": {
+            "type": "voice_reembedding",
+            "collection": job["_id"],
+            "previous_collection": previous_collection,
+            "model_version": job["model_version"],
+            "reembedded": job["processed"],
+            "failed": job["failed"],
+            "caught_up": caught_up,
+            "seconds": round(elapsed, 3),
+            "points_per_second": round(processed / elapsed, 2) if elapsed else 0.0
+        }}
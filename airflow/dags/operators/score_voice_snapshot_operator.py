@@ -0,0 +1,93 @@
+import csv
+import os
+import time
+
+from airflow.utils.decorators import apply_defaults
+from operators.base_custom_operator import BaseCustomOperator
+from helpers.snapshot_helpers import VoiceSnapshot, iter_top_k_neighbours
+
+class ScoreVoiceSnapshotOperator(BaseCustomOperator):
+    """
+    Custom Airflow operator to find, in a voice snapshot, the voices of different users that are too similar.
+
+    The voices exported by the previous task are compared with every voice of the snapshot
+    with a blocked similarity sweep, and the neighbours reaching the minimum score are
+    written to a 'neighbours-<segment>.csv' file of the snapshot, for duplicate identity
+    review. Voices exported by earlier runs were already compared with each other.
+
+    Args:
+    - top_k (int): Number of neighbours kept per voice.
+    - min_score (float): Minimum cosine similarity of the neighbours written.
+    - block_size (int): Number of voices per block of the sweep.
+    """
+
+    @apply_defaults
+    def __init__(
+        self,
+        top_k=10,
+        min_score=0.75,
+        block_size=2048,
+        *args, **kwargs
+    ):
+        """
+        Initialize the operator with the required parameters.
+
+        Args:
+        - top_k (int): Number of neighbours kept per voice.
+        - min_score (float): Minimum cosine similarity of the neighbours written.
+        - block_size (int): Number of voices per block of the sweep.
+
+        Inherits:
+        - *args: Additional arguments.
+        - **kwargs: Additional keyword arguments.
+        """
+        super().__init__(*args, **kwargs)
+        self.top_k = int(top_k)
+        self.min_score = float(min_score)
+        self.block_size = int(block_size)
+
+    def execute(self, context):
+        """
+        Execute the operator, scoring the voices exported by the export task.
+
+        The DAG run configuration may set 'full' to compare every voice of the snapshot.
+
+        Args:
+        - context (dict): The context dictionary passed by Airflow.
+
+        Returns:
+        - dict: The neighbours file, the voices compared and the pairs found.
+        """
+        # Log the start of the execution
+        self._log_to_mongodb(f"Starting execution of ScoreVoiceSnapshotOperator", context, "INFO")
+        export = (context['task_instance'].xcom_pull(task_ids='export_voice_snapshot_task') or {}).get('result') or {}
+        if not export.get('segment'):
+            self._log_to_mongodb(f"Execution of ScoreVoiceSnapshotOperator completed, no new voices to score", context, "INFO")
+            return {"result": {"type": "voice_snapshot_scoring", "neighbours_file": None, "scored": 0, "pairs": 0}}
+
+        snapshot = VoiceSnapshot(export['snapshot'])
+        query_start = 0 if (context['dag_run'].conf or {}).get('full') else export['previous_rows']
+        neighbours_path = os.path.join(export['snapshot'], f"neighbours-{export['segment']}.csv")
+        scored, pairs = 0, 0
+        start_time = time.perf_counter()
+        with open(neighbours_path, "w", newline="") as neighbours_file:
+            writer = csv.writer(neighbours_file)
+            writer.writerow(["voice_id", "user_id", "neighbour_voice_id", "neighbour_user_id", "score"])
+            for voice_id, user_id, neighbours in iter_top_k_neighbours(snapshot, k=self.top_k, block_size=self.block_size,
+                                                                       min_score=self.min_score, query_start=query_start):
+                scored += 1
+                for neighbour_voice_id, neighbour_user_id, score in neighbours:
+                    writer.writerow([voice_id, user_id, neighbour_voice_id, neighbour_user_id, round(score, 6)])
+                    pairs += 1
+        elapsed = time.perf_counter() - start_time
+
+        # Log the end of the execution
+        self._log_to_mongodb(f"Execution of ScoreVoiceSnapshotOperator completed: {scored} voices compared with {len(snapshot)} "
+                             f"in {elapsed:.1f} s, {pairs} pairs above {self.min_score}", context, "INFO")
+        return {"result": {
+            "type": "voice_snapshot_scoring",
+            "neighbours_file": neighbours_path,
+            "scored": scored,
+            "pairs": pairs,
+            "seconds": round(elapsed, 3)
+        }}
@@ -0,0 +1,76 @@
+from airflow.exceptions import AirflowFailException
+from operators.base_qdrant_custom_operator import BaseQdrantCustomOperator
+from helpers.centroid_helpers import update_centroid
+
+class UpdateVoiceCentroidOperator(BaseQdrantCustomOperator):
+    """
+    Custom Airflow operator to add new voice samples to the centroid of an enrolled user.
+
+    The stored centroid is updated with the embeddings of the new samples only, using the
+    number of samples and the norm of their mean kept in its payload, so the samples
+    already enrolled are never embedded again. The centroid keeps its point ID, which is
+    the voice ID registered on the blockchain.
+
+    Args:
+    - qdrant_uri (str): The URI of the QDrant server.
+    - qdrant_api_key (str): The API key for accessing the QDrant server.
+    - qdrant_collection (str): The name of the collection holding the voice embeddings.
+    """
+
+    def execute(self, context):
+        """
+        Execute the operator, updating the centroid of the user given in the DAG run configuration.
+
+        Args:
+        - context (dict): The context dictionary passed by Airflow.
+
+        Returns:
+        - dict: The result of the enrollment, with the new number of samples.
+        """
+        # Log the start of the execution
+        self._log_to_mongodb(f"Starting execution of UpdateVoiceCentroidOperator", context, "INFO")
+        user_id = context['dag_run'].conf.get('user_id')
+        args = context['task_instance'].xcom_pull(task_ids='generate_voice_embedding_task')
+        sample_ids = args['sample_ids']
+        model_version = args['model_version']
+
+        user_info = self._get_user_info(context, user_id)
+        voice_id = user_info["voice_id"]
+        store = self._get_vector_store()
+        point = store.retrieve(voice_id)
+        if point is None:
+            error_message = f"No voice stored for user {user_id}"
+            self._log_to_mongodb(error_message, context, "ERROR")
+            raise AirflowFailException(error_message)
+        stored_model_version = point.payload.get("model_version")
+        if stored_model_version and stored_model_version != model_version:
+            # Embeddings of different models cannot be averaged
+            error_message = (f"The voice of user {user_id} was embedded with {stored_model_version} and the new samples with "
+                             f"{model_version}; re-embed the collection before adding samples")
+            self._log_to_mongodb(error_message, context, "ERROR")
+            raise AirflowFailException(error_message)
+
+        centroid, mean_norm, sample_count = update_centroid(
+            point.vector,
+            point.payload.get("mean_norm", 1.0),
+            point.payload.get("sample_count", 1),
+            args['sample_embeddings']
+        )
+        store.upsert(voice_id, centroid, {**point.payload, "model_version": model_version, "sample_count": sample_count, "mean_norm": mean_norm})
+        self._store_sample_embeddings(context, user_id, voice_id, sample_ids, args['sample_embeddings'], model_version)
+
+        # Users enrolled before multi-sample enrollment have their first sample as voice ID
+        self._get_mongodb_collection().update_one(
+            {"_id": user_info["_id"]},
+            {"$set": {"sample_ids": (user_info.get("sample_ids") or [voice_id]) + list(sample_ids)}}
+        )
+        self._invalidate_user_info(user_id, voice_id)
+
+        # Log the end of the execution
+        self._log_to_mongodb(f"Execution of UpdateVoiceCentroidOperator completed: centroid of user {user_id} updated to {sample_count} samples", context, "INFO")
+        return {"result": {
+            "type": "samples_enrollment",
+            "isSuccess": True,
+            "user_id": str(user_id),
+            "sample_count": sample_count
+        }}
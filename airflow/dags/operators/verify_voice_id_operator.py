@@ -69,11 +69,18 @@ class VerifyVoiceIdOperator(BaseWeb3CustomOperator):
         voice_id = args['voice_matched_id']
         
         if voice_id is None:
-           self._log_to_mongodb("voice_id is not defined - authentication failed", context, "ERROR")
-           return {"result": { "type": "authentication", "result": False}}
-        
-        user_info = self._find_user_by_voice_id(voice_id)
-        user_id = str(user_info["_id"])
+            # No enabled identity matched: fail without querying MongoDB or the Smart Contract
+            self._log_to_mongodb("No matching voice found - authentication failed", context, "INFO")
+            return {"result": {"type": "authentication", "isSuccess": False}}
+
+        # The owner comes from the point payload; points stored without it need a MongoDB lookup
+        user_id = args.get('user_id')
+        if not user_id:
+            user_info = self._find_user_by_voice_id(voice_id)
+            if user_info is None:
+                self._log_to_mongodb(f"No user found for voice ID {voice_id} - authentication failed", context, "ERROR")
+                return {"result": {"type": "authentication", "isSuccess": False}}
+            user_id = str(user_info["_id"])
         # Connect to Web3 provider
         web3 = self._connect_to_web3()
         # Check if the connection to the Web3 provider is successful
@@ -91,12 +98,12 @@ class VerifyVoiceIdOperator(BaseWeb3CustomOperator):
         if result:
             # Generate session token
             session_token = self.generate_jwt(user_id)
-            result = {"result": {
+            result = {
                 "type": "authentication",
                 "isSuccess": True, 
                 "session_token": session_token,
                 "user_id": user_id
-            }}
+            }
         else:
             result = {
                 "type": "authentication",
@@ -49,7 +49,8 @@ with DAG('voice_authentication_dag', default_args=default_args, default_view="gr
         minio_bucket_name=os.environ.get("MINIO_BUCKET_NAME"),
         qdrant_uri=os.environ.get("QDRANT_URI"),
         qdrant_api_key=os.environ.get("QDRANT_API_KEY"),
-        qdrant_collection=os.environ.get("QDRANT_COLLECTION"),
+        qdrant_collection=os.environ.get("QDRANT_COLLECTION_ALIAS"),
+        qdrant_score_threshold=os.environ.get("QDRANT_SCORE_THRESHOLD", "0.75")
     )
 
     # Task to verify the identity using voice authentication
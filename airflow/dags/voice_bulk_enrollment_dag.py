@@ -0,0 +1,56 @@
+from datetime import datetime
+from airflow import DAG
+import importlib
+import os
+
+# Define default arguments for the DAG
+default_args = {
+    'owner': 'airflow',
+    'start_date': datetime(2023, 1, 1),
+    'retries': 0,
+    'logging_level': 'INFO'
+}
+
+# Create the DAG with the specified default arguments
+with DAG('voice_bulk_enrollment_dag', default_args=default_args, default_view="graph", schedule_interval=None, catchup=False) as dag:
+    # Import the necessary operators from external modules
+    operators_module = importlib.import_module('operators.bulk_enroll_voices_operator')
+    BulkEnrollVoicesOperator = operators_module.BulkEnrollVoicesOperator
+    operators_module = importlib.import_module('operators.bulk_register_voice_ids_operator')
+    BulkRegisterVoiceIDsOperator = operators_module.BulkRegisterVoiceIDsOperator
+
+    # Task to store, embed and upsert every sample of the enrollment source
+    bulk_enroll_voices_task = BulkEnrollVoicesOperator(
+        task_id='bulk_enroll_voices_task',
+        mongo_uri=os.environ.get("MONGO_URI"),
+        mongo_db=os.environ.get("MONGO_DB"),
+        mongo_db_collection=os.environ.get("MONGO_DB_COLLECTION"),
+        minio_endpoint=os.environ.get("MINIO_ENDPOINT"),
+        minio_access_key=os.environ.get("MINIO_ACCESS_KEY"),
+        minio_secret_key=os.environ.get("MINIO_SECRET_KEY"),
+        minio_bucket_name=os.environ.get("MINIO_BUCKET_NAME"),
+        qdrant_uri=os.environ.get("QDRANT_URI"),
+        qdrant_api_key=os.environ.get("QDRANT_API_KEY"),
+        qdrant_collection=os.environ.get("QDRANT_COLLECTION_ALIAS"),
+        max_workers=int(os.environ.get("BULK_ENROLLMENT_MAX_WORKERS", "8"))
+    )
+
+    # Task to register the enrolled VoiceIDs on the Smart Contract
+    bulk_register_voice_ids_task = BulkRegisterVoiceIDsOperator(
+        task_id='bulk_register_voice_ids_task',
+        mongo_uri=os.environ.get("MONGO_URI"),
+        mongo_db=os.environ.get("MONGO_DB"),
+        mongo_db_collection=os.environ.get("MONGO_DB_COLLECTION"),
+        minio_endpoint=os.environ.get("MINIO_ENDPOINT"),
+        minio_access_key=os.environ.get("MINIO_ACCESS_KEY"),
+        minio_secret_key=os.environ.get("MINIO_SECRET_KEY"),
+        minio_bucket_name=os.environ.get("MINIO_BUCKET_NAME"),
+        http_provider=os.environ.get("VOICE_ID_VERIFIER_HTTP_PROVIDER"),
+        caller_address=os.environ.get("VOICE_ID_VERIFIER_CALLER_ADDRESS"),
+        caller_private_key=os.environ.get("VOICE_ID_VERIFIER_CALLER_PRIVATE_KEY"),
+        contract_address=os.environ.get("VOICE_ID_VERIFIER_CONTRACT_ADDRESS"),
+        contract_abi=os.environ.get("VOICE_ID_VERIFIER_CONTRACT_ABI_NAME")
+    )
+
+    # Define task dependencies by chaining the tasks in sequence
+    bulk_enroll_voices_task >> bulk_register_voice_ids_task
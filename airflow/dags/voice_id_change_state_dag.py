@@ -35,7 +35,10 @@ with DAG('voice_id_change_state_dag', default_args=default_args, default_view="g
         caller_address=os.environ.get("VOICE_ID_VERIFIER_CALLER_ADDRESS"),
         caller_private_key=os.environ.get("VOICE_ID_VERIFIER_CALLER_PRIVATE_KEY"),
         contract_address=os.environ.get("VOICE_ID_VERIFIER_CONTRACT_ADDRESS"),
-        contract_abi=os.environ.get("VOICE_ID_VERIFIER_CONTRACT_ABI_NAME")
+        contract_abi=os.environ.get("VOICE_ID_VERIFIER_CONTRACT_ABI_NAME"),
+        qdrant_uri=os.environ.get("QDRANT_URI"),
+        qdrant_api_key=os.environ.get("QDRANT_API_KEY"),
+        qdrant_collection=os.environ.get("QDRANT_COLLECTION_ALIAS")
     )
 
     # Task to process the result of changing the verification state and send it to a webhook
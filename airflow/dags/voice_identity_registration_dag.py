@@ -49,7 +49,7 @@ with DAG('voice_identity_registration_dag', default_args=default_args, default_v
         minio_bucket_name=os.environ.get("MINIO_BUCKET_NAME"),
         qdrant_uri=os.environ.get("QDRANT_URI"),
         qdrant_api_key=os.environ.get("QDRANT_API_KEY"),
-        qdrant_collection=os.environ.get("QDRANT_COLLECTION")
+        qdrant_collection=os.environ.get("QDRANT_COLLECTION_ALIAS")
     )
 
     # Define a task to register a VoiceID using a Smart Contract.
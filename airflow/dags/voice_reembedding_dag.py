@@ -0,0 +1,35 @@
+from datetime import datetime
+from airflow import DAG
+import importlib
+import os
+
+# Define default arguments for the DAG
+default_args = {
+    'owner': 'airflow',
+    'start_date': datetime(2023, 1, 1),
+    'retries': 1,
+    'logging_level': 'INFO'
+}
+
+# Create the DAG with the specified default arguments
+with DAG('voice_reembedding_dag', default_args=default_args, default_view="graph", schedule_interval=None, catchup=False, max_active_runs=1) as dag:
+    # Import the necessary operators from external modules
+    operators_module = importlib.import_module('operators.reembed_voices_operator')
+    ReembedVoicesOperator = operators_module.ReembedVoicesOperator
+
+    # Task to re-embed every enrolled voice into a new versioned collection and switch the alias to it
+    reembed_voices_task = ReembedVoicesOperator(
+        task_id='reembed_voices_task',
+        mongo_uri=os.environ.get("MONGO_URI"),
+        mongo_db=os.environ.get("MONGO_DB"),
+        mongo_db_collection=os.environ.get("MONGO_DB_COLLECTION"),
+        minio_endpoint=os.environ.get("MINIO_ENDPOINT"),
+        minio_access_key=os.environ.get("MINIO_ACCESS_KEY"),
+        minio_secret_key=os.environ.get("MINIO_SECRET_KEY"),
+        minio_bucket_name=os.environ.get("MINIO_BUCKET_NAME"),
+        qdrant_uri=os.environ.get("QDRANT_URI"),
+        qdrant_api_key=os.environ.get("QDRANT_API_KEY"),
+        qdrant_collection=os.environ.get("QDRANT_COLLECTION_ALIAS"),
+        max_workers=int(os.environ.get("REEMBEDDING_MAX_WORKERS", "4")),
+        page_size=int(os.environ.get("REEMBEDDING_PAGE_SIZE", "256"))
+    )
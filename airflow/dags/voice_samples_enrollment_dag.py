@@ -0,0 +1,65 @@
+from datetime import datetime
+from airflow import DAG
+import importlib
+import os
+
+# Define default arguments for the DAG
+default_args = {
+    'owner': 'airflow',
+    'start_date': datetime(2023, 1, 1),
+    'retries': 1,
+    'logging_level': 'INFO'
+}
+
+# Create the DAG with the specified default arguments. Runs are serialised so that two
+# runs never update the same centroid concurrently.
+with DAG('voice_samples_enrollment_dag', default_args=default_args, default_view="graph", schedule_interval=None, catchup=False, max_active_runs=1) as dag:
+    # Import the necessary operators from external modules
+    operators_module = importlib.import_module('operators.generate_voice_embeddings_operator')
+    GenerateVoiceEmbeddingsOperator = operators_module.GenerateVoiceEmbeddingsOperator
+    operators_module = importlib.import_module('operators.update_voice_centroid_operator')
+    UpdateVoiceCentroidOperator = operators_module.UpdateVoiceCentroidOperator
+    operators_module = importlib.import_module('operators.process_result_webhook_operator')
+    ProcessResultWebhookOperator = operators_module.ProcessResultWebhookOperator
+
+    # Task to embed the new samples in a single batch
+    generate_voice_embedding_task = GenerateVoiceEmbeddingsOperator(
+        task_id='generate_voice_embedding_task',
+        mongo_uri=os.environ.get("MONGO_URI"),
+        mongo_db=os.environ.get("MONGO_DB"),
+        mongo_db_collection=os.environ.get("MONGO_DB_COLLECTION"),
+        minio_endpoint=os.environ.get("MINIO_ENDPOINT"),
+        minio_access_key=os.environ.get("MINIO_ACCESS_KEY"),
+        minio_secret_key=os.environ.get("MINIO_SECRET_KEY"),
+        minio_bucket_name=os.environ.get("MINIO_BUCKET_NAME")
+    )
+
+    # Task to add the new samples to the stored centroid of the user
+    update_voice_centroid_task = UpdateVoiceCentroidOperator(
+        task_id='update_voice_centroid_task',
+        mongo_uri=os.environ.get("MONGO_URI"),
+        mongo_db=os.environ.get("MONGO_DB"),
+        mongo_db_collection=os.environ.get("MONGO_DB_COLLECTION"),
+        minio_endpoint=os.environ.get("MINIO_ENDPOINT"),
+        minio_access_key=os.environ.get("MINIO_ACCESS_KEY"),
+        minio_secret_key=os.environ.get("MINIO_SECRET_KEY"),
+        minio_bucket_name=os.environ.get("MINIO_BUCKET_NAME"),
+        qdrant_uri=os.environ.get("QDRANT_URI"),
+        qdrant_api_key=os.environ.get("QDRANT_API_KEY"),
+        qdrant_collection=os.environ.get("QDRANT_COLLECTION_ALIAS")
+    )
+
+    # Task to process the result and send it to a webhook
+    process_result_webhook_task = ProcessResultWebhookOperator(
+        task_id='process_result_webhook_task',
+        mongo_uri=os.environ.get("MONGO_URI"),
+        mongo_db=os.environ.get("MONGO_DB"),
+        mongo_db_collection=os.environ.get("MONGO_DB_COLLECTION"),
+        minio_endpoint=os.environ.get("MINIO_ENDPOINT"),
+        minio_access_key=os.environ.get("MINIO_ACCESS_KEY"),
+        minio_secret_key=os.environ.get("MINIO_SECRET_KEY"),
+        minio_bucket_name=os.environ.get("MINIO_BUCKET_NAME")
+    )
+
+    # Define task dependencies by chaining the tasks in sequence
+    generate_voice_embedding_task >> update_voice_centroid_task >> process_result_webhook_task
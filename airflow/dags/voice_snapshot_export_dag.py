@@ -0,0 +1,54 @@
+from datetime import datetime
+from airflow import DAG
+import importlib
+import os
+
+# Define default arguments for the DAG
+default_args = {
+    'owner': 'airflow',
+    'start_date': datetime(2023, 1, 1),
+    'retries': 1,
+    'logging_level': 'INFO'
+}
+
+# Create the DAG with the specified default arguments
+with DAG('voice_snapshot_export_dag', default_args=default_args, default_view="graph", schedule_interval=None, catchup=False) as dag:
+    # Import the necessary operators from external modules
+    operators_module = importlib.import_module('operators.export_voice_snapshot_operator')
+    ExportVoiceSnapshotOperator = operators_module.ExportVoiceSnapshotOperator
+    operators_module = importlib.import_module('operators.score_voice_snapshot_operator')
+    ScoreVoiceSnapshotOperator = operators_module.ScoreVoiceSnapshotOperator
+
+    # Task to export the voices enrolled since the last export into the snapshot
+    export_voice_snapshot_task = ExportVoiceSnapshotOperator(
+        task_id='export_voice_snapshot_task',
+        mongo_uri=os.environ.get("MONGO_URI"),
+        mongo_db=os.environ.get("MONGO_DB"),
+        mongo_db_collection=os.environ.get("MONGO_DB_COLLECTION"),
+        minio_endpoint=os.environ.get("MINIO_ENDPOINT"),
+        minio_access_key=os.environ.get("MINIO_ACCESS_KEY"),
+        minio_secret_key=os.environ.get("MINIO_SECRET_KEY"),
+        minio_bucket_name=os.environ.get("MINIO_BUCKET_NAME"),
+        qdrant_uri=os.environ.get("QDRANT_URI"),
+        qdrant_api_key=os.environ.get("QDRANT_API_KEY"),
+        qdrant_collection=os.environ.get("QDRANT_COLLECTION_ALIAS"),
+        snapshot_dir=os.environ.get("VOICE_SNAPSHOT_DIR", "/usr/local/airflow/data/snapshots"),
+        page_size=int(os.environ.get("VOICE_SNAPSHOT_PAGE_SIZE", "4096"))
+    )
+
+    # Task to find the voices of different users similar enough to be the same identity
+    score_voice_snapshot_task = ScoreVoiceSnapshotOperator(
+        task_id='score_voice_snapshot_task',
+        mongo_uri=os.environ.get("MONGO_URI"),
+        mongo_db=os.environ.get("MONGO_DB"),
+        mongo_db_collection=os.environ.get("MONGO_DB_COLLECTION"),
+        minio_endpoint=os.environ.get("MINIO_ENDPOINT"),
+        minio_access_key=os.environ.get("MINIO_ACCESS_KEY"),
+        minio_secret_key=os.environ.get("MINIO_SECRET_KEY"),
+        minio_bucket_name=os.environ.get("MINIO_BUCKET_NAME"),
+        top_k=int(os.environ.get("VOICE_SNAPSHOT_TOP_K", "10")),
+        min_score=float(os.environ.get("QDRANT_SCORE_THRESHOLD", "0.75"))
+    )
+
+    # Define task dependencies by chaining the tasks in sequence
+    export_voice_snapshot_task >> score_voice_snapshot_task
@@ -1,10 +1,17 @@
 from datetime import datetime, timezone
 from flask import Flask, request
+from pymongo.errors import DuplicateKeyError
+from werkzeug.exceptions import HTTPException
+from werkzeug.middleware.proxy_fix import ProxyFix
 import logging
+import os
 from helpers.jwt_helpers import validate_jwt
-from helpers.mongodb_helpers import delete_user_details, find_user_details, save_user_metadata, find_user_by_email_or_fullname
-from helpers.api_helpers import process_voice_file, create_response, validate_webhook_url
-from helpers.airflow_helpers import trigger_voice_id_change_state_dag, trigger_voice_registration_dag, trigger_voice_authentication_dag
+from helpers.mongodb_helpers import get_mongo_pool_stats, delete_user_details, find_user_details, save_user_metadata, find_claimed_identity, claim_pending_upload, update_pending_upload_status
+from helpers.api_helpers import VoiceUploadRequest, discard_voice_uploads, process_voice_file, process_voice_files, create_response, validate_webhook_url, create_voice_upload, validate_uploaded_voice_file, ENROLLMENT_MAX_SAMPLES, VOICE_UPLOAD_PURPOSES, AUDIO_HEADER_LENGTH
+from helpers.minio_helpers import inspect_pending_upload, commit_pending_upload, delete_pending_upload, delete_files_from_minio
+from helpers.cache_helpers import get_user_metadata_cache
+from helpers.rate_limit_helpers import get_voice_upload_rate_limiter
+from helpers.airflow_helpers import trigger_voice_id_change_state_dag, trigger_voice_registration_dag, trigger_voice_samples_enrollment_dag, trigger_voice_authentication_dag, run_voice_authentication_sync, AUTHENTICATION_MODE
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -12,65 +19,85 @@ logger = logging.getLogger(__name__)
 
 # Base prefix for application routes
 BASE_URL_PREFIX = "/api/voice-passport"
+# Number of reverse proxies in front of the API, like the HAProxy balancer, whose X-Forwarded-For is trusted
+API_TRUSTED_PROXIES = int(os.environ.get("API_TRUSTED_PROXIES", "0"))
 
-# Create a Flask application
+# Create a Flask application whose requests stream uploaded files straight into MinIO
 app = Flask(__name__)
+app.request_class = VoiceUploadRequest
+# The client address, used to rate limit the presigned uploads, is the one seen by the proxies
+if API_TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=API_TRUSTED_PROXIES)
 
 @app.route(f"{BASE_URL_PREFIX}/schedule_user_registration", methods=['POST'])
 def schedule_user_registration():
     data = request.form
-    fullname = data.get('fullname')
-    email = data.get('email')
-    result_webhook = data.get('result_webhook')
+    error_response = _validate_registration_data(data)
+    if error_response:
+        return error_response
 
-    # Validate received data
-    if not all([fullname, email, result_webhook]):
-        logger.error("Missing parameters")
-        return create_response("Error", 400, "Missing parameters: fullname, email, or result_webhook")
+    # Several samples of the voice can be uploaded, they are compacted into a single centroid
+    if len(request.files.getlist('voice_file')) > ENROLLMENT_MAX_SAMPLES:
+        return create_response("Error", 400, f"Too many voice files, at most {ENROLLMENT_MAX_SAMPLES} are allowed")
 
-    # Validate the format of the webhook URL
-    if not validate_webhook_url(result_webhook, logger):
-        return create_response("Error", 400, "Invalid webhook URL format")
-    
-    # Check if the user already exists
-    existing_user = find_user_by_email_or_fullname(email=email, fullname=fullname)
-    if existing_user:
-        logger.error("User already exists")
-        return create_response("Error", 400, "User already exists")
+    # Process the voice files
+    voice_file_ids, content_hashes = process_voice_files(request, logger)
+    if not voice_file_ids:
+        return create_response("Error", 400, "Missing voice file or invalid audio file format. Only WAV or MP3 files are allowed.")
+    return _schedule_registration(data, voice_file_ids, content_hashes)
+
+@app.route(f"{BASE_URL_PREFIX}/schedule_user_authentication", methods=['POST'])
+def schedule_user_authentication():
+    error_response = _validate_authentication_data(request.form)
+    if error_response:
+        return error_response
 
     # Process the voice file
-    voice_file_id = process_voice_file(request, logger)
+    voice_file_id, content_hash = process_voice_file(request, logger)
+    return _schedule_authentication(request.form, voice_file_id, content_hash)
 
-    # Save metadata about the user in MongoDB
-    user_id = save_user_metadata(fullname, email, voice_file_id)
+@app.route(f"{BASE_URL_PREFIX}/voice_uploads", methods=['POST'])
+def request_voice_upload():
+    """
+    Request a presigned POST policy to upload a voice file straight to MinIO.
 
-    # Trigger the registration DAG execution
-    response = trigger_voice_registration_dag(datetime.now(timezone.utc), voice_file_id, result_webhook)
-    if response.status_code == 200:
-        return create_response("Success", 200, "User registration scheduled successfully.", data={"user_id": user_id})
-    else:
-        delete_user_details(user_id)
-        logger.error(f"Error triggering registration DAG execution: {response.text}")
-        return create_response("Error", response.status_code, "Error triggering user registration scheduling.")
+    The client sends the returned form fields followed by the file, in a multipart POST
+    request to the URL, and then commits the upload with the parameters of the
+    registration or authentication it is meant for. MinIO rejects files larger than the
+    maximum size, and each client can request VOICE_UPLOAD_RATE_LIMIT uploads per window.
 
-@app.route(f"{BASE_URL_PREFIX}/schedule_user_authentication", methods=['POST'])
-def schedule_user_authentication():
-    result_webhook = request.form.get('result_webhook')
+    Returns:
+    - dict: The upload ID, the URL and form fields, with their expiration and the maximum file size.
+    """
+    if not get_voice_upload_rate_limiter().allow(request.remote_addr):
+        return create_response("Error", 429, "Too many voice upload requests, try again later")
+    purpose = (request.get_json(silent=True) or request.form).get('purpose')
+    if purpose not in VOICE_UPLOAD_PURPOSES:
+        return create_response("Error", 400, f"Invalid upload purpose. Allowed purposes: {', '.join(VOICE_UPLOAD_PURPOSES)}")
+    return create_response("Success", 200, "Voice upload created successfully.", data=create_voice_upload(purpose))
 
-    # Validate the format of the webhook URL
-    if not validate_webhook_url(result_webhook, logger):
-        return create_response("Error", 400, "Invalid webhook URL format")
-    
-    # Process the voice file
-    voice_file_id = process_voice_file(request, logger)
+@app.route(f"{BASE_URL_PREFIX}/voice_uploads/<string:upload_id>/commit", methods=['POST'])
+def commit_voice_upload(upload_id):
+    """
+    Commit a voice file uploaded with a presigned URL, scheduling the registration or authentication of the upload.
 
-    # Trigger the authentication DAG execution
-    response = trigger_voice_authentication_dag(datetime.now(timezone.utc), voice_file_id, result_webhook)
-    if response.status_code == 200:
-        return create_response("Success", 200, "User authentication scheduled successfully.")
-    else:
-        logger.error(f"Error triggering authentication DAG execution: {response.text}")
-        return create_response("Error", response.status_code, "Error triggering user authentication scheduling.")
+    The size and the audio format of the file are validated reading its metadata and its
+    first bytes only. The request takes the same parameters as the registration or the
+    authentication endpoint, without the voice file.
+
+    Returns:
+    - dict: The response of the registration or authentication scheduled.
+    """
+    data = request.get_json(silent=True) or request.form
+    upload = claim_pending_upload(upload_id)
+    if upload is None:
+        return create_response("Error", 404, "Voice upload not found, expired or already committed")
+    try:
+        return _commit_claimed_upload(upload_id, upload["purpose"] == "registration", data)
+    except Exception:
+        # Unexpected errors, like MinIO being unavailable, leave the upload pending to be committed again
+        update_pending_upload_status(upload_id, "pending")
+        raise
 
 @app.route(f"{BASE_URL_PREFIX}/completed", methods=['POST'])
 def process_completed_webhook():
@@ -90,6 +117,41 @@ def disable_user(decoded_token, user_id):
     result_webhook = request.json.get('result_webhook')
     return _change_user_state(decoded_token, user_id, False, result_webhook)
     
+@app.route(f"{BASE_URL_PREFIX}/accounts/<string:user_id>/samples", methods=['POST'])
+@validate_jwt
+def add_voice_samples(decoded_token, user_id):
+    """
+    Add new voice samples to the voice of an enrolled user.
+
+    The samples are embedded and merged into the stored centroid of the user, so the
+    samples enrolled before are not processed again.
+
+    Returns:
+    - dict: A response indicating whether the enrollment of the samples was scheduled.
+    """
+    result_webhook = request.form.get('result_webhook')
+    # Validate the format of the webhook URL
+    if not result_webhook or not validate_webhook_url(result_webhook, logger):
+        return create_response("Error", 400, "Invalid webhook URL format")
+    # Check if user ID in JWT matches the user ID provided in the URL
+    if decoded_token.get('user_id') != user_id:
+        return create_response("Forbidden", 403, "Unauthorized access.")
+    if len(request.files.getlist('voice_file')) > ENROLLMENT_MAX_SAMPLES:
+        return create_response("Error", 400, f"Too many voice files, at most {ENROLLMENT_MAX_SAMPLES} are allowed")
+
+    # Process the voice files
+    voice_file_ids, content_hashes = process_voice_files(request, logger)
+    if not voice_file_ids:
+        return create_response("Error", 400, "Missing voice file or invalid audio file format. Only WAV or MP3 files are allowed.")
+
+    # Trigger the samples enrollment DAG execution
+    response = trigger_voice_samples_enrollment_dag(datetime.now(timezone.utc), user_id, voice_file_ids, result_webhook, content_hashes)
+    if response.status_code == 200:
+        return create_response("Success", 200, "Voice samples enrollment scheduled successfully.", data={"sample_ids": voice_file_ids})
+    else:
+        logger.error(f"Error triggering samples enrollment DAG execution: {response.text}")
+        return create_response("Error", response.status_code, "Error triggering voice samples enrollment scheduling.")
+
 @app.route(f"{BASE_URL_PREFIX}/accounts/current", methods=['GET'])
 @validate_jwt
 def get_current_user(decoded_token):
@@ -114,11 +176,152 @@ def get_current_user(decoded_token):
     else:
         return create_response("Forbidden", 403, "Unauthorized access.")
 
+@app.route(f"{BASE_URL_PREFIX}/stats", methods=['GET'])
+@validate_jwt
+def get_stats(decoded_token):
+    """
+    Get the connection pool and cache statistics of the API process serving the request.
+
+    The statistics expose the process and its pool settings, so a valid JWT is required.
+
+    Returns:
+    - dict: The MongoDB connection pool and user metadata cache statistics of this process.
+    """
+    user_cache = get_user_metadata_cache()
+    return create_response("Success", 200, "Statistics of the API process retrieved successfully.", data={
+        "mongodb": get_mongo_pool_stats(),
+        "user_cache": user_cache.stats() if user_cache else None
+    })
+
 @app.errorhandler(Exception)
 def handle_error(e):
+    # HTTP errors, like the 413 of an upload too large, keep their status code
+    if isinstance(e, HTTPException):
+        return create_response("Error", e.code, e.description)
     logger.error(f"An error occurred: {str(e)}")
     return create_response("Error", 500, "An internal server error occurred")
 
+@app.after_request
+def discard_unused_uploads(response):
+    # Files streamed into MinIO and not used by the handler, or by a failed request, are removed
+    discard_voice_uploads(request, logger, keep_consumed=response.status_code < 400)
+    return response
+
+
+def _commit_claimed_upload(upload_id, is_registration, data):
+    # Invalid parameters or a file not uploaded yet leave the upload pending, to be committed again
+    error_response = _validate_registration_data(data) if is_registration else _validate_authentication_data(data)
+    if error_response:
+        update_pending_upload_status(upload_id, "pending")
+        return error_response
+    upload_info = inspect_pending_upload(upload_id, AUDIO_HEADER_LENGTH)
+    if upload_info is None:
+        update_pending_upload_status(upload_id, "pending")
+        return create_response("Error", 400, "The voice file has not been uploaded yet")
+
+    # Rejected files are removed right away
+    error_message = validate_uploaded_voice_file(*upload_info)
+    if error_message:
+        logger.error(f"Voice upload {upload_id} rejected: {error_message}")
+        delete_pending_upload(upload_id)
+        update_pending_upload_status(upload_id, "rejected")
+        return create_response("Error", 400, error_message)
+
+    voice_file_id = commit_pending_upload(upload_id)
+    if is_registration:
+        response = _schedule_registration(data, [voice_file_id])
+    else:
+        response = _schedule_authentication(data, voice_file_id)
+    status_code = response[1]
+    update_pending_upload_status(upload_id, "committed" if status_code < 400 else "rejected")
+    if status_code >= 400:
+        delete_files_from_minio([voice_file_id])
+    return response
+
+def _validate_registration_data(data):
+    # Returns the error response for invalid registration parameters, None if they are valid
+    fullname = data.get('fullname')
+    email = data.get('email')
+    result_webhook = data.get('result_webhook')
+
+    # Validate received data
+    if not all([fullname, email, result_webhook]):
+        logger.error("Missing parameters")
+        return create_response("Error", 400, "Missing parameters: fullname, email, or result_webhook")
+
+    # Validate the format of the webhook URL
+    if not validate_webhook_url(result_webhook, logger):
+        return create_response("Error", 400, "Invalid webhook URL format")
+    return None
+
+def _schedule_registration(data, voice_file_ids, content_hashes=None):
+    # The first sample gives its ID to the voice
+    voice_file_id = voice_file_ids[0]
+    result_webhook = data.get('result_webhook')
+
+    # Save metadata about the user in MongoDB, existing users are rejected with DuplicateKeyError
+    try:
+        user_id = save_user_metadata(data.get('fullname'), data.get('email'), voice_file_id, sample_ids=voice_file_ids)
+    except DuplicateKeyError:
+        # The voice files already stored are discarded with the failed request
+        logger.error("User already exists")
+        return create_response("Error", 400, "User already exists")
+
+    # Trigger the registration DAG execution
+    response = trigger_voice_registration_dag(datetime.now(timezone.utc), voice_file_id, result_webhook, user_id=user_id,
+                                              voice_file_ids=voice_file_ids, content_hashes=content_hashes)
+    if response.status_code == 200:
+        return create_response("Success", 200, "User registration scheduled successfully.", data={"user_id": user_id})
+    else:
+        delete_user_details(user_id)
+        logger.error(f"Error triggering registration DAG execution: {response.text}")
+        return create_response("Error", response.status_code, "Error triggering user registration scheduling.")
+
+def _validate_authentication_data(data):
+    # Returns the error response for invalid authentication parameters, None if they are valid
+    result_webhook = data.get('result_webhook')
+    # The mode can be chosen per request, otherwise the configured one applies
+    mode = data.get('mode', AUTHENTICATION_MODE)
+    if mode not in ("async", "sync"):
+        return create_response("Error", 400, "Invalid authentication mode. Allowed modes: async, sync")
+
+    # Validate the format of the webhook URL (optional in sync mode)
+    if (mode == "async" or result_webhook) and not validate_webhook_url(result_webhook or "", logger):
+        return create_response("Error", 400, "Invalid webhook URL format")
+    return None
+
+def _schedule_authentication(data, voice_file_id, content_hash=None):
+    result_webhook = data.get('result_webhook')
+    mode = data.get('mode', AUTHENTICATION_MODE)
+
+    # An optional claimed identity switches from identification (1:N) to verification (1:1)
+    claimed_user_id = data.get('user_id')
+    claimed_email = data.get('email')
+    claim = None
+    if claimed_user_id or claimed_email:
+        # Unresolved claims keep what was sent, the workers reject them
+        claim = {"user_id": claimed_user_id, "email": claimed_email,
+                 **(find_claimed_identity(user_id=claimed_user_id, email=claimed_email) or {})}
+
+    if mode == "sync":
+        return _authenticate_user_sync(voice_file_id, result_webhook, claim, content_hash)
+
+    # Trigger the authentication DAG execution
+    response = trigger_voice_authentication_dag(datetime.now(timezone.utc), voice_file_id, result_webhook, claim, content_hash)
+    if response.status_code == 200:
+        return create_response("Success", 200, "User authentication scheduled successfully.")
+    else:
+        logger.error(f"Error triggering authentication DAG execution: {response.text}")
+        return create_response("Error", response.status_code, "Error triggering user authentication scheduling.")
+
+def _authenticate_user_sync(voice_file_id, result_webhook, claim=None, content_hash=None):
+    # Run the authentication operators in process on the synchronous authentication service
+    response = run_voice_authentication_sync(voice_file_id, result_webhook, claim, content_hash)
+    if response.status_code == 200:
+        return create_response("Success", 200, "User authentication completed.", data=response.json().get("result"))
+    else:
+        logger.error(f"Error running synchronous authentication: {response.text}")
+        return create_response("Error", response.status_code, "Error running user authentication.")
 
 def _change_user_state(decoded_token, user_id, enable, result_webhook):
     # Validate the format of the webhook URL
@@ -7,8 +7,14 @@ import requests
 AIRFLOW_REGISTRATION_DAG_ID = os.environ.get("AIRFLOW_REGISTRATION_DAG_ID")
 AIRFLOW_AUTHENTICATION_DAG_ID = os.environ.get("AIRFLOW_AUTHENTICATION_DAG_ID")
 AIRFLOW_CHANGE_STATE_DAG_ID = os.environ.get("AIRFLOW_CHANGE_STATE_DAG_ID")
+AIRFLOW_SAMPLES_ENROLLMENT_DAG_ID = os.environ.get("AIRFLOW_SAMPLES_ENROLLMENT_DAG_ID")
 AIRFLOW_API_URL = os.environ.get("AIRFLOW_API_URL")
 
+# Get the authentication mode and the synchronous authentication service URL from environment variables
+AUTHENTICATION_MODE = os.environ.get("AUTHENTICATION_MODE", "async")
+SYNC_AUTHENTICATION_URL = os.environ.get("SYNC_AUTHENTICATION_URL")
+SYNC_AUTHENTICATION_TIMEOUT_SECONDS = float(os.environ.get("SYNC_AUTHENTICATION_TIMEOUT_SECONDS", "6"))
+
 # Get API Executor username and password from environment variables
 API_EXECUTOR_USERNAME = os.environ.get("API_EXECUTOR_USERNAME")
 API_EXECUTOR_PASSWORD = os.environ.get("API_EXECUTOR_PASSWORD")
@@ -47,21 +53,81 @@ def _trigger_airflow_dag(dag_id, logical_date, data):
     return response
 
 # Use the trigger_airflow_dag function to trigger the desired DAG
-def trigger_voice_registration_dag(logical_date, voice_file_id, result_webhook):
-    return _trigger_airflow_dag(AIRFLOW_REGISTRATION_DAG_ID, logical_date, data={
+def trigger_voice_registration_dag(logical_date, voice_file_id, result_webhook, user_id=None, voice_file_ids=None, content_hashes=None):
+    data = {
         "voice_file_id": voice_file_id,
-        "result_webhook": result_webhook
+        "user_id": user_id,
+        "result_webhook": result_webhook,
+        **_content_hash_conf(content_hashes[0] if content_hashes else None)
+    }
+    # Several samples are embedded together and compacted into one centroid
+    if voice_file_ids and len(voice_file_ids) > 1:
+        data["voice_file_ids"] = voice_file_ids
+        data.update(_content_hashes_conf(content_hashes))
+    return _trigger_airflow_dag(AIRFLOW_REGISTRATION_DAG_ID, logical_date, data=data)
+
+def trigger_voice_samples_enrollment_dag(logical_date, user_id, voice_file_ids, result_webhook, content_hashes=None):
+    return _trigger_airflow_dag(AIRFLOW_SAMPLES_ENROLLMENT_DAG_ID, logical_date, data={
+        "user_id": user_id,
+        "voice_file_ids": voice_file_ids,
+        "result_webhook": result_webhook,
+        **_content_hashes_conf(content_hashes)
     })
 
-def trigger_voice_authentication_dag(logical_date, voice_file_id, result_webhook):
+def trigger_voice_authentication_dag(logical_date, voice_file_id, result_webhook, claim=None, content_hash=None):
     return _trigger_airflow_dag(AIRFLOW_AUTHENTICATION_DAG_ID, logical_date, data={
         "voice_file_id": voice_file_id,
-        "result_webhook": result_webhook
+        "result_webhook": result_webhook,
+        **_claim_conf(claim),
+        **_content_hash_conf(content_hash)
     })
 
+def run_voice_authentication_sync(voice_file_id, result_webhook=None, claim=None, content_hash=None):
+    """
+    Runs the voice authentication synchronously on the synchronous authentication service.
+
+    The service executes the operators of the authentication DAG in process, skipping the
+    Airflow scheduler and queue, and returns the result in the response.
+
+    Args:
+    - voice_file_id (str): The ID of the voice file stored in MinIO.
+    - result_webhook (str, optional): Webhook that must also receive the result.
+    - claim (dict, optional): The claimed identity, to verify the voice against it only.
+    - content_hash (str, optional): The SHA-256 of the voice file, computed while it was uploaded.
+
+    Returns:
+    - requests.Response: The response of the synchronous authentication service.
+    """
+    return requests.post(
+        url=f"{SYNC_AUTHENTICATION_URL}/authenticate",
+        json={"voice_file_id": voice_file_id, "result_webhook": result_webhook, **_claim_conf(claim), **_content_hash_conf(content_hash)},
+        # Leave the service time to answer its own timeout
+        timeout=SYNC_AUTHENTICATION_TIMEOUT_SECONDS + 2
+    )
+
 def trigger_voice_id_change_state_dag(logical_date, user_id, enable, result_webhook):
     return _trigger_airflow_dag(AIRFLOW_CHANGE_STATE_DAG_ID, logical_date, data={
         "user_id": user_id,
         "result_webhook": result_webhook,
         "is_enabled": enable
-    })
\ No newline at end of file
+    })
+
+def _claim_conf(claim):
+    # A claim is always forwarded when given, even unresolved, with an explicit marker so
+    # that verification fails the same way for unknown and known identities instead of
+    # falling back to identification
+    if claim is None:
+        return {}
+    return {
+        "claimed": True,
+        "claimed_user_id": claim.get("user_id"),
+        "claimed_voice_id": claim.get("voice_id"),
+        "claimed_email": claim.get("email")
+    }
+
+def _content_hash_conf(content_hash):
+    # The SHA-256 computed during the upload lets the workers skip or verify the file
+    return {"content_hash": content_hash} if content_hash else {}
+
+def _content_hashes_conf(content_hashes):
+    return {"content_hashes": content_hashes} if content_hashes and all(content_hashes) else {}
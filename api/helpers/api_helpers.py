@@ -1,20 +1,188 @@
 import os
 import re
-import tempfile
-from flask import jsonify
-from helpers.minio_helpers import handle_minio_storage
+import uuid
+from flask import Request, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.formparser import FormDataParser, MultiPartParser, default_stream_factory
+from helpers.minio_helpers import MinioUploadStream, UploadTooLargeError, handle_minio_storage, delete_files_from_minio, create_presigned_upload_policy, VOICE_UPLOAD_MAX_BYTES, VOICE_UPLOAD_URL_EXPIRES_SECONDS
+from helpers.mongodb_helpers import save_pending_upload
 
 ALLOWED_EXTENSIONS = {'wav', 'mp3'}
+# Maximum number of voice samples accepted in a single enrollment request
+ENROLLMENT_MAX_SAMPLES = int(os.environ.get("ENROLLMENT_MAX_SAMPLES", "10"))
+# What a voice file can be uploaded for with a presigned URL
+VOICE_UPLOAD_PURPOSES = ("registration", "authentication")
+# Time left to commit an upload started right before its URL expired
+VOICE_UPLOAD_COMMIT_GRACE_SECONDS = int(os.environ.get("VOICE_UPLOAD_COMMIT_GRACE_SECONDS", "60"))
+# Bytes read from the start of an uploaded file to detect its audio format
+AUDIO_HEADER_LENGTH = 12
+# Form field of the uploaded voice files
+VOICE_FILE_FIELD = 'voice_file'
+
+class _VoiceFileMultiPartParser(MultiPartParser):
+    """
+    Multipart parser handing only the voice file parts to the stream factory of the request.
+    """
+
+    def start_file_streaming(self, event, total_content_length):
+        if event.name == VOICE_FILE_FIELD:
+            return super().start_file_streaming(event, total_content_length)
+        # Any other file is spooled as Werkzeug does by default, and never stored
+        return default_stream_factory(total_content_length=total_content_length, content_type=event.headers.get("content-type"),
+                                      filename=event.filename)
+
+class _VoiceFileFormDataParser(FormDataParser):
+    """
+    Form parser using _VoiceFileMultiPartParser for multipart forms.
+    """
+
+    def _parse_multipart(self, stream, mimetype, content_length, options):
+        parser = _VoiceFileMultiPartParser(
+            stream_factory=self.stream_factory,
+            max_form_memory_size=self.max_form_memory_size,
+            max_form_parts=self.max_form_parts,
+            cls=self.cls
+        )
+        boundary = options.get("boundary", "").encode("ascii")
+        if not boundary:
+            raise ValueError("Missing boundary")
+        form, files = parser.parse(stream, boundary, content_length)
+        return stream, form, files
+
+class VoiceUploadRequest(Request):
+    """
+    Flask request streaming the uploaded files into MinIO while the form is parsed.
+
+    Every 'voice_file' part of a multipart form is written to a MinioUploadStream instead
+    of a temporary file, so its bytes go straight from the request body to MinIO and the
+    file is already stored, with its size and SHA-256, once the form is available. Other
+    file parts are spooled as usual. Files larger than VOICE_UPLOAD_MAX_BYTES, or more
+    than ENROLLMENT_MAX_SAMPLES files, are rejected with a 413 error while streaming.
+    """
+
+    form_data_parser_class = _VoiceFileFormDataParser
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.voice_uploads = []
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if len(self.voice_uploads) >= ENROLLMENT_MAX_SAMPLES:
+            raise RequestEntityTooLarge(f"Too many files, at most {ENROLLMENT_MAX_SAMPLES} are allowed")
+        upload = MinioUploadStream(content_type)
+        self.voice_uploads.append(upload)
+        return upload
+
+    def _load_form_data(self):
+        try:
+            super()._load_form_data()
+        except UploadTooLargeError as e:
+            raise RequestEntityTooLarge(str(e))
+
+def discard_voice_uploads(request, logger, keep_consumed=False):
+    """
+    Removes the files streamed into MinIO by a request and never used.
+
+    Parameters:
+    request (flask.Request): The request whose uploads are discarded.
+    logger (logging.Logger): The logger of the application.
+    keep_consumed (bool): Whether the files stored by the handler are kept, which is only right if it succeeded.
+    """
+    uploads = [upload for upload in getattr(request, "voice_uploads", []) if not (keep_consumed and upload.consumed)]
+    for upload in uploads:
+        upload.close()
+    if uploads:
+        try:
+            delete_files_from_minio([upload.object_name for upload in uploads])
+        except Exception as e:
+            logger.error(str(e))
 
 def process_voice_file(request, logger):
     voice_file = _extract_voice_file_from_request(request, logger)
-    # Save the file locally
-    temp_file_path = _save_file_locally(voice_file)
-    # Store the file in MinIO
-    voice_file_id = handle_minio_storage(temp_file_path)
-    # Clean up the temporary voice file
-    _cleanup_temp_file(temp_file_path)
-    return voice_file_id
+    # Store the uploaded stream in MinIO, unless it was streamed there already
+    return _store_voice_file(voice_file)
+
+def process_voice_files(request, logger):
+    """
+    Stores every voice sample uploaded in the 'voice_file' parts of the request.
+
+    Parameters:
+    request (flask.Request): The request holding one or several 'voice_file' parts.
+    logger (logging.Logger): The logger of the application.
+
+    Returns:
+    tuple: The IDs of the stored voice files, in upload order, and the SHA-256 of their content,
+           or (None, None) if a file is missing or not allowed.
+    """
+    voice_files = request.files.getlist(VOICE_FILE_FIELD)
+    if not voice_files or any(voice_file.filename == '' or not allowed_file(voice_file.filename) for voice_file in voice_files):
+        logger.error("Missing voice file or invalid audio file format. Only WAV or MP3 files are allowed.")
+        return None, None
+    logger.info(f"Received {len(voice_files)} voice files")
+    stored_files = [_store_voice_file(voice_file) for voice_file in voice_files]
+    return [voice_file_id for voice_file_id, _ in stored_files], [content_hash for _, content_hash in stored_files]
+
+def create_voice_upload(purpose):
+    """
+    Creates a presigned upload, letting the client send a voice file straight to MinIO.
+
+    Parameters:
+    purpose (str): What the voice file is uploaded for, one of VOICE_UPLOAD_PURPOSES.
+
+    Returns:
+    dict: The upload ID, the URL the file must be sent to with a multipart POST request,
+          after the returned form fields, and their expiration.
+    """
+    upload_id = str(uuid.uuid4())
+    upload_url, upload_fields = create_presigned_upload_policy(upload_id)
+    expires_at = save_pending_upload(upload_id, purpose, VOICE_UPLOAD_URL_EXPIRES_SECONDS + VOICE_UPLOAD_COMMIT_GRACE_SECONDS)
+    return {
+        "upload_id": upload_id,
+        "upload_url": upload_url,
+        "upload_fields": upload_fields,
+        "method": "POST",
+        "url_expires_in": VOICE_UPLOAD_URL_EXPIRES_SECONDS,
+        "expires_at": expires_at.isoformat(),
+        "max_bytes": VOICE_UPLOAD_MAX_BYTES
+    }
+
+def validate_uploaded_voice_file(size, header):
+    """
+    Validates the size and the audio format of a voice file uploaded with a presigned URL.
+
+    Parameters:
+    size (int): The size of the file.
+    header (bytes): The first AUDIO_HEADER_LENGTH bytes of the file.
+
+    Returns:
+    str or None: The reason the file is rejected, or None if it is valid.
+    """
+    if size == 0:
+        return "The voice file is empty"
+    if size > VOICE_UPLOAD_MAX_BYTES:
+        return f"The voice file exceeds the maximum size of {VOICE_UPLOAD_MAX_BYTES} bytes"
+    if sniff_audio_format(header) is None:
+        return "Invalid audio file format. Only WAV or MP3 files are allowed."
+    return None
+
+def sniff_audio_format(header):
+    """
+    Detects the audio format of a file from its first bytes.
+
+    Parameters:
+    header (bytes): The first bytes of the file.
+
+    Returns:
+    str or None: 'wav' or 'mp3', or None for any other format.
+    """
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        return "wav"
+    # MP3 files start with an ID3 tag or with an MPEG audio frame header; AAC ADTS headers
+    # share the sync word but have layer 0
+    if header[:3] == b"ID3" or (len(header) >= 2 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0
+                                 and (header[1] >> 3) & 0x03 != 0x01 and (header[1] >> 1) & 0x03 != 0x00):
+        return "mp3"
+    return None
 
 def validate_webhook_url(result_webhook, logger):
     if not re.match(r'^https?://\S+$', result_webhook):
@@ -44,6 +212,14 @@ def create_response(status, code, message, data=None):
     return jsonify(response_data), code
 
 
+def _store_voice_file(voice_file):
+    # Returns the ID and the SHA-256 of the stored file; the hash is unknown for files not streamed
+    if isinstance(voice_file.stream, MinioUploadStream):
+        voice_file.stream.finish()
+        voice_file.stream.consumed = True
+        return voice_file.stream.object_name, voice_file.stream.content_hash
+    return handle_minio_storage(voice_file.stream, voice_file.mimetype), None
+
 def _extract_voice_file_from_request(request, logger):
      # Check if the voice_file part is in the request
     if 'voice_file' not in request.files:
@@ -70,20 +246,6 @@ def _extract_voice_file_from_request(request, logger):
 
     return voice_file
 
-# Function to save the uploaded file locally
-def _save_file_locally(file):
-    # Create a temporary file to store the uploaded video
-    temp_file = tempfile.NamedTemporaryFile(delete=False)
-    temp_file_path = temp_file.name
-    # Save the uploaded video to the temporary file
-    file.save(temp_file_path)
-    return temp_file_path
-
-# Function to clean up the temporary file
-def _cleanup_temp_file(temp_file_path):
-    # Delete the temporary file
-    os.unlink(temp_file_path)
-
 # Check if the filename has a valid extension present in the ALLOWED_EXTENSIONS set
 def allowed_file(filename):
     return '.' in filename and \
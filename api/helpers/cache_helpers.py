@@ -0,0 +1,257 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import bson
+
+# User metadata cache configuration
+USER_CACHE_ENABLED = os.environ.get("USER_CACHE_ENABLED", "true").lower() == "true"
+USER_CACHE_MAX_ENTRIES = int(os.environ.get("USER_CACHE_MAX_ENTRIES", "10000"))
+USER_CACHE_TTL_SECONDS = float(os.environ.get("USER_CACHE_TTL_SECONDS", "300"))
+USER_CACHE_REDIS_URL = os.environ.get("USER_CACHE_REDIS_URL")
+# With Redis, the in-memory tier only absorbs bursts: invalidations do not reach other processes
+USER_CACHE_LOCAL_TTL_SECONDS = float(os.environ.get("USER_CACHE_LOCAL_TTL_SECONDS", "5"))
+USER_CACHE_KEY_PREFIX = "user-metadata"
+
+# Fields of the user documents kept by the user metadata cache, used as projection of the lookups.
+# The Airflow operators share the cache through Redis, so both sides must keep the same fields.
+USER_METADATA_PROJECTION = {"_id": 1, "fullname": 1, "email": 1, "voice_id": 1, "sample_ids": 1}
+
+# Process-wide user metadata cache, guarded by _user_cache_lock
+_user_cache_lock = threading.Lock()
+_user_cache = None
+
+logger = logging.getLogger(__name__)
+
+class LruTtlCache:
+    """
+    Thread-safe in-memory cache bounded by entry count, with per-entry expiration.
+
+    The least recently used entry is evicted when the cache is full, and entries older
+    than 'ttl_seconds' are treated as missing.
+
+    Args:
+    - max_entries (int): Maximum number of entries kept in memory.
+    - ttl_seconds (float): Time to live of each entry, in seconds.
+    """
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = float(ttl_seconds)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the value stored under a key, or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """
+        Stores a value under a key, evicting the least recently used entries if needed.
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Removes a key from the cache if it is present.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Removes every entry from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+class UserMetadataCache:
+    """
+    Read-through cache of the user documents, addressed by user ID and by voice ID.
+
+    Documents are loaded with USER_METADATA_PROJECTION on a miss and stored under both
+    of their keys. A bounded in-memory LRU/TTL tier is always used; when a Redis URL is
+    configured, a shared tier holds the BSON encoded documents for every process of the
+    API and of the workers. Invalidation removes the keys from the local and the shared
+    tiers only, so the in-memory tiers of other processes may return a changed or deleted
+    user until their entry expires: 'local_ttl_seconds' with a shared tier, 'ttl_seconds'
+    without one. Missing users are not cached, and failures of the shared tier never fail
+    the caller.
+
+    Args:
+    - max_entries (int): Maximum number of entries of the in-memory tier.
+    - ttl_seconds (float): Time to live of the entries of the shared tier, and of the in-memory one without it, in seconds.
+    - redis_url (str, optional): URL of the Redis server backing the shared tier.
+    - local_ttl_seconds (float): Time to live of the entries of the in-memory tier when the shared tier is used, in seconds.
+    """
+
+    def __init__(self, max_entries=USER_CACHE_MAX_ENTRIES, ttl_seconds=USER_CACHE_TTL_SECONDS, redis_url=USER_CACHE_REDIS_URL,
+                 local_ttl_seconds=USER_CACHE_LOCAL_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._memory = LruTtlCache(max_entries, min(ttl_seconds, local_ttl_seconds) if redis_url else ttl_seconds)
+        self._redis = None
+        if redis_url:
+            import redis
+            self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._stats_lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "shared_hits": 0, "misses": 0, "invalidations": 0, "shared_errors": 0}
+        self._load_seconds = 0.0
+
+    def get_by_user_id(self, user_id, loader):
+        """
+        Returns the document of a user, loading it on a miss.
+
+        Args:
+        - user_id (str or ObjectId): The ID of the user.
+        - loader (callable): Loads the document from MongoDB, returning None if it does not exist.
+
+        Returns:
+        - dict or None: A copy of the user document, or None if the user does not exist.
+        """
+        return self._get(self._key("id", user_id), loader)
+
+    def get_by_voice_id(self, voice_id, loader):
+        """
+        Returns the document of the user owning a voice, loading it on a miss.
+
+        Args:
+        - voice_id (str): The voice ID of the user.
+        - loader (callable): Loads the document from MongoDB, returning None if it does not exist.
+
+        Returns:
+        - dict or None: A copy of the user document, or None if no user owns the voice.
+        """
+        return self._get(self._key("voice", voice_id), loader)
+
+    def invalidate(self, user_id, voice_id=None):
+        """
+        Removes a user from the cache, after it was deleted or changed.
+
+        Args:
+        - user_id (str or ObjectId): The ID of the user.
+        - voice_id (str, optional): The voice ID of the user, taken from the cached document if omitted.
+        """
+        id_key = self._key("id", user_id)
+        if voice_id is None:
+            cached = self._memory.get(id_key)
+            voice_id = cached.get("voice_id") if cached else None
+        keys = [id_key] + ([self._key("voice", voice_id)] if voice_id else [])
+        for key in keys:
+            self._memory.delete(key)
+        self._count("invalidations")
+        if self._redis is not None:
+            try:
+                if voice_id is None:
+                    payload = self._redis.get(id_key)
+                    voice_id = bson.decode(payload).get("voice_id") if payload else None
+                    keys += [self._key("voice", voice_id)] if voice_id else []
+                self._redis.delete(*keys)
+            except Exception as e:
+                logger.warning(f"Error invalidating user metadata cache in Redis: {e}")
+                self._count("shared_errors")
+
+    def stats(self):
+        """
+        Returns the hit and miss counters of this process.
+
+        Returns:
+        - dict: Counters plus the hit ratio, the mean load time of a miss and the load time saved by the hits.
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+            load_seconds = self._load_seconds
+        hits = stats["memory_hits"] + stats["shared_hits"]
+        lookups = hits + stats["misses"]
+        mean_load_ms = load_seconds * 1000 / stats["misses"] if stats["misses"] else 0.0
+        stats["hit_ratio"] = hits / lookups if lookups else 0.0
+        stats["mean_load_ms"] = round(mean_load_ms, 3)
+        stats["saved_ms"] = round(hits * mean_load_ms, 3)
+        stats["memory_entries"] = len(self._memory)
+        return stats
+
+    def _get(self, key, loader):
+        document = self._memory.get(key)
+        if document is not None:
+            self._count("memory_hits")
+            return dict(document)
+        if self._redis is not None:
+            try:
+                payload = self._redis.get(key)
+            except Exception as e:
+                logger.warning(f"Error reading user metadata cache from Redis: {e}")
+                self._count("shared_errors")
+                payload = None
+            if payload is not None:
+                document = bson.decode(payload)
+                self._memory.set(key, document)
+                self._count("shared_hits")
+                return dict(document)
+        start_time = time.perf_counter()
+        document = loader()
+        with self._stats_lock:
+            self._stats["misses"] += 1
+            self._load_seconds += time.perf_counter() - start_time
+        if document is None:
+            return None
+        self._store(document)
+        return dict(document)
+
+    def _store(self, document):
+        keys = [self._key("id", document["_id"])]
+        if document.get("voice_id"):
+            keys.append(self._key("voice", document["voice_id"]))
+        for key in keys:
+            self._memory.set(key, document)
+        if self._redis is not None:
+            try:
+                payload = bson.encode(document)
+                pipeline = self._redis.pipeline(transaction=False)
+                for key in keys:
+                    pipeline.set(key, payload, ex=max(1, int(self.ttl_seconds)))
+                pipeline.execute()
+            except Exception as e:
+                logger.warning(f"Error writing user metadata cache to Redis: {e}")
+                self._count("shared_errors")
+
+    def _key(self, kind, value):
+        return f"{USER_CACHE_KEY_PREFIX}:{kind}:{value}"
+
+    def _count(self, counter):
+        with self._stats_lock:
+            self._stats[counter] += 1
+
+def get_user_metadata_cache():
+    """
+    Returns the user metadata cache of the current process, creating it on first use.
+
+    Returns:
+    - UserMetadataCache or None: The process-wide cache, or None if caching is disabled.
+    """
+    global _user_cache
+    if not USER_CACHE_ENABLED:
+        return None
+    with _user_cache_lock:
+        if _user_cache is None:
+            _user_cache = UserMetadataCache()
+        return _user_cache
@@ -1,6 +1,16 @@
+import hashlib
 import os
+from datetime import datetime, timedelta, timezone
+import queue
+import threading
 import uuid
+import certifi
+import urllib3
 from minio import Minio
+from minio.commonconfig import ENABLED, CopySource, Filter
+from minio.datatypes import PostPolicy
+from minio.error import S3Error
+from minio.lifecycleconfig import Expiration, LifecycleConfig, Rule
 
 # MinIO configuration
 MINIO_ENDPOINT = os.environ.get("MINIO_ENDPOINT")
@@ -8,21 +18,360 @@ MINIO_ACCESS_KEY = os.environ.get("MINIO_ACCESS_KEY")
 MINIO_SECRET_KEY = os.environ.get("MINIO_SECRET_KEY")
 MINIO_BUCKET_NAME = os.environ.get("MINIO_BUCKET_NAME")
 
+# MinIO client configuration
+MINIO_MAX_CONNECTIONS = int(os.environ.get("MINIO_MAX_CONNECTIONS", "20"))
+MINIO_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("MINIO_CONNECT_TIMEOUT_SECONDS", "3"))
+MINIO_READ_TIMEOUT_SECONDS = float(os.environ.get("MINIO_READ_TIMEOUT_SECONDS", "30"))
+MINIO_MAX_RETRIES = int(os.environ.get("MINIO_MAX_RETRIES", "3"))
+MINIO_RETRY_BACKOFF_SECONDS = float(os.environ.get("MINIO_RETRY_BACKOFF_SECONDS", "0.2"))
+
+# Streaming upload configuration
+VOICE_UPLOAD_MAX_BYTES = int(os.environ.get("VOICE_UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+# MinIO multipart part size, at least 5 MiB; it bounds the memory used by an upload
+VOICE_UPLOAD_PART_SIZE = int(os.environ.get("VOICE_UPLOAD_PART_SIZE", str(5 * 1024 * 1024)))
+VOICE_UPLOAD_QUEUE_CHUNKS = int(os.environ.get("VOICE_UPLOAD_QUEUE_CHUNKS", "16"))
+VOICE_UPLOAD_IDLE_TIMEOUT_SECONDS = float(os.environ.get("VOICE_UPLOAD_IDLE_TIMEOUT_SECONDS", "30"))
+
+# Presigned upload configuration. The URLs are signed for the endpoint the clients
+# reach, the MinIO HAProxy, which can differ from the one used inside the network.
+MINIO_PUBLIC_ENDPOINT = os.environ.get("MINIO_PUBLIC_ENDPOINT") or MINIO_ENDPOINT
+MINIO_PUBLIC_SECURE = os.environ.get("MINIO_PUBLIC_SECURE", "false").lower() == "true"
+MINIO_REGION = os.environ.get("MINIO_REGION", "us-east-1")
+VOICE_UPLOAD_URL_EXPIRES_SECONDS = int(os.environ.get("VOICE_UPLOAD_URL_EXPIRES_SECONDS", "300"))
+# Objects uploaded but never committed are removed by a bucket lifecycle rule
+VOICE_UPLOAD_PENDING_RULE_ID = "expire-pending-voice-uploads"
+VOICE_UPLOAD_PENDING_PREFIX = os.environ.get("VOICE_UPLOAD_PENDING_PREFIX", "pending/")
+VOICE_UPLOAD_PENDING_EXPIRATION_DAYS = int(os.environ.get("VOICE_UPLOAD_PENDING_EXPIRATION_DAYS", "1"))
+
+# Process-wide clients and verified buckets, guarded by _minio_clients_lock
+_minio_clients_lock = threading.Lock()
+_minio_clients = {}
+_verified_buckets = set()
+
+class UploadTooLargeError(Exception):
+    """
+    Raised when a streamed upload exceeds its maximum size.
+    """
+
+class MinioUploadStream:
+    """
+    Writable stream uploading the bytes written to it straight into a new MinIO object.
+
+    A background thread runs 'put_object' with an unknown length, reading the written
+    chunks through a bounded queue, so the upload progresses while the request body is
+    still being received and about one multipart part is held in memory. The size and
+    the SHA-256 of the content are computed as the chunks are written. Writing more
+    than 'max_bytes', or not writing for VOICE_UPLOAD_IDLE_TIMEOUT_SECONDS, aborts the
+    upload. The upload is completed by 'finish', also called by 'seek(0)', which is how
+    Werkzeug ends a file part of a form. 'consumed' is set by whoever takes over the
+    stored object; the others are removed at the end of the request.
+
+    Args:
+    - content_type (str, optional): The content type of the object.
+    - max_bytes (int, optional): Maximum size of the object, VOICE_UPLOAD_MAX_BYTES by default.
+    - part_size (int, optional): Size of the multipart parts sent to MinIO, VOICE_UPLOAD_PART_SIZE by default.
+    """
+
+    _END = object()
+
+    def __init__(self, content_type=None, max_bytes=None, part_size=None):
+        self.object_name = str(uuid.uuid4())
+        self.content_type = content_type or "application/octet-stream"
+        self.max_bytes = max_bytes or VOICE_UPLOAD_MAX_BYTES
+        self.size = 0
+        self.finished = False
+        self.consumed = False
+        self._sha256 = hashlib.sha256()
+        self._chunks = queue.Queue(maxsize=max(1, VOICE_UPLOAD_QUEUE_CHUNKS))
+        self._pending = b""
+        self._error = None
+        self._uploader = threading.Thread(target=self._upload, args=(part_size or VOICE_UPLOAD_PART_SIZE,), name="minio-upload", daemon=True)
+        self._uploader.start()
+
+    @property
+    def content_hash(self):
+        """
+        The SHA-256 of the bytes written so far, in hexadecimal.
+        """
+        return self._sha256.hexdigest()
+
+    def write(self, data):
+        self._check_writable()
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self.abort(UploadTooLargeError(f"The upload exceeds the maximum size of {self.max_bytes} bytes"))
+            raise self._error
+        self._sha256.update(data)
+        self._put(bytes(data))
+        return len(data)
+
+    def seek(self, offset, whence=0):
+        if offset == 0 and whence == 0:
+            self.finish()
+        return 0
+
+    def finish(self):
+        """
+        Ends the content and waits for the upload to complete.
+
+        Raises:
+        - Exception: If the upload failed or was aborted.
+        """
+        if not self.finished:
+            self._check_writable()
+            if self.size == 0:
+                self.abort(Exception(f"File '{self.object_name}' is empty"))
+                raise self._error
+            self._put(self._END)
+            self.finished = True
+            self._uploader.join()
+        if self._error is not None:
+            raise self._error
+
+    def abort(self, error):
+        """
+        Aborts the upload, so no object is stored.
+
+        Args:
+        - error (Exception): The reason, raised by 'finish' afterwards.
+        """
+        if self.finished:
+            return
+        self.finished = True
+        self._error = error
+        # The reader raises the error, which makes MinIO abort the multipart upload
+        while self._uploader.is_alive():
+            try:
+                self._chunks.put(error, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self._uploader.join()
+
+    def close(self):
+        self.abort(Exception(f"The upload of '{self.object_name}' was closed before being finished"))
+
+    def read(self, size=-1):
+        # Reader side, called by 'put_object': returns 'size' bytes unless the end is reached
+        buffer = bytearray(self._pending)
+        while size < 0 or len(buffer) < size:
+            try:
+                chunk = self._chunks.get(timeout=VOICE_UPLOAD_IDLE_TIMEOUT_SECONDS)
+            except queue.Empty:
+                raise Exception(f"No data received for {VOICE_UPLOAD_IDLE_TIMEOUT_SECONDS} seconds")
+            if chunk is self._END:
+                self._chunks.put(self._END)
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            buffer += chunk
+        if size < 0:
+            size = len(buffer)
+        # Slice through a view so the part is copied only once
+        with memoryview(buffer) as view:
+            self._pending = bytes(view[size:])
+            return bytes(view[:size])
+
+    def _check_writable(self):
+        if self._error is not None:
+            raise self._error
+        if self.finished:
+            raise ValueError(f"The upload of '{self.object_name}' is already finished")
+
+    def _put(self, item):
+        # Blocks while the queue is full, unless the upload thread stopped
+        while True:
+            try:
+                self._chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                if not self._uploader.is_alive():
+                    self.finished = True
+                    raise self._error or Exception(f"The upload of '{self.object_name}' stopped")
+
+    def _upload(self, part_size):
+        try:
+            minio_client = _get_minio_client(
+                minio_endpoint=MINIO_ENDPOINT,
+                minio_access_key=MINIO_ACCESS_KEY,
+                minio_secret_key=MINIO_SECRET_KEY,
+                minio_bucket_name=MINIO_BUCKET_NAME
+            )
+            minio_client.put_object(
+                bucket_name=MINIO_BUCKET_NAME,
+                object_name=self.object_name,
+                data=self,
+                length=-1,
+                part_size=part_size,
+                content_type=self.content_type
+            )
+        except Exception as e:
+            if self._error is None:
+                self._error = Exception(f"Error storing file '{self.object_name}' in MinIO: {e}")
+
 # Function to handle MinIO storage for the file
-def handle_minio_storage(temp_file_path):
+def handle_minio_storage(file_stream, content_type=None):
     # Generate a unique name for the file in MinIO using UUID
     unique_filename = str(uuid.uuid4())
-    # Store the video file in MinIO
+    # Store the voice file in MinIO
     _store_file_in_minio(
         minio_endpoint=MINIO_ENDPOINT,
         minio_access_key=MINIO_ACCESS_KEY,
         minio_secret_key=MINIO_SECRET_KEY,
         minio_bucket_name=MINIO_BUCKET_NAME,
-        local_file_path=temp_file_path,
-        minio_object_name=unique_filename
+        file_stream=file_stream,
+        minio_object_name=unique_filename,
+        content_type=content_type
     )
     return unique_filename
 
+def delete_files_from_minio(minio_object_names):
+    """
+    Deletes files stored in MinIO, e.g. the voice files of a rejected registration.
+
+    Args:
+    - minio_object_names (list): The names of the objects in MinIO.
+
+    Raises:
+    - Exception: If there's an error during the MinIO file deletion process.
+    """
+    try:
+        # Get MinIO client
+        minio_client = _get_minio_client(
+            minio_endpoint=MINIO_ENDPOINT,
+            minio_access_key=MINIO_ACCESS_KEY,
+            minio_secret_key=MINIO_SECRET_KEY,
+            minio_bucket_name=MINIO_BUCKET_NAME
+        )
+        for minio_object_name in minio_object_names:
+            minio_client.remove_object(MINIO_BUCKET_NAME, minio_object_name)
+    except Exception as e:
+        error_message = f"Error deleting files {minio_object_names} from MinIO: {e}"
+        raise Exception(error_message)
+
+def create_presigned_upload_policy(upload_id):
+    """
+    Creates the presigned POST policy a client uses to upload a voice file straight to MinIO.
+
+    Unlike a presigned PUT URL, the policy bounds the size of the file: MinIO rejects
+    uploads larger than VOICE_UPLOAD_MAX_BYTES, or stored under another key. The file
+    is stored under VOICE_UPLOAD_PENDING_PREFIX until the upload is committed. Signing
+    the policy is done locally, without any request to MinIO.
+
+    Args:
+    - upload_id (str): The ID of the upload.
+
+    Returns:
+    - tuple: The URL accepting a multipart POST request for VOICE_UPLOAD_URL_EXPIRES_SECONDS,
+             and the form fields to send before the file.
+
+    Raises:
+    - Exception: If there's an error while creating the policy.
+    """
+    try:
+        minio_client = _get_minio_client(
+            minio_endpoint=MINIO_ENDPOINT,
+            minio_access_key=MINIO_ACCESS_KEY,
+            minio_secret_key=MINIO_SECRET_KEY,
+            minio_bucket_name=MINIO_BUCKET_NAME
+        )
+        _ensure_pending_uploads_expiration(minio_client)
+        policy = PostPolicy(MINIO_BUCKET_NAME, datetime.now(timezone.utc) + timedelta(seconds=VOICE_UPLOAD_URL_EXPIRES_SECONDS))
+        policy.add_equals_condition("key", VOICE_UPLOAD_PENDING_PREFIX + upload_id)
+        policy.add_content_length_range_condition(1, VOICE_UPLOAD_MAX_BYTES)
+        form_fields = _get_presigning_client().presigned_post_policy(policy)
+        form_fields["key"] = VOICE_UPLOAD_PENDING_PREFIX + upload_id
+        upload_url = f"{'https' if MINIO_PUBLIC_SECURE else 'http'}://{MINIO_PUBLIC_ENDPOINT}/{MINIO_BUCKET_NAME}"
+        return upload_url, form_fields
+    except Exception as e:
+        error_message = f"Error creating the upload policy of '{upload_id}': {e}"
+        raise Exception(error_message)
+
+def inspect_pending_upload(upload_id, header_length):
+    """
+    Reads the size and the first bytes of a voice file uploaded with a presigned URL.
+
+    Only the header is downloaded, with a ranged request.
+
+    Args:
+    - upload_id (str): The ID of the upload.
+    - header_length (int): The number of bytes to read from the start of the file.
+
+    Returns:
+    - tuple or None: The size of the file and its header, or None if the file was not uploaded.
+
+    Raises:
+    - Exception: If there's an error during the MinIO file retrieval process.
+    """
+    minio_object_name = VOICE_UPLOAD_PENDING_PREFIX + upload_id
+    try:
+        minio_client = _get_minio_client(
+            minio_endpoint=MINIO_ENDPOINT,
+            minio_access_key=MINIO_ACCESS_KEY,
+            minio_secret_key=MINIO_SECRET_KEY,
+            minio_bucket_name=MINIO_BUCKET_NAME
+        )
+        try:
+            size = minio_client.stat_object(MINIO_BUCKET_NAME, minio_object_name).size
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "NoSuchObject"):
+                return None
+            raise
+        if size == 0:
+            return 0, b""
+        response = minio_client.get_object(MINIO_BUCKET_NAME, minio_object_name, offset=0, length=min(size, header_length))
+        try:
+            header = response.read()
+        finally:
+            response.close()
+            response.release_conn()
+        return size, header
+    except Exception as e:
+        error_message = f"Error inspecting file '{minio_object_name}' in MinIO: {e}"
+        raise Exception(error_message)
+
+def commit_pending_upload(upload_id):
+    """
+    Moves a voice file uploaded with a presigned URL out of the pending uploads.
+
+    The file is copied inside MinIO, so its content never goes through the API.
+
+    Args:
+    - upload_id (str): The ID of the upload, which becomes the ID of the voice file.
+
+    Returns:
+    - str: The ID of the voice file.
+
+    Raises:
+    - Exception: If there's an error while moving the file.
+    """
+    minio_object_name = VOICE_UPLOAD_PENDING_PREFIX + upload_id
+    try:
+        minio_client = _get_minio_client(
+            minio_endpoint=MINIO_ENDPOINT,
+            minio_access_key=MINIO_ACCESS_KEY,
+            minio_secret_key=MINIO_SECRET_KEY,
+            minio_bucket_name=MINIO_BUCKET_NAME
+        )
+        minio_client.copy_object(MINIO_BUCKET_NAME, upload_id, CopySource(MINIO_BUCKET_NAME, minio_object_name))
+        minio_client.remove_object(MINIO_BUCKET_NAME, minio_object_name)
+        return upload_id
+    except Exception as e:
+        error_message = f"Error committing file '{minio_object_name}' in MinIO: {e}"
+        raise Exception(error_message)
+
+def delete_pending_upload(upload_id):
+    """
+    Deletes a voice file uploaded with a presigned URL and rejected.
+
+    Args:
+    - upload_id (str): The ID of the upload.
+
+    Raises:
+    - Exception: If there's an error during the MinIO file deletion process.
+    """
+    delete_files_from_minio([VOICE_UPLOAD_PENDING_PREFIX + upload_id])
+
 def get_file_from_minio(minio_object_name):
     """
     Retrieves a file from MinIO based on its object name.
@@ -55,7 +404,11 @@ def get_file_from_minio(minio_object_name):
 
 def _get_minio_client(minio_endpoint, minio_access_key, minio_secret_key, minio_bucket_name):
     """
-    Establishes a connection with MinIO and returns a MinIO client.
+    Returns the MinIO client of this process, making sure the bucket exists.
+
+    The client and its connection pool are created once per process, and the bucket
+    is only checked, and created if missing, the first time it is used. Requests
+    failing to connect or answered with a server error are retried with backoff.
 
     Args:
     - minio_endpoint (str): The endpoint URL of the MinIO server.
@@ -70,21 +423,92 @@ def _get_minio_client(minio_endpoint, minio_access_key, minio_secret_key, minio_
     - Exception: If there's an error while connecting to MinIO.
     """
     try:
-        minio_client = Minio(
-            endpoint=minio_endpoint,
-            access_key=minio_access_key,
-            secret_key=minio_secret_key,
-            secure=False
-        )
-        bucket_exists = minio_client.bucket_exists(minio_bucket_name)
-        if not bucket_exists:
-            minio_client.make_bucket(minio_bucket_name)
+        pid = os.getpid()
+        with _minio_clients_lock:
+            minio_client = _minio_clients.get((pid, minio_endpoint, minio_access_key))
+            if minio_client is None:
+                minio_client = Minio(
+                    endpoint=minio_endpoint,
+                    access_key=minio_access_key,
+                    secret_key=minio_secret_key,
+                    secure=False,
+                    http_client=_create_minio_http_client()
+                )
+                _minio_clients[(pid, minio_endpoint, minio_access_key)] = minio_client
+        if (pid, minio_endpoint, minio_bucket_name) not in _verified_buckets:
+            if not minio_client.bucket_exists(minio_bucket_name):
+                try:
+                    minio_client.make_bucket(minio_bucket_name)
+                except S3Error as e:
+                    # Created meanwhile by another process
+                    if e.code not in ("BucketAlreadyOwnedByYou", "BucketAlreadyExists"):
+                        raise
+            _verified_buckets.add((pid, minio_endpoint, minio_bucket_name))
         return minio_client
     except Exception as e:
         error_message = f"Error connecting to MinIO: {e}"
         raise Exception(error_message)
+
+def _get_presigning_client():
+    # Signs for the public endpoint; with the region given, presigning needs no request to MinIO
+    pid = os.getpid()
+    key = (pid, MINIO_PUBLIC_ENDPOINT, MINIO_ACCESS_KEY, "presigning")
+    with _minio_clients_lock:
+        minio_client = _minio_clients.get(key)
+        if minio_client is None:
+            minio_client = Minio(
+                endpoint=MINIO_PUBLIC_ENDPOINT,
+                access_key=MINIO_ACCESS_KEY,
+                secret_key=MINIO_SECRET_KEY,
+                secure=MINIO_PUBLIC_SECURE,
+                region=MINIO_REGION
+            )
+            _minio_clients[key] = minio_client
+        return minio_client
+
+def _ensure_pending_uploads_expiration(minio_client):
+    # Checks the lifecycle rule once per process. The configuration is replaced as a whole,
+    # so the other rules of the bucket, like the expiration of the offloaded XComs, are kept
+    key = (os.getpid(), MINIO_ENDPOINT, MINIO_BUCKET_NAME, "lifecycle")
+    if key in _verified_buckets:
+        return
+    lifecycle = minio_client.get_bucket_lifecycle(MINIO_BUCKET_NAME)
+    rules, current = [], None
+    for existing in (lifecycle.rules if lifecycle else []):
+        if existing.rule_id == VOICE_UPLOAD_PENDING_RULE_ID:
+            current = existing
+        else:
+            rules.append(existing)
+    if (current is None or current.rule_filter is None or current.rule_filter.prefix != VOICE_UPLOAD_PENDING_PREFIX
+            or current.expiration is None or current.expiration.days != VOICE_UPLOAD_PENDING_EXPIRATION_DAYS):
+        minio_client.set_bucket_lifecycle(MINIO_BUCKET_NAME, LifecycleConfig(rules + [
+            Rule(
+                ENABLED,
+                rule_filter=Filter(prefix=VOICE_UPLOAD_PENDING_PREFIX),
+                rule_id=VOICE_UPLOAD_PENDING_RULE_ID,
+                expiration=Expiration(days=VOICE_UPLOAD_PENDING_EXPIRATION_DAYS)
+            )
+        ]))
+    with _minio_clients_lock:
+        _verified_buckets.add(key)
+
+def _create_minio_http_client():
+    # Keep-alive connections shared by the threads of the process, retried on transient errors
+    return urllib3.PoolManager(
+        num_pools=4,
+        maxsize=MINIO_MAX_CONNECTIONS,
+        block=False,
+        timeout=urllib3.Timeout(connect=MINIO_CONNECT_TIMEOUT_SECONDS, read=MINIO_READ_TIMEOUT_SECONDS),
+        cert_reqs="CERT_REQUIRED",
+        ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+        retries=urllib3.Retry(
+            total=MINIO_MAX_RETRIES,
+            backoff_factor=MINIO_RETRY_BACKOFF_SECONDS,
+            status_forcelist=[500, 502, 503, 504]
+        )
+    )
         
-def _store_file_in_minio(minio_endpoint, minio_access_key, minio_secret_key, minio_bucket_name, local_file_path, minio_object_name, content_type=None):
+def _store_file_in_minio(minio_endpoint, minio_access_key, minio_secret_key, minio_bucket_name, file_stream, minio_object_name, content_type=None):
     """
     Stores a file in MinIO.
 
@@ -93,7 +517,7 @@ def _store_file_in_minio(minio_endpoint, minio_access_key, minio_secret_key, min
     - minio_access_key (str): The access key for MinIO.
     - minio_secret_key (str): The secret key for MinIO.
     - minio_bucket_name (str): The name of the MinIO bucket.
-    - local_file_path (str): The local path to the file to be stored in MinIO.
+    - file_stream (file-like): A seekable stream with the content to be stored in MinIO.
     - minio_object_name (str): The name to be used for the object in MinIO.
     - content_type (str, optional): The content type of the object to be stored in MinIO.
 
@@ -101,22 +525,21 @@ def _store_file_in_minio(minio_endpoint, minio_access_key, minio_secret_key, min
     - Exception: If there's an error during the MinIO file storage process.
     """
     try:
-        with open(local_file_path, 'rb') as file_data:
-            file_data.seek(0, 2)
-            file_size_bytes = file_data.tell()
-            file_data.seek(0)
-            if file_size_bytes == 0:
-                error_message = f"File '{local_file_path}' is empty"
-                raise Exception(error_message)
-            # Get MinIO client
-            minio_client = _get_minio_client(minio_endpoint, minio_access_key, minio_secret_key, minio_bucket_name)
-            minio_client.put_object(
-                bucket_name=minio_bucket_name,
-                object_name=minio_object_name,
-                data=file_data,
-                length=file_size_bytes,
-                content_type=content_type
-            )
+        file_stream.seek(0, 2)
+        file_size_bytes = file_stream.tell()
+        file_stream.seek(0)
+        if file_size_bytes == 0:
+            error_message = f"File '{minio_object_name}' is empty"
+            raise Exception(error_message)
+        # Get MinIO client
+        minio_client = _get_minio_client(minio_endpoint, minio_access_key, minio_secret_key, minio_bucket_name)
+        minio_client.put_object(
+            bucket_name=minio_bucket_name,
+            object_name=minio_object_name,
+            data=file_stream,
+            length=file_size_bytes,
+            content_type=content_type or "application/octet-stream"
+        )
     except Exception as e:
-        error_message = f"Error storing file '{local_file_path}' - {minio_object_name} in MinIO: {e}"
+        error_message = f"Error storing file '{minio_object_name}' in MinIO: {e}"
         raise Exception(error_message)
\ No newline at end of file
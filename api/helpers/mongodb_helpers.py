@@ -1,15 +1,176 @@
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+import logging
 import os
+import threading
+import time
 from bson import ObjectId
-from pymongo import MongoClient
+from pymongo import ASCENDING, IndexModel, MongoClient, ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from pymongo.monitoring import ConnectionPoolListener
+from helpers.cache_helpers import USER_METADATA_PROJECTION, get_user_metadata_cache
 
 # Get MongoDB connection details from environment variables
 MONGO_URI = os.environ.get("MONGO_URI")
 MONGO_DB = os.environ.get("MONGO_DB")
 MONGO_COLLECTION = os.environ.get("MONGO_DB_COLLECTION")
+# Pending presigned uploads, removed by MongoDB once expired
+VOICE_UPLOADS_COLLECTION = os.environ.get("VOICE_UPLOADS_COLLECTION", "voice_uploads")
+
+# Get MongoDB connection pool settings from environment variables
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", "60000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get("MONGO_SOCKET_TIMEOUT_MS", "10000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_READ_PREFERENCE = os.environ.get("MONGO_READ_PREFERENCE", "primary")
+
+# Slow query diagnostics, meant for debugging: queries slower than the threshold are explained
+MONGO_EXPLAIN_SLOW_QUERIES = os.environ.get("MONGO_EXPLAIN_SLOW_QUERIES", "false").lower() == "true"
+MONGO_SLOW_QUERY_MS = float(os.environ.get("MONGO_SLOW_QUERY_MS", "100"))
+
+# Indexes of the users collection, the same ones the Airflow operators provision.
+# Email and voice ID identify a user, so they are unique.
+USERS_INDEXES = [
+    IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    IndexModel([("voice_id", ASCENDING)], name="voice_id_unique", unique=True,
+               partialFilterExpression={"voice_id": {"$type": "string"}}),
+    IndexModel([("fullname", ASCENDING)], name="fullname"),
+    IndexModel([("timestamp", ASCENDING)], name="timestamp")
+]
+
+# Index of the pending uploads, expiring every upload at its 'expires_at' date
+VOICE_UPLOADS_INDEXES = [
+    IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0)
+]
+
+logger = logging.getLogger(__name__)
+
+_mongo_client_lock = threading.Lock()
+_mongo_client = None
+_mongo_client_pid = None
+_mongo_pool_listener = None
+_indexes_pid = None
+_email_unique_index = False
+
+class MongoPoolStatsListener(ConnectionPoolListener):
+    """
+    Counts the connection pool events of the MongoDB client of this process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {
+            "connections_created": 0,
+            "connections_closed": 0,
+            "checkouts": 0,
+            "checkout_failures": 0,
+            "checkins": 0,
+            "pools_cleared": 0
+        }
+
+    def stats(self):
+        """
+        Returns the counters of the pool events.
+
+        Returns:
+        - dict: The counters plus the connections open and checked out right now.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats["connections_open"] = stats["connections_created"] - stats["connections_closed"]
+        stats["connections_in_use"] = stats["checkouts"] - stats["checkins"]
+        return stats
+
+    def _count(self, counter):
+        with self._lock:
+            self._stats[counter] += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._count("pools_cleared")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._count("connections_created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._count("connections_closed")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._count("checkout_failures")
+
+    def connection_checked_out(self, event):
+        self._count("checkouts")
+
+    def connection_checked_in(self, event):
+        self._count("checkins")
+
+def get_mongo_client():
+    """
+    Returns the MongoDB client of this process, creating it on first use.
+
+    The client and its connection pool are shared by every request served by the
+    process. It is created lazily and without connecting, and a new one is created
+    when the process ID changes, so gunicorn workers never share sockets or monitor
+    threads inherited from the process they were forked from.
+
+    Returns:
+    - MongoClient: The client of the current process.
+    """
+    global _mongo_client, _mongo_client_pid, _mongo_pool_listener
+    pid = os.getpid()
+    with _mongo_client_lock:
+        if _mongo_client is None or _mongo_client_pid != pid:
+            _mongo_pool_listener = MongoPoolStatsListener()
+            _mongo_client = MongoClient(
+                MONGO_URI,
+                connect=False,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+                waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+                serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                readPreference=MONGO_READ_PREFERENCE,
+                event_listeners=[_mongo_pool_listener]
+            )
+            _mongo_client_pid = pid
+        return _mongo_client
+
+def get_mongo_pool_stats():
+    """
+    Returns the connection pool statistics of the MongoDB client of this process.
+
+    Returns:
+    - dict: The process ID, the pool settings and the pool event counters.
+    """
+    get_mongo_client()
+    return {
+        "pid": _mongo_client_pid,
+        "max_pool_size": MONGO_MAX_POOL_SIZE,
+        "min_pool_size": MONGO_MIN_POOL_SIZE,
+        "read_preference": MONGO_READ_PREFERENCE,
+        **_mongo_pool_listener.stats()
+    }
 
 # Function to save metadata about the user in MongoDB
-def save_user_metadata(fullname, email, voice_id):
+def save_user_metadata(fullname, email, voice_id, sample_ids=None):
     # Generate a timestamp for the video upload
     timestamp = datetime.now(timezone.utc)
     # Create metadata to be stored in MongoDB
@@ -19,7 +180,13 @@ def save_user_metadata(fullname, email, voice_id):
         "voice_id": voice_id,
         "timestamp": timestamp
     }
+    # The voice ID of a user enrolled with several samples is the ID of the first one
+    if sample_ids and len(sample_ids) > 1:
+        metadata["sample_ids"] = sample_ids
     db_collection = _connect_to_mongo()
+    # Without the unique email index, e.g. over already duplicated users, existing users are looked up instead
+    if not has_unique_email_index() and db_collection.find_one({"email": email}, {"_id": 1}) is not None:
+        raise DuplicateKeyError(f"A user with email '{email}' already exists")
     # Insert the metadata into the MongoDB collection and retrieve the user ID
     user_id = db_collection.insert_one(metadata).inserted_id
     return str(user_id)
@@ -41,7 +208,7 @@ def find_user_by_email_or_fullname(email=None, fullname=None):
         query["email"] = email
     if fullname:
         query["fullname"] = fullname
-    user_info = db_collection.find_one(query)  # Find user details by email or fullname
+    user_info = _find_one(db_collection, query)  # Find user details by email or fullname
     return user_info
 
 def find_user_by_voice_id(voice_id):
@@ -54,9 +221,10 @@ def find_user_by_voice_id(voice_id):
     Returns:
     - dict or None: A dictionary containing the user details if found, or None if not found.
     """
-    db_collection = _connect_to_mongo()  # Establish connection to MongoDB
-    user_info = db_collection.find_one({"voice_id": voice_id})  # Find user details by voice ID
-    return user_info
+    # Find user details by voice ID, in the metadata cache first
+    load_user_info = lambda: _find_one(_connect_to_mongo(), {"voice_id": voice_id}, USER_METADATA_PROJECTION)
+    user_cache = get_user_metadata_cache()
+    return user_cache.get_by_voice_id(voice_id, load_user_info) if user_cache else load_user_info()
 
 def update_user_register_planned_date(user_id, logical_date):
     db_collection = _connect_to_mongo()
@@ -76,9 +244,34 @@ def find_user_details(user_id):
     Returns:
     - dict or None: A dictionary containing the user details if found, or None if not found.
     """
-    db_collection = _connect_to_mongo()  # Establish connection to MongoDB
-    user_info = db_collection.find_one({"_id": ObjectId(user_id)})  # Find user details by ID
-    return user_info
+    # Find user details by ID, in the metadata cache first
+    load_user_info = lambda: _find_one(_connect_to_mongo(), {"_id": ObjectId(user_id)}, USER_METADATA_PROJECTION)
+    user_cache = get_user_metadata_cache()
+    return user_cache.get_by_user_id(user_id, load_user_info) if user_cache else load_user_info()
+
+def find_claimed_identity(user_id=None, email=None):
+    """
+    Find the voice ID of the identity claimed by an authentication request.
+
+    Parameters:
+    - user_id (str): The claimed user ID.
+    - email (str): The claimed email, used when no user ID is given.
+
+    Returns:
+    - dict or None: The user ID and voice ID of the claimed user, or None if not found.
+    """
+    if user_id:
+        if not ObjectId.is_valid(user_id):
+            return None
+        user_info = find_user_details(user_id)
+    elif email:
+        db_collection = _connect_to_mongo()  # Establish connection to MongoDB
+        user_info = _find_one(db_collection, {"email": email}, {"_id": 1, "voice_id": 1})
+    else:
+        return None
+    if user_info is None:
+        return None
+    return {"user_id": str(user_info["_id"]), "voice_id": user_info.get("voice_id")}
 
 def delete_user_details(user_id):
     """
@@ -92,10 +285,136 @@ def delete_user_details(user_id):
     """
     db_collection = _connect_to_mongo()  # Establish connection to MongoDB
     db_collection.delete_one({"_id": ObjectId(user_id)})  # Delete user details by ID
+    user_cache = get_user_metadata_cache()
+    if user_cache:
+        user_cache.invalidate(user_id)
 
-# Connect to MongoDB using the provided URI
-def _connect_to_mongo():
-    mongo_client = MongoClient(MONGO_URI)
+def save_pending_upload(upload_id, purpose, expires_in_seconds):
+    """
+    Save a presigned upload waiting for its voice file.
+
+    Parameters:
+    - upload_id (str): The ID of the upload.
+    - purpose (str): What the voice file is uploaded for, 'registration' or 'authentication'.
+    - expires_in_seconds (float): Seconds until the upload can no longer be committed.
+
+    Returns:
+    - datetime: The expiration date of the upload.
+    """
+    created_at = datetime.now(timezone.utc)
+    expires_at = created_at + timedelta(seconds=expires_in_seconds)
+    _connect_to_mongo(VOICE_UPLOADS_COLLECTION).insert_one({
+        "_id": upload_id,
+        "purpose": purpose,
+        "status": "pending",
+        "created_at": created_at,
+        "expires_at": expires_at
+    })
+    return expires_at
+
+def claim_pending_upload(upload_id):
+    """
+    Claim a pending upload to commit it, so concurrent commits of the same upload are rejected.
+
+    Parameters:
+    - upload_id (str): The ID of the upload.
+
+    Returns:
+    - dict or None: The upload claimed, or None if it does not exist, expired or is not pending.
+    """
+    return _connect_to_mongo(VOICE_UPLOADS_COLLECTION).find_one_and_update(
+        # Expired uploads may outlive their date until the TTL monitor runs
+        {"_id": upload_id, "status": "pending", "expires_at": {"$gt": datetime.now(timezone.utc)}},
+        {"$set": {"status": "committing"}},
+        return_document=ReturnDocument.AFTER
+    )
+
+def update_pending_upload_status(upload_id, status):
+    """
+    Update the status of a claimed upload.
+
+    Parameters:
+    - upload_id (str): The ID of the upload.
+    - status (str): 'pending' to allow committing it again, 'committed' or 'rejected'.
+
+    Returns:
+    - None
+    """
+    _connect_to_mongo(VOICE_UPLOADS_COLLECTION).update_one({"_id": upload_id}, {"$set": {"status": status}})
+
+def ensure_mongodb_indexes():
+    """
+    Creates the indexes declared for the users and pending uploads collections.
+
+    Index creation is idempotent and done once per process, on its first use of the
+    collections. Each index is created on its own, so one that cannot be created, e.g. a
+    unique index over duplicated users, neither blocks the others nor fails the request.
+    Whether the unique email index exists is recorded for has_unique_email_index.
+
+    Returns:
+    - bool: Whether the indexes were provisioned by this call.
+    """
+    global _indexes_pid, _email_unique_index
+    pid = os.getpid()
+    if _indexes_pid == pid:
+        return False
+    db = get_mongo_client()[MONGO_DB]
+    for collection_name, indexes in ((MONGO_COLLECTION, USERS_INDEXES), (VOICE_UPLOADS_COLLECTION, VOICE_UPLOADS_INDEXES)):
+        for index in indexes:
+            try:
+                db[collection_name].create_indexes([index])
+            except OperationFailure as e:
+                logger.error(f"Could not create the index '{index.document['name']}' of collection '{collection_name}': {e}")
+    _email_unique_index = "email_unique" in db[MONGO_COLLECTION].index_information()
+    if not _email_unique_index:
+        logger.error("The users collection has no unique email index, registrations look up the email before inserting the user")
+    # Not flagged on connection errors, so the next request tries again
+    _indexes_pid = pid
+    return True
+
+def has_unique_email_index():
+    """
+    Tells whether the users collection has its unique email index, checked once per process.
+
+    Returns:
+    - bool: True if inserting an existing email raises DuplicateKeyError.
+    """
+    ensure_mongodb_indexes()
+    return _email_unique_index
+
+# Get a collection, the users one by default, from the shared MongoDB client
+def _connect_to_mongo(collection_name=MONGO_COLLECTION):
+    ensure_mongodb_indexes()
+    mongo_client = get_mongo_client()
     db = mongo_client[MONGO_DB]
-    db_collection = db[MONGO_COLLECTION]
-    return db_collection
\ No newline at end of file
+    db_collection = db[collection_name]
+    return db_collection
+
+# Find a single document, explaining the query when slow queries are diagnosed
+def _find_one(db_collection, query, projection=None):
+    if not MONGO_EXPLAIN_SLOW_QUERIES:
+        return db_collection.find_one(query, projection)
+    start_time = time.perf_counter()
+    document = db_collection.find_one(query, projection)
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+    if elapsed_ms >= MONGO_SLOW_QUERY_MS:
+        explain = db_collection.find(query, projection).limit(1).explain()
+        logger.warning(f"Slow query on '{db_collection.name}' ({elapsed_ms:.1f} ms) {query}: {_summarize_query_plan(explain)}")
+    return document
+
+def _summarize_query_plan(explain):
+    plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+    plan = plan.get("queryPlan", plan)
+    stages, index_name = [], None
+    while plan:
+        stages.append(plan.get("stage"))
+        index_name = index_name or plan.get("indexName")
+        plan = plan.get("inputStage")
+    execution_stats = explain.get("executionStats", {})
+    return {
+        "stages": stages,
+        "index": index_name,
+        "keys_examined": execution_stats.get("totalKeysExamined"),
+        "docs_examined": execution_stats.get("totalDocsExamined"),
+        "returned": execution_stats.get("nReturned")
+    }
\ No newline at end of file
@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+
+# Voice upload rate limit configuration; a limit of 0 disables it
+VOICE_UPLOAD_RATE_LIMIT = int(os.environ.get("VOICE_UPLOAD_RATE_LIMIT", "10"))
+VOICE_UPLOAD_RATE_LIMIT_WINDOW_SECONDS = int(os.environ.get("VOICE_UPLOAD_RATE_LIMIT_WINDOW_SECONDS", "60"))
+VOICE_UPLOAD_RATE_LIMIT_REDIS_URL = os.environ.get("VOICE_UPLOAD_RATE_LIMIT_REDIS_URL")
+VOICE_UPLOAD_RATE_LIMIT_KEY_PREFIX = "voice-upload-rate"
+
+# Process-wide voice upload rate limiter, guarded by _voice_upload_rate_limiter_lock
+_voice_upload_rate_limiter_lock = threading.Lock()
+_voice_upload_rate_limiter = None
+
+class FixedWindowRateLimiter:
+    """
+    Thread-safe rate limiter allowing each client at most 'limit' requests per fixed time window.
+
+    When a Redis URL is configured the counters are shared by every process of the API,
+    which is load balanced; otherwise, or while Redis fails, each process counts on its
+    own. Counters only live for the window they count.
+
+    Args:
+    - limit (int): Maximum number of requests of a client per window, 0 for no limit.
+    - window_seconds (int): Length of the windows, in seconds.
+    - key_prefix (str): Prefix of the counter keys in Redis.
+    - redis_url (str, optional): URL of the Redis server holding the shared counters.
+    """
+
+    def __init__(self, limit, window_seconds, key_prefix, redis_url=None):
+        self.limit = int(limit)
+        self.window_seconds = max(1, int(window_seconds))
+        self.key_prefix = key_prefix
+        self._redis = None
+        if redis_url:
+            import redis
+            self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._lock = threading.Lock()
+        self._window = None
+        self._counts = {}
+
+    def allow(self, client_key):
+        """
+        Counts a request of a client and tells whether it is within the limit.
+
+        Args:
+        - client_key (str): What identifies the client, e.g. its IP address.
+
+        Returns:
+        - bool: True if the request is allowed.
+        """
+        if self.limit <= 0:
+            return True
+        window = int(time.time() // self.window_seconds)
+        if self._redis is not None:
+            key = f"{self.key_prefix}:{client_key}:{window}"
+            try:
+                pipeline = self._redis.pipeline(transaction=True)
+                pipeline.incr(key)
+                pipeline.expire(key, self.window_seconds)
+                count, _ = pipeline.execute()
+                return count <= self.limit
+            except Exception as e:
+                print(f"Error counting requests in Redis, counting them in this process: {e}")
+        with self._lock:
+            if self._window != window:
+                self._window, self._counts = window, {}
+            count = self._counts.get(client_key, 0) + 1
+            self._counts[client_key] = count
+            return count <= self.limit
+
+def get_voice_upload_rate_limiter():
+    """
+    Returns the rate limiter of the presigned voice uploads of the current process, creating it on first use.
+
+    Returns:
+    - FixedWindowRateLimiter: The process-wide rate limiter.
+    """
+    global _voice_upload_rate_limiter
+    with _voice_upload_rate_limiter_lock:
+        if _voice_upload_rate_limiter is None:
+            _voice_upload_rate_limiter = FixedWindowRateLimiter(
+                VOICE_UPLOAD_RATE_LIMIT,
+                VOICE_UPLOAD_RATE_LIMIT_WINDOW_SECONDS,
+                VOICE_UPLOAD_RATE_LIMIT_KEY_PREFIX,
+                redis_url=VOICE_UPLOAD_RATE_LIMIT_REDIS_URL
+            )
+        return _voice_upload_rate_limiter
@@ -0,0 +1,91 @@
+"""
+Benchmark: end-to-end p50/p99 latency of voice authentication in async mode (Airflow DAG, result
+delivered to the webhook) and sync mode (result returned in the HTTP response).
+
+The async latency is measured from the request until the webhook receives the result, so the
+webhook listener started by this script must be reachable from the Airflow workers.
+
+Usage:
+    python benchmarks/benchmark_authentication_latency.py --api-url http://localhost:9008 \\
+        --voice-file sample.wav --requests 50 --webhook-host 192.168.1.10 --webhook-port 8765
+"""
+import argparse
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import numpy as np
+import requests
+
+AUTHENTICATION_PATH = "/api/voice-passport/schedule_user_authentication"
+
+def _start_webhook_listener(port, received):
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            received.put((time.perf_counter(), json.loads(body or b'null')))
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("0.0.0.0", port), WebhookHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def _authenticate(api_url, voice_file, mode, result_webhook):
+    with open(voice_file, 'rb') as voice_data:
+        data = {"mode": mode}
+        if result_webhook:
+            data["result_webhook"] = result_webhook
+        response = requests.post(f"{api_url}{AUTHENTICATION_PATH}", data=data,
+                                 files={"voice_file": (voice_file, voice_data)}, timeout=120)
+    response.raise_for_status()
+    return response
+
+def _measure_sync(api_url, voice_file, count):
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        _authenticate(api_url, voice_file, "sync", None)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def _measure_async(api_url, voice_file, count, result_webhook, received, timeout):
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        _authenticate(api_url, voice_file, "async", result_webhook)
+        finished_at, _ = received.get(timeout=timeout)
+        latencies.append(finished_at - start)
+    return latencies
+
+def _report(label, latencies):
+    latencies_ms = np.array(latencies) * 1000
+    print(f"{label:<8} n={len(latencies_ms):4d}   p50 {np.percentile(latencies_ms, 50):9.1f} ms   "
+          f"p99 {np.percentile(latencies_ms, 99):9.1f} ms   max {latencies_ms.max():9.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--api-url", default="http://localhost:9008", help="Base URL of the VoicePassport API")
+    parser.add_argument("--voice-file", required=True, help="WAV or MP3 file of an enrolled voice")
+    parser.add_argument("--requests", type=int, default=50, help="Authentications per mode")
+    parser.add_argument("--webhook-host", required=True, help="Host name of this machine, as seen by the Airflow workers")
+    parser.add_argument("--webhook-port", type=int, default=8765, help="Port of the webhook listener")
+    parser.add_argument("--async-timeout", type=float, default=300.0, help="Seconds to wait for each webhook call")
+    args = parser.parse_args()
+
+    received = queue.Queue()
+    server = _start_webhook_listener(args.webhook_port, received)
+    result_webhook = f"http://{args.webhook_host}:{args.webhook_port}/completed"
+    try:
+        _report("sync", _measure_sync(args.api_url, args.voice_file, args.requests))
+        _report("async", _measure_async(args.api_url, args.voice_file, args.requests, result_webhook, received, args.async_timeout))
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
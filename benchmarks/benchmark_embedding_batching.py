@@ -0,0 +1,69 @@
+"""
+Benchmark: utterances per CPU-second with one-by-one embedding versus the micro-batching engine.
+
+Usage:
+    python benchmarks/benchmark_embedding_batching.py --utterances 64 --concurrency 32 --batch-size 16 --max-wait-ms 10
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "airflow", "dags"))
+
+from helpers.encoder_helpers import get_voice_encoder
+from helpers.batching_helpers import EmbeddingBatcher
+
+SAMPLING_RATE = 16000
+
+def _synthetic_utterances(count, seconds):
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * SAMPLING_RATE)) / SAMPLING_RATE
+    wavs = []
+    for _ in range(count):
+        pitch = rng.uniform(90, 260)
+        wav = 0.3 * np.sin(2 * np.pi * pitch * t) + 0.02 * rng.standard_normal(t.shape[0])
+        wavs.append(wav.astype(np.float32))
+    return wavs
+
+def _measure(label, run, count):
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    run()
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    print(f"{label:<22} wall {wall:7.2f} s   cpu {cpu:7.2f} s   "
+          f"{count / wall:7.1f} utt/s   {count / cpu:7.1f} utt/cpu-s")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--utterances", type=int, default=64, help="Number of utterances to embed")
+    parser.add_argument("--seconds", type=float, default=4.0, help="Utterance length in seconds")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent callers")
+    parser.add_argument("--batch-size", type=int, default=16, help="Maximum batch size")
+    parser.add_argument("--max-wait-ms", type=float, default=10.0, help="Batching latency budget")
+    args = parser.parse_args()
+
+    wavs = _synthetic_utterances(args.utterances, args.seconds)
+    encoder = get_voice_encoder()
+    # Warm up torch before measuring
+    encoder.embed_utterance(wavs[0])
+
+    def sequential():
+        for wav in wavs:
+            encoder.embed_utterance(wav)
+
+    batcher = EmbeddingBatcher(max_batch_size=args.batch_size, max_wait_ms=args.max_wait_ms)
+
+    def batched():
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(batcher.embed, wavs))
+
+    _measure("one-by-one", sequential, len(wavs))
+    _measure("micro-batched", batched, len(wavs))
+    print(f"Batcher stats: {batcher.stats()}")
+    batcher.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmark: per-task embedding cost with a fresh VoiceEncoder versus the process-resident one.
+
+Usage:
+    python benchmarks/benchmark_encoder_registry.py --tasks 20 --seconds 5
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "airflow", "dags"))
+
+from resemblyzer import VoiceEncoder
+from helpers.encoder_helpers import get_voice_encoder, get_encoder_model_version
+
+SAMPLING_RATE = 16000
+
+def _synthetic_utterance(seconds, seed=0):
+    # Harmonic signal with noise, enough for the encoder to run its full pipeline
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLING_RATE)) / SAMPLING_RATE
+    wav = 0.3 * np.sin(2 * np.pi * 180 * t) + 0.1 * np.sin(2 * np.pi * 360 * t)
+    wav += 0.02 * rng.standard_normal(t.shape[0])
+    return wav.astype(np.float32)
+
+def _run_fresh_encoder(wav, tasks):
+    timings = []
+    for _ in range(tasks):
+        start = time.perf_counter()
+        encoder = VoiceEncoder(verbose=False)
+        encoder.embed_utterance(wav)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def _run_resident_encoder(wav, tasks):
+    timings = []
+    for _ in range(tasks):
+        start = time.perf_counter()
+        encoder = get_voice_encoder()
+        encoder.embed_utterance(wav)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def _report(label, timings):
+    timings_ms = np.array(timings) * 1000
+    print(f"{label:<28} mean {timings_ms.mean():8.1f} ms   p50 {np.percentile(timings_ms, 50):8.1f} ms   "
+          f"p99 {np.percentile(timings_ms, 99):8.1f} ms   first {timings_ms[0]:8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=20, help="Number of simulated tasks per mode")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Utterance length in seconds")
+    args = parser.parse_args()
+
+    wav = _synthetic_utterance(args.seconds)
+    _report("fresh VoiceEncoder per task", _run_fresh_encoder(wav, args.tasks))
+    _report("process-resident encoder", _run_resident_encoder(wav, args.tasks))
+    print(f"Encoder model version: {get_encoder_model_version()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Benchmark: recall versus search latency of the voice collection settings (HNSW m/ef_construct,
+search-time ef, on-disk vectors, int8 quantization with rescoring) over a synthetic dataset.
+
+The dataset is made of clustered, L2-normalised 256-dimensional vectors, like resemblyzer
+embeddings of many speakers. Every query is a perturbed copy of an indexed vector, like a second
+utterance of an enrolled voice. Ground truth is computed exactly with NumPy, one block of the
+dataset at a time, so the dataset is never held in memory as a whole.
+
+Every configuration is loaded into its own collection of the given QDrant server, which needs
+about 1.5 GB of memory per million vectors without quantization.
+
+Usage:
+    python benchmarks/benchmark_qdrant_index_settings.py --qdrant-url http://localhost:6333 \\
+        --vectors 1000000 --queries 500 --ef 32,64,128,256
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "airflow", "dags"))
+
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from helpers.qdrant_helpers import QDRANT_VECTOR_SIZE, build_search_params, create_voice_collection, get_collection_settings
+
+BLOCK_SIZE = 50000
+SEED = 7
+
+# Collection settings compared by the benchmark, on top of the configured ones
+CONFIGURATIONS = {
+    "m16": dict(hnsw_m=16, hnsw_ef_construct=100, on_disk_vectors=False, quantization="none"),
+    "m32": dict(hnsw_m=32, hnsw_ef_construct=200, on_disk_vectors=False, quantization="none"),
+    "m16-int8": dict(hnsw_m=16, hnsw_ef_construct=100, on_disk_vectors=False, quantization="int8"),
+    "m16-int8-on-disk": dict(hnsw_m=16, hnsw_ef_construct=100, on_disk_vectors=True, quantization="int8")
+}
+
+def _cluster_centers(clusters):
+    rng = np.random.default_rng([SEED, 0])
+    centers = rng.standard_normal((clusters, QDRANT_VECTOR_SIZE)).astype(np.float32)
+    return centers / np.linalg.norm(centers, axis=1, keepdims=True)
+
+def _normalise(vectors):
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+def _dataset_block(centers, start, stop, spread):
+    # Each block is generated from its own seed, so blocks can be regenerated on demand
+    rng = np.random.default_rng([SEED, 1, start])
+    labels = rng.integers(0, len(centers), stop - start)
+    noise = rng.standard_normal((stop - start, QDRANT_VECTOR_SIZE)).astype(np.float32)
+    return _normalise(centers[labels] + spread * noise)
+
+def _dataset_blocks(centers, total, spread):
+    for start in range(0, total, BLOCK_SIZE):
+        stop = min(start + BLOCK_SIZE, total)
+        yield start, _dataset_block(centers, start, stop, spread)
+
+def _make_queries(centers, total, count, spread, query_noise):
+    rng = np.random.default_rng([SEED, 2])
+    ids = np.sort(rng.choice(total, count, replace=False))
+    queries = []
+    for vector_id in ids:
+        start = vector_id // BLOCK_SIZE * BLOCK_SIZE
+        block = _dataset_block(centers, start, min(start + BLOCK_SIZE, total), spread)
+        queries.append(block[vector_id - start])
+    queries = np.stack(queries)
+    return _normalise(queries + query_noise * rng.standard_normal(queries.shape).astype(np.float32))
+
+def _exact_top_k(centers, total, spread, queries, top_k):
+    best_scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+    best_ids = np.zeros((len(queries), top_k), dtype=np.int64)
+    for start, block in _dataset_blocks(centers, total, spread):
+        scores = queries @ block.T
+        candidates = np.concatenate([best_scores, scores], axis=1)
+        candidate_ids = np.concatenate([best_ids, np.broadcast_to(np.arange(start, start + len(block)), scores.shape)], axis=1)
+        keep = np.argpartition(-candidates, top_k - 1, axis=1)[:, :top_k]
+        best_scores = np.take_along_axis(candidates, keep, axis=1)
+        best_ids = np.take_along_axis(candidate_ids, keep, axis=1)
+    order = np.argsort(-best_scores, axis=1)
+    return np.take_along_axis(best_ids, order, axis=1)
+
+def _load_collection(client, name, settings, centers, total, spread, batch_size, parallel):
+    if name in [collection.name for collection in client.get_collections().collections]:
+        client.delete_collection(name)
+    create_voice_collection(client, name, settings)
+    start_time = time.perf_counter()
+    for start, block in _dataset_blocks(centers, total, spread):
+        client.upload_collection(name, vectors=block, ids=list(range(start, start + len(block))),
+                                 batch_size=batch_size, parallel=parallel, wait=True)
+    while client.get_collection(name).status != models.CollectionStatus.GREEN:
+        time.sleep(2)
+    return time.perf_counter() - start_time
+
+def _measure_searches(client, name, settings, queries, truth, top_k, hnsw_ef):
+    search_params = build_search_params(settings, hnsw_ef=hnsw_ef)
+    latencies = []
+    recall_at_1 = 0
+    recall_at_k = 0
+    for query, expected in zip(queries, truth):
+        start_time = time.perf_counter()
+        hits = client.search(name, query_vector=query, limit=top_k, search_params=search_params,
+                             with_payload=False, with_vectors=False)
+        latencies.append(time.perf_counter() - start_time)
+        found = [hit.id for hit in hits]
+        recall_at_1 += int(bool(found) and found[0] == expected[0])
+        recall_at_k += len(set(found) & set(expected.tolist())) / top_k
+    latencies_ms = np.array(latencies) * 1000
+    return (recall_at_1 / len(queries), recall_at_k / len(queries),
+            np.percentile(latencies_ms, 50), np.percentile(latencies_ms, 99))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--qdrant-url", default="http://localhost:6333", help="URL of the QDrant server")
+    parser.add_argument("--vectors", type=int, default=1000000, help="Number of vectors in the dataset")
+    parser.add_argument("--clusters", type=int, default=20000, help="Number of synthetic speakers")
+    parser.add_argument("--spread", type=float, default=0.35, help="Noise added around each speaker")
+    parser.add_argument("--query-noise", type=float, default=0.15, help="Noise added to each query")
+    parser.add_argument("--queries", type=int, default=500, help="Number of queries")
+    parser.add_argument("--top-k", type=int, default=10, help="Neighbours compared for recall@k")
+    parser.add_argument("--ef", default="32,64,128,256", help="Comma separated search-time ef values")
+    parser.add_argument("--configs", default=",".join(CONFIGURATIONS), help="Comma separated configurations to compare")
+    parser.add_argument("--batch-size", type=int, default=1024, help="Upload batch size")
+    parser.add_argument("--parallel", type=int, default=4, help="Upload processes")
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark collections")
+    args = parser.parse_args()
+
+    client = QdrantClient(url=args.qdrant_url, timeout=120)
+    centers = _cluster_centers(args.clusters)
+    queries = _make_queries(centers, args.vectors, args.queries, args.spread, args.query_noise)
+    print(f"Computing exact top-{args.top_k} of {args.queries} queries over {args.vectors} vectors...")
+    truth = _exact_top_k(centers, args.vectors, args.spread, queries, args.top_k)
+
+    for label in args.configs.split(","):
+        settings = get_collection_settings(**CONFIGURATIONS[label])
+        name = f"benchmark_voices_{label.replace('-', '_')}"
+        load_seconds = _load_collection(client, name, settings, centers, args.vectors, args.spread, args.batch_size, args.parallel)
+        print(f"\n{label}: loaded and indexed in {load_seconds:.0f} s")
+        for hnsw_ef in (int(value) for value in args.ef.split(",")):
+            recall_at_1, recall_at_k, p50, p99 = _measure_searches(client, name, settings, queries, truth, args.top_k, hnsw_ef)
+            print(f"  ef {hnsw_ef:4d}   recall@1 {recall_at_1:.4f}   recall@{args.top_k} {recall_at_k:.4f}   "
+                  f"p50 {p50:6.2f} ms   p99 {p99:6.2f} ms")
+        if not args.keep:
+            client.delete_collection(name)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark: enrollment ingestion throughput into QDrant, comparing one waited upsert per point
+(the registration DAG behaviour) with QdrantPointBatcher fed by concurrent threads.
+
+Usage:
+    python benchmarks/benchmark_qdrant_ingestion.py --qdrant-url http://localhost:6333 \\
+        --points 20000 --threads 16 --batch-size 256
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from qdrant_client import models
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "airflow", "dags"))
+
+from helpers.ingestion_helpers import QdrantPointBatcher
+from helpers.qdrant_helpers import QDRANT_VECTOR_SIZE, build_identity_payload, create_voice_collection, get_qdrant_client
+
+COLLECTION = "benchmark_voice_ingestion"
+
+def _reset_collection(client):
+    if COLLECTION in [collection.name for collection in client.get_collections().collections]:
+        client.delete_collection(COLLECTION)
+    create_voice_collection(client, COLLECTION)
+
+def _report(label, points, seconds):
+    print(f"{label:<40} {points:7d} points in {seconds:7.2f} s   {points / seconds:9.1f} points/s")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--qdrant-url", default="http://localhost:6333", help="URL of the QDrant server")
+    parser.add_argument("--points", type=int, default=20000, help="Points enrolled per strategy")
+    parser.add_argument("--threads", type=int, default=16, help="Concurrent enrollments")
+    parser.add_argument("--batch-size", type=int, default=256, help="Maximum points per batched upsert")
+    parser.add_argument("--max-wait-ms", type=float, default=50.0, help="Batching latency budget")
+    args = parser.parse_args()
+
+    client = get_qdrant_client(args.qdrant_url)
+    vectors = np.random.default_rng(0).standard_normal((args.points, QDRANT_VECTOR_SIZE)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    payload = build_identity_payload("benchmark", model_version="benchmark")
+
+    def upsert_single(index):
+        # Plain dict points are only accepted by the REST transport
+        client.upsert(COLLECTION, [models.PointStruct(id=str(uuid.uuid4()), vector=vectors[index].tolist(), payload=payload)], wait=True)
+
+    try:
+        _reset_collection(client)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            list(executor.map(upsert_single, range(args.points)))
+        _report(f"single upserts, {args.threads} threads", args.points, time.perf_counter() - start)
+
+        _reset_collection(client)
+        batcher = QdrantPointBatcher(client, COLLECTION, max_batch_size=args.batch_size, max_wait_ms=args.max_wait_ms)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            list(executor.map(lambda index: batcher.upsert(str(uuid.uuid4()), vectors[index], payload), range(args.points)))
+        _report(f"batched upserts, {args.threads} threads", args.points, time.perf_counter() - start)
+        batcher.close()
+        print(f"batcher stats: {batcher.stats()}")
+    finally:
+        client.delete_collection(COLLECTION)
+
+if __name__ == "__main__":
+    main()
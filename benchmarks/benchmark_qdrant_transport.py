@@ -0,0 +1,85 @@
+"""
+Benchmark: per-call latency of QDrant searches and single-point upserts over REST and gRPC,
+with a client created per call (the previous per-task behaviour) and with the shared client
+returned by helpers.qdrant_helpers.get_qdrant_client.
+
+Run it against a local QDrant container exposing both ports, for example:
+    docker run -p 6333:6333 -p 6334:6334 qdrant/qdrant:v1.7.3
+
+Usage:
+    python benchmarks/benchmark_qdrant_transport.py --qdrant-url http://localhost:6333 \\
+        --points 20000 --iterations 1000
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "airflow", "dags"))
+
+from qdrant_client import QdrantClient, models
+
+import helpers.qdrant_helpers as qdrant_helpers
+
+COLLECTION = "benchmark_voice_transport"
+
+def _random_vectors(rng, count):
+    vectors = rng.standard_normal((count, qdrant_helpers.QDRANT_VECTOR_SIZE)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def _measure(label, client_factory, operation, iterations):
+    latencies = []
+    for index in range(iterations):
+        start = time.perf_counter()
+        operation(client_factory(), index)
+        latencies.append(time.perf_counter() - start)
+    latencies_ms = np.array(latencies) * 1000
+    print(f"{label:<32} p50 {np.percentile(latencies_ms, 50):7.2f} ms   p99 {np.percentile(latencies_ms, 99):7.2f} ms   "
+          f"mean {latencies_ms.mean():7.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--qdrant-url", default="http://localhost:6333", help="REST URL of the QDrant server")
+    parser.add_argument("--points", type=int, default=20000, help="Points loaded before searching")
+    parser.add_argument("--iterations", type=int, default=1000, help="Calls measured per combination")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    setup_client = QdrantClient(url=args.qdrant_url)
+    if COLLECTION in [collection.name for collection in setup_client.get_collections().collections]:
+        setup_client.delete_collection(COLLECTION)
+    qdrant_helpers.create_voice_collection(setup_client, COLLECTION)
+    setup_client.upload_collection(COLLECTION, vectors=_random_vectors(rng, args.points),
+                                   ids=[str(uuid.uuid4()) for _ in range(args.points)], batch_size=1024, wait=True)
+
+    queries = _random_vectors(rng, args.iterations)
+    upserts = _random_vectors(rng, args.iterations)
+    search_params = qdrant_helpers.build_search_params()
+
+    def search(client, index):
+        client.search(COLLECTION, query_vector=queries[index], limit=1, search_params=search_params,
+                      with_payload=["user_id"], with_vectors=False)
+
+    def upsert(client, index):
+        # Plain dict points are only accepted by the REST transport
+        client.upsert(COLLECTION, [models.PointStruct(id=str(uuid.uuid4()), vector=upserts[index].tolist(),
+                                                      payload=qdrant_helpers.build_identity_payload("benchmark"))])
+
+    try:
+        for prefer_grpc in (False, True):
+            transport = "gRPC" if prefer_grpc else "REST"
+            qdrant_helpers.QDRANT_PREFER_GRPC = prefer_grpc
+            qdrant_helpers._clients.clear()
+            fresh_client = lambda: QdrantClient(url=args.qdrant_url, prefer_grpc=prefer_grpc, grpc_port=qdrant_helpers.QDRANT_GRPC_PORT)
+            shared_client = lambda: qdrant_helpers.get_qdrant_client(args.qdrant_url)
+            for operation_name, operation in (("search", search), ("upsert", upsert)):
+                _measure(f"{transport} {operation_name}, client per call", fresh_client, operation, args.iterations)
+                _measure(f"{transport} {operation_name}, shared client", shared_client, operation, args.iterations)
+    finally:
+        setup_client.delete_collection(COLLECTION)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark: cost per utterance of preprocessing and embedding a long, mostly silent recording,
+with and without the vectorised voice activity trimming stage.
+
+Usage:
+    python benchmarks/benchmark_silence_trimming.py --recording-seconds 180 --speech-seconds 8 --runs 5
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "airflow", "dags"))
+
+from resemblyzer import preprocess_wav
+from helpers.encoder_helpers import get_voice_encoder
+from helpers.preprocessing_helpers import trim_voice_activity
+
+SAMPLING_RATE = 16000
+
+def _mostly_silent_recording(recording_seconds, speech_seconds):
+    rng = np.random.default_rng(0)
+    wav = 0.001 * rng.standard_normal(int(recording_seconds * SAMPLING_RATE))
+    t = np.arange(int(speech_seconds * SAMPLING_RATE)) / SAMPLING_RATE
+    # Amplitude-modulated harmonics, loosely shaped like syllables
+    speech = (0.3 * np.sin(2 * np.pi * 150 * t) + 0.1 * np.sin(2 * np.pi * 450 * t)) * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * t))
+    start = len(wav) // 3
+    wav[start:start + len(speech)] += speech
+    return wav.astype(np.float32)
+
+def _time_pipeline(wav, trim, runs):
+    encoder = get_voice_encoder()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        trimmed = trim_voice_activity(wav, SAMPLING_RATE)[0] if trim else wav
+        encoder.embed_utterance(preprocess_wav(trimmed, source_sr=SAMPLING_RATE))
+        timings.append(time.perf_counter() - start)
+    return np.array(timings) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recording-seconds", type=float, default=180.0, help="Length of the uploaded recording")
+    parser.add_argument("--speech-seconds", type=float, default=8.0, help="Length of the speech inside the recording")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per mode")
+    args = parser.parse_args()
+
+    wav = _mostly_silent_recording(args.recording_seconds, args.speech_seconds)
+    _, report = trim_voice_activity(wav, SAMPLING_RATE)
+    print(f"Trimming report: {report}")
+
+    trim_only = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        trim_voice_activity(wav, SAMPLING_RATE)
+        trim_only.append(time.perf_counter() - start)
+    print(f"{'trimming stage only':<24} mean {np.mean(trim_only) * 1000:8.1f} ms")
+
+    untrimmed = _time_pipeline(wav, trim=False, runs=args.runs)
+    trimmed = _time_pipeline(wav, trim=True, runs=args.runs)
+    print(f"{'without trimming':<24} mean {untrimmed.mean():8.1f} ms")
+    print(f"{'with trimming':<24} mean {trimmed.mean():8.1f} ms")
+    print(f"{'saved per utterance':<24} mean {untrimmed.mean() - trimmed.mean():8.1f} ms")
+
+if __name__ == "__main__":
+    main()
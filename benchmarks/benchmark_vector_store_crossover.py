@@ -0,0 +1,90 @@
+"""
+Benchmark: top-1 search latency of the local memory-mapped vector store vs QDrant across collection
+sizes, to find the size from which the HNSW index of QDrant beats the exact matrix product.
+
+Both stores are loaded through the VectorStore interface with the same synthetic, clustered and
+L2-normalised vectors, growing incrementally from one size to the next.
+
+Usage:
+    python benchmarks/benchmark_vector_store_crossover.py --qdrant-url http://localhost:6333 \\
+        --sizes 1000,10000,100000,1000000 --queries 500
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "airflow", "dags"))
+
+from helpers.qdrant_helpers import QDRANT_VECTOR_SIZE, build_identity_payload, get_qdrant_client
+from helpers.vector_store_helpers import LocalVectorStore, QdrantVectorStore
+
+COLLECTION = "benchmark_voice_vector_store"
+LOAD_BATCH_SIZE = 2048
+
+def _synthetic_vectors(rng, count, centroids):
+    # Voices of the same speaker cluster around a centroid
+    vectors = centroids[rng.integers(0, len(centroids), count)] + 0.35 * rng.standard_normal((count, QDRANT_VECTOR_SIZE))
+    vectors = vectors.astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+def _load(store, vectors, payload):
+    for start in range(0, len(vectors), LOAD_BATCH_SIZE):
+        store.upsert_many([(str(uuid.uuid4()), vector, payload) for vector in vectors[start:start + LOAD_BATCH_SIZE]])
+
+def _search_latencies(store, queries):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        store.search(query, limit=1)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--qdrant-url", default="http://localhost:6333", help="URL of the QDrant server")
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000", help="Comma-separated collection sizes")
+    parser.add_argument("--queries", type=int, default=500, help="Searches timed per size and store")
+    parser.add_argument("--local-dir", default=None, help="Directory of the local store (a temporary one by default)")
+    args = parser.parse_args()
+
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+    rng = np.random.default_rng(0)
+    centroids = rng.standard_normal((max(sizes) // 10 or 1, QDRANT_VECTOR_SIZE))
+    queries = _synthetic_vectors(rng, args.queries, centroids)
+    payload = build_identity_payload("benchmark", model_version="benchmark")
+
+    local_dir = args.local_dir or tempfile.mkdtemp(prefix="vector_store_")
+    local_store = LocalVectorStore(local_dir)
+    local_store.ensure_collection()
+    client = get_qdrant_client(args.qdrant_url)
+    if COLLECTION in [collection.name for collection in client.get_collections().collections]:
+        client.delete_collection(COLLECTION)
+    qdrant_store = QdrantVectorStore(client, COLLECTION)
+    qdrant_store.ensure_collection()
+
+    print(f"{'size':>9} {'local p50':>10} {'local p99':>10} {'qdrant p50':>11} {'qdrant p99':>11}  faster")
+    loaded = 0
+    try:
+        for size in sizes:
+            vectors = _synthetic_vectors(rng, size - loaded, centroids)
+            _load(local_store, vectors, payload)
+            _load(qdrant_store, vectors, payload)
+            loaded = size
+            local_p50, local_p99 = _search_latencies(local_store, queries)
+            qdrant_p50, qdrant_p99 = _search_latencies(qdrant_store, queries)
+            faster = "local" if local_p50 < qdrant_p50 else "qdrant"
+            print(f"{size:9d} {local_p50:8.2f}ms {local_p99:8.2f}ms {qdrant_p50:9.2f}ms {qdrant_p99:9.2f}ms  {faster}")
+    finally:
+        client.delete_collection(COLLECTION)
+        if args.local_dir is None:
+            shutil.rmtree(local_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark: peak memory and latency of voice uploads, comparing the default Flask request, which
+spools every file before storing it in MinIO, with VoiceUploadRequest, which streams the files into
+MinIO while the form is parsed and hashes them on the fly.
+
+Requests are sent through the Flask test client to a minimal route storing the 'voice_file' parts
+the way the API does. By default MinIO is replaced by a sink that reads and discards the objects,
+so only the cost of the API process is measured; pass --minio to store them in the server configured
+by the MINIO_* environment variables.
+
+Usage:
+    python benchmarks/benchmark_voice_upload_streaming.py --sizes-mb 1 5 20 --iterations 5
+"""
+import argparse
+import io
+import logging
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+from flask import Flask, Request, jsonify, request
+
+import helpers.minio_helpers as minio_helpers
+from helpers.api_helpers import VoiceUploadRequest, process_voice_files
+
+class NullMinioClient:
+    """
+    Stands in for the MinIO client, reading every object like 'put_object' does and discarding it.
+    """
+
+    def put_object(self, bucket_name, object_name, data, length, part_size=0, content_type=None):
+        chunk_size = part_size or 5 * 1024 * 1024
+        remaining = length
+        while remaining != 0:
+            chunk = data.read(chunk_size if remaining < 0 else min(chunk_size, remaining))
+            if not chunk:
+                break
+            if remaining > 0:
+                remaining -= len(chunk)
+
+    def remove_object(self, bucket_name, object_name):
+        pass
+
+def _create_app(request_class):
+    app = Flask(__name__)
+    app.request_class = request_class
+    logger = logging.getLogger("benchmark")
+
+    @app.route("/upload", methods=["POST"])
+    def upload():
+        voice_file_ids, content_hashes = process_voice_files(request, logger)
+        return jsonify({"voice_file_ids": voice_file_ids, "content_hashes": content_hashes})
+
+    return app
+
+def _measure(label, app, payload, iterations):
+    client = app.test_client()
+    latencies, peaks = [], []
+    for _ in range(iterations):
+        tracemalloc.start()
+        start = time.perf_counter()
+        response = client.post("/upload", data={"voice_file": (io.BytesIO(payload), "voice.wav")},
+                               content_type="multipart/form-data")
+        latencies.append((time.perf_counter() - start) * 1000)
+        peaks.append(tracemalloc.get_traced_memory()[1] / (1024 * 1024))
+        tracemalloc.stop()
+        if response.status_code != 200:
+            raise SystemExit(f"{label}: upload failed with {response.status_code} {response.get_data(as_text=True)}")
+    print(f"{label:<18} p50 {statistics.median(latencies):8.1f} ms   max {max(latencies):8.1f} ms   "
+          f"peak traced memory {max(peaks):7.1f} MiB")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[1, 5, 20], help="Upload sizes in MiB")
+    parser.add_argument("--iterations", type=int, default=5, help="Uploads per size and request class")
+    parser.add_argument("--minio", action="store_true", help="Store the uploads in the configured MinIO server")
+    args = parser.parse_args()
+
+    if not args.minio:
+        null_client = NullMinioClient()
+        minio_helpers._get_minio_client = lambda *args, **kwargs: null_client
+    # Leave room for the largest upload plus the multipart framing
+    minio_helpers.VOICE_UPLOAD_MAX_BYTES = int(max(args.sizes_mb) * 1024 * 1024) + 1
+    apps = {"spooled request": _create_app(Request), "streamed request": _create_app(VoiceUploadRequest)}
+
+    for size_mb in args.sizes_mb:
+        payload = os.urandom(int(size_mb * 1024 * 1024))
+        print(f"--- {size_mb:g} MiB upload ---")
+        for label, app in apps.items():
+            _measure(label, app, payload, args.iterations)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Benchmark: XCom payload size and encode/decode cost of voice embeddings, comparing the default
+pickled NumPy array with the compact float32 and float16 blobs of EmbeddingXComBackend.
+
+Only the inline encodings are measured; offloaded payloads add one MinIO round-trip each way.
+
+Usage:
+    python benchmarks/benchmark_xcom_embeddings.py --iterations 20000 --samples 1
+"""
+import argparse
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "airflow", "dags"))
+
+import helpers.xcom_helpers as xcom_helpers
+
+def _measure(label, encode, decode, value, iterations):
+    payload = encode(value)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        encode(value)
+    encode_us = (time.perf_counter() - start) / iterations * 1e6
+    start = time.perf_counter()
+    for _ in range(iterations):
+        decode(payload)
+    decode_us = (time.perf_counter() - start) / iterations * 1e6
+    print(f"{label:<22} row {len(payload):7d} bytes   encode {encode_us:7.1f} us   decode {decode_us:7.1f} us")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000, help="Encode/decode iterations per format")
+    parser.add_argument("--samples", type=int, default=1, help="Embeddings per XCom value")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((args.samples, 256)).astype(np.float32).squeeze()
+    value = {"voice_file_id": "3f2b9c4e-0000-0000-0000-000000000000", "embeddings": embeddings}
+
+    _measure("pickled ndarray", pickle.dumps, pickle.loads, value, args.iterations)
+    for dtype in ("float32", "float16"):
+        xcom_helpers.XCOM_EMBEDDING_DTYPE = dtype
+        _measure(f"{dtype} blob",
+                 lambda v: pickle.dumps(xcom_helpers.encode_embeddings(v)),
+                 lambda p: xcom_helpers.decode_embeddings(pickle.loads(p)),
+                 value, args.iterations)
+
+if __name__ == "__main__":
+    main()